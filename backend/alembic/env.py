@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from logging.config import fileConfig
 import sys
 import os
@@ -6,6 +7,10 @@ from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 
 from alembic import context
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from alembic.util import CommandError
+from alembic.script.revision import RevisionError
 
 # Add the parent directory to the path so we can import app modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -13,6 +18,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Import database configuration and models
 from app.database import DATABASE_URL
 from app.models import Base, User, Note  # Import all models to ensure they're registered
+from app.online_migrations import LOCK_TIMEOUT, is_dry_run
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -32,6 +38,57 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+# Bookkeeping of app.online_migrations.backfill and app.db_sync, not part of the models
+BOOKKEEPING_TABLES = {"migration_progress", "db_sync_state"}
+
+
+def include_name(name, type_, parent_names):
+    return not (type_ == "table" and name in BOOKKEEPING_TABLES)
+
+
+@contextmanager
+def _autocommit_disabled():
+    """Run autocommit blocks inside the dry run's transaction instead of committing."""
+    yield
+
+
+# Revisions written before the `dry_run_safe` marker existed whose work outside
+# app.online_migrations is quick DDL; listed here rather than edited afterwards
+DRY_RUN_SAFE_REVISIONS = frozenset({
+    "eb05631fb603",
+    "5b2d9e7c4a18",
+    "9e4b7d2c6f31",
+    "c5e8f2a9b713",
+})
+
+
+def _check_dry_run_safe(connection) -> None:
+    """
+    Refuse a dry run that would reach a revision not marked `dry_run_safe`
+    (or listed in DRY_RUN_SAFE_REVISIONS).
+
+    Rolling back only makes a dry run harmless for revisions whose heavy work
+    goes through app.online_migrations; others would copy data and hold their
+    locks for the whole run.
+    """
+    script = ScriptDirectory.from_config(config)
+    current = MigrationContext.configure(connection).get_current_heads()
+    connection.rollback()
+    try:
+        pending = list(reversed(list(script.iterate_revisions(context.get_revision_argument(), current))))
+    except RevisionError:
+        raise CommandError("Dry runs only support upgrades")
+    for index, revision in enumerate(pending):
+        safe = revision.revision in DRY_RUN_SAFE_REVISIONS or getattr(revision.module, "dry_run_safe", False)
+        if not safe:
+            hint = f"; dry-run `upgrade {pending[index - 1].revision}` to stop before it" if index else ""
+            raise CommandError(
+                f"Revision {revision.revision} ({revision.doc}) changes data outside "
+                f"app.online_migrations and cannot be dry-run{hint}"
+            )
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -76,8 +133,37 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # Fail fast instead of queueing all other queries on a table behind a
+        # migration waiting for its lock; see app/online_migrations.py
+        connection.exec_driver_sql(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        connection.commit()
+
+        if is_dry_run():
+            # `alembic -x dry_run=true upgrade head`: the online_migrations
+            # helpers only log estimates, and everything else is rolled back
+            _check_dry_run_safe(connection)
+            transaction = connection.begin()
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                include_name=include_name,
+            )
+            migration_context = context.get_context()
+            migration_context.autocommit_block = _autocommit_disabled
+            try:
+                with context.begin_transaction():
+                    context.run_migrations()
+            finally:
+                transaction.rollback()
+            return
+
+        # One transaction per revision, so CONCURRENTLY and batched backfills
+        # in one revision do not hold locks taken by earlier ones
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,46 @@
+"""user directory
+
+Revision ID: 2c7f4a9e1b58
+Revises: 9e4b7d2c6f31
+Create Date: 2026-10-18 21:06:37.540912
+
+Adds `user_directory`, the global table of every user's email and shard
+used by `app.sharding`. It is only read on the home shard (DATABASE_URL),
+where the existing users are backfilled onto shard 0; on the other shards
+it stays empty.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c7f4a9e1b58'
+down_revision: Union[str, Sequence[str], None] = '9e4b7d2c6f31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_directory',
+    sa.Column('user_id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('moving_to', sa.Integer(), nullable=True),
+    sa.Column('date_created', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_user_directory_email'), 'user_directory', ['email'], unique=True)
+    op.execute(
+        'INSERT INTO user_directory (user_id, email, shard, date_created) '
+        'SELECT id, email, 0, date_created FROM users'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_directory_email'), table_name='user_directory')
+    op.drop_table('user_directory')
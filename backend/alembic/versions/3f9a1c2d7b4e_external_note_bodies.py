@@ -0,0 +1,101 @@
+"""external note bodies
+
+Revision ID: 3f9a1c2d7b4e
+Revises: eb05631fb603
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+import os
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import zstandard
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c2d7b4e'
+down_revision: Union[str, Sequence[str], None] = 'eb05631fb603'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+THRESHOLD = int(os.getenv('NOTE_BODY_EXTERNAL_THRESHOLD', '4096'))
+BATCH_SIZE = 500
+ZLIB_LEVEL = 6
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompress a body written by this revision (zlib) or by the app since (zstd or zlib)."""
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    raise ValueError(f'Unknown codec: {codec}')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'notes',
+        sa.Column('has_external_body', sa.Boolean(), server_default=sa.false(), nullable=False),
+    )
+    op.create_table('note_bodies',
+    sa.Column('note_id', sa.String(), nullable=False),
+    sa.Column('codec', sa.String(), nullable=False),
+    sa.Column('raw_size', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('note_id')
+    )
+
+    # Move existing large bodies in small batches, each committed on its own so
+    # row locks on `notes` are held only briefly. A note edited concurrently is
+    # skipped by the content check and picked up again by the next batch.
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        while True:
+            rows = conn.execute(
+                sa.text(
+                    'SELECT id, content FROM notes '
+                    'WHERE NOT has_external_body AND octet_length(content) > :threshold '
+                    'ORDER BY id LIMIT :limit'
+                ),
+                {'threshold': THRESHOLD, 'limit': BATCH_SIZE},
+            ).fetchall()
+            if not rows:
+                break
+            for note_id, content in rows:
+                raw = content.encode('utf-8')
+                conn.execute(
+                    sa.text(
+                        'WITH moved AS ('
+                        "  UPDATE notes SET content = '', has_external_body = true "
+                        '  WHERE id = :id AND content = :content RETURNING id'
+                        ') '
+                        'INSERT INTO note_bodies (note_id, codec, raw_size, data) '
+                        'SELECT id, :codec, :raw_size, :data FROM moved '
+                        'ON CONFLICT (note_id) DO UPDATE SET '
+                        'codec = EXCLUDED.codec, raw_size = EXCLUDED.raw_size, data = EXCLUDED.data'
+                    ),
+                    {
+                        'id': note_id,
+                        'content': content,
+                        'codec': 'zlib',
+                        'raw_size': len(raw),
+                        'data': zlib.compress(raw, ZLIB_LEVEL),
+                    },
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT note_id, codec, data FROM note_bodies')).fetchall()
+    for note_id, codec, data in rows:
+        conn.execute(
+            sa.text('UPDATE notes SET content = :content WHERE id = :id'),
+            {'id': note_id, 'content': decompress(data, codec).decode('utf-8')},
+        )
+    op.drop_table('note_bodies')
+    op.drop_column('notes', 'has_external_body')
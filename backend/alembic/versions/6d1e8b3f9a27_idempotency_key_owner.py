@@ -0,0 +1,43 @@
+"""idempotency key owner
+
+Revision ID: 6d1e8b3f9a27
+Revises: 2c7f4a9e1b58
+Create Date: 2026-10-19 09:12:44.503127
+
+Adds `idempotency_keys.user_id`, so `app.sharding.move_user` can move a
+user's stored responses along with the notes they created. Keys claimed
+before this revision have no owner and stay behind on a move; they expire
+after IDEMPOTENCY_TTL_SECONDS.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.online_migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d1e8b3f9a27'
+down_revision: Union[str, Sequence[str], None] = '2c7f4a9e1b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Only quick DDL outside app.online_migrations, so `-x dry_run=true` can roll it back
+dry_run_safe = True
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('idempotency_keys', sa.Column('user_id', sa.Uuid(as_uuid=False), nullable=True))
+    op.create_foreign_key(
+        'idempotency_keys_user_id_fkey', 'idempotency_keys', 'users', ['user_id'], ['id'], ondelete='CASCADE'
+    )
+    create_index_concurrently('ix_idempotency_keys_user_id', 'idempotency_keys', ['user_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_index_concurrently('ix_idempotency_keys_user_id')
+    op.drop_constraint('idempotency_keys_user_id_fkey', 'idempotency_keys', type_='foreignkey')
+    op.drop_column('idempotency_keys', 'user_id')
@@ -0,0 +1,172 @@
+"""hash partition notes by user_id
+
+Revision ID: 7c2e5b9d1a60
+Revises: 3f9a1c2d7b4e
+Create Date: 2026-10-18 10:03:47.215904
+
+Rebuilds `notes` as a table partitioned by HASH (user_id) without taking the
+application offline:
+
+1. Create `notes_partitioned` and its partitions.
+2. Mirror every write on `notes` into it with a trigger.
+3. Copy existing rows in committed batches.
+4. Swap the tables under a short ACCESS EXCLUSIVE lock.
+
+A unique constraint on a partitioned table must include the partition key, so
+the primary key becomes (user_id, id) and `note_bodies.note_id` can no longer
+be a foreign key. Body rows are removed by a trigger instead. The ORM model
+still maps `id` as the primary key, which remains unique in practice.
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e5b9d1a60'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c2d7b4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS = int(os.getenv('NOTES_PARTITIONS', '16'))
+BATCH_SIZE = 5000
+
+COLUMNS = 'id, title, content, has_external_body, user_id, date_created, date_updated'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE TABLE notes_partitioned (
+            id VARCHAR NOT NULL,
+            title VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            has_external_body BOOLEAN DEFAULT false NOT NULL,
+            user_id VARCHAR NOT NULL REFERENCES users (id),
+            date_created TIMESTAMP WITH TIME ZONE NOT NULL,
+            date_updated TIMESTAMP WITH TIME ZONE NOT NULL,
+            CONSTRAINT notes_partitioned_pkey PRIMARY KEY (user_id, id)
+        ) PARTITION BY HASH (user_id)
+        """
+    )
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f'CREATE TABLE notes_p{remainder:02d} PARTITION OF notes_partitioned '
+            f'FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+        )
+    # Partition-local indexes: ORM updates and deletes address rows by id only
+    op.execute('CREATE INDEX ix_notes_partitioned_id ON notes_partitioned (id)')
+    op.execute(
+        'CREATE INDEX ix_notes_partitioned_user_id_date_updated '
+        'ON notes_partitioned (user_id, date_updated)'
+    )
+
+    op.execute(
+        f"""
+        CREATE FUNCTION notes_mirror_to_partitioned() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM notes_partitioned WHERE user_id = OLD.user_id AND id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO notes_partitioned ({COLUMNS})
+                VALUES (NEW.id, NEW.title, NEW.content, NEW.has_external_body,
+                        NEW.user_id, NEW.date_created, NEW.date_updated)
+                ON CONFLICT (user_id, id) DO UPDATE SET
+                    title = EXCLUDED.title,
+                    content = EXCLUDED.content,
+                    has_external_body = EXCLUDED.has_external_body,
+                    date_created = EXCLUDED.date_created,
+                    date_updated = EXCLUDED.date_updated;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER notes_mirror AFTER INSERT OR UPDATE OR DELETE ON notes '
+        'FOR EACH ROW EXECUTE FUNCTION notes_mirror_to_partitioned()'
+    )
+
+    # Copy in committed batches. Rows written by the trigger meanwhile are newer
+    # than the batch snapshot, so conflicts keep the mirrored version. The
+    # batch's rows are locked FOR SHARE: a row deleted after the snapshot is
+    # skipped, and a delete arriving later waits for the batch to commit, so
+    # the mirror trigger finds the copy and removes it.
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = ''
+        while True:
+            batch_last_id = conn.execute(
+                sa.text(
+                    f'WITH batch AS ('
+                    f'  SELECT {COLUMNS} FROM notes WHERE id > :last_id ORDER BY id LIMIT :limit FOR SHARE'
+                    f'), copied AS ('
+                    f'  INSERT INTO notes_partitioned ({COLUMNS}) SELECT {COLUMNS} FROM batch '
+                    f'  ON CONFLICT (user_id, id) DO NOTHING'
+                    f') '
+                    f'SELECT max(id) FROM batch'
+                ),
+                {'last_id': last_id, 'limit': BATCH_SIZE},
+            ).scalar()
+            if batch_last_id is None:
+                break
+            last_id = batch_last_id
+
+    op.execute('SET LOCAL lock_timeout = 5000')
+    op.execute('LOCK TABLE notes IN ACCESS EXCLUSIVE MODE')
+    op.execute('DROP TRIGGER notes_mirror ON notes')
+    op.execute('DROP FUNCTION notes_mirror_to_partitioned()')
+    op.drop_constraint('note_bodies_note_id_fkey', 'note_bodies', type_='foreignkey')
+    op.execute('DROP TABLE notes')
+    op.execute('ALTER TABLE notes_partitioned RENAME TO notes')
+    op.execute('ALTER TABLE notes RENAME CONSTRAINT notes_partitioned_pkey TO notes_pkey')
+    op.execute('ALTER TABLE notes RENAME CONSTRAINT notes_partitioned_user_id_fkey TO notes_user_id_fkey')
+    op.execute('ALTER INDEX ix_notes_partitioned_id RENAME TO ix_notes_id')
+    op.execute(
+        'ALTER INDEX ix_notes_partitioned_user_id_date_updated RENAME TO ix_notes_user_id_date_updated'
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION notes_delete_body() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM note_bodies WHERE note_id = OLD.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER notes_delete_body AFTER DELETE ON notes '
+        'FOR EACH ROW EXECUTE FUNCTION notes_delete_body()'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER notes_delete_body ON notes')
+    op.execute('DROP FUNCTION notes_delete_body()')
+    op.execute('ALTER TABLE notes RENAME TO notes_partitioned')
+    op.execute('ALTER TABLE notes_partitioned DROP CONSTRAINT notes_user_id_fkey')
+    op.create_table('notes',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('date_created', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('date_updated', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('has_external_body', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(f'INSERT INTO notes ({COLUMNS}) SELECT {COLUMNS} FROM notes_partitioned')
+    op.execute('DROP TABLE notes_partitioned')
+    op.create_foreign_key(
+        'note_bodies_note_id_fkey', 'note_bodies', 'notes', ['note_id'], ['id'], ondelete='CASCADE'
+    )
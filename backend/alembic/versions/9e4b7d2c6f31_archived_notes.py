@@ -0,0 +1,111 @@
+"""archived notes
+
+Revision ID: 9e4b7d2c6f31
+Revises: 5b2d9e7c4a18
+Create Date: 2026-10-18 19:42:08.118204
+
+Adds `archived_notes`, the cold tier that `app.note_archive` moves notes into
+once they have not been updated for a while, and an index on
+`notes.date_updated` for finding them. Moving a note between the tiers
+is not a user-visible change, so `notes_notify_change` publishes nothing
+while the `app.note_archival` setting is on.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.online_migrations import create_index_concurrently, drop_index_concurrently, is_dry_run
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4b7d2c6f31'
+down_revision: Union[str, Sequence[str], None] = '5b2d9e7c4a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION notes_notify_change() RETURNS trigger AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND NEW.date_updated = OLD.date_updated THEN
+        RETURN NULL;
+    END IF;
+    {skip}
+    PERFORM pg_notify('note_changes', json_build_object(
+        'op', lower(TG_OP),
+        'id', changed.id,
+        'user_id', changed.user_id,
+        'date_updated', changed.date_updated
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Archived notes come back with their compressed data as an external body, so
+# nothing needs decompressing here; the next edit moves small bodies inline.
+RESTORE_BATCH = """
+WITH moved AS (
+    DELETE FROM archived_notes
+    WHERE id IN (SELECT id FROM archived_notes LIMIT :limit FOR UPDATE SKIP LOCKED)
+    RETURNING id, user_id, title, codec, raw_size, data, date_created, date_updated
+), restored AS (
+    INSERT INTO notes (id, user_id, title, content, has_external_body, content_size, date_created, date_updated)
+    SELECT id, user_id, title, '', true, raw_size, date_created, date_updated FROM moved
+)
+INSERT INTO note_bodies (note_id, codec, raw_size, data)
+SELECT id, codec, raw_size, data FROM moved
+"""
+RESTORE_BATCH_SIZE = 500
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('archived_notes',
+    sa.Column('id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('user_id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('codec', sa.String(), nullable=False),
+    sa.Column('raw_size', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('date_created', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('date_updated', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('date_archived', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_archived_notes_user_id'), 'archived_notes', ['user_id'], unique=False)
+    # Compressed already; keep Postgres from trying again
+    op.execute('ALTER TABLE archived_notes ALTER COLUMN data SET STORAGE EXTERNAL')
+    op.execute(
+        NOTIFY_FUNCTION.format(
+            skip="IF current_setting('app.note_archival', true) = 'on' THEN\n"
+            "        RETURN NULL;\n"
+            "    END IF;"
+        )
+    )
+    create_index_concurrently('ix_notes_date_updated', 'notes', ['date_updated'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not is_dry_run():
+        # Bring archived notes back first, in batches on a separate connection
+        with op.get_bind().engine.connect() as conn:
+            while True:
+                with conn.begin():
+                    conn.execute(sa.text("SELECT set_config('app.note_archival', 'on', true)"))
+                    restored = conn.execute(sa.text(RESTORE_BATCH), {'limit': RESTORE_BATCH_SIZE}).rowcount
+                if not restored:
+                    break
+    drop_index_concurrently('ix_notes_date_updated')
+    op.execute(NOTIFY_FUNCTION.format(skip=''))
+    op.drop_index(op.f('ix_archived_notes_user_id'), table_name='archived_notes')
+    op.drop_table('archived_notes')
@@ -0,0 +1,229 @@
+"""native uuid keys
+
+Revision ID: a41d0e6f83c2
+Revises: 7c2e5b9d1a60
+Create Date: 2026-10-18 11:26:05.938117
+
+Converts users.id, notes.id, notes.user_id and note_bodies.note_id from
+VARCHAR to native 16-byte UUID columns without taking the application
+offline. `notes.user_id` is the partition key and cannot be altered in place,
+so every table is rebuilt the same way as in 7c2e5b9d1a60:
+
+1. Create `<table>_new` with the target key type.
+2. Table by table, mirror writes on the old table into it with a trigger and
+   copy existing rows in committed batches. Users are copied before notes
+   start mirroring, so the new notes table can carry its users foreign key
+   from the start (partitioned tables do not support NOT VALID foreign keys).
+3. Swap all tables under one short lock.
+
+Existing IDs are uuid4 strings, so they cast to UUID unchanged. New IDs are
+time-ordered UUIDv7 values generated by `app.ids.uuid7`.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41d0e6f83c2'
+down_revision: Union[str, Sequence[str], None] = '7c2e5b9d1a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+# table -> (key column, conflict target, columns whose type changes, all columns)
+TABLES = {
+    'users': (
+        'id',
+        'id',
+        ('id',),
+        ('id', 'email', 'hashed_password', 'is_active', 'date_created', 'date_updated'),
+    ),
+    'notes': (
+        'id',
+        'user_id, id',
+        ('id', 'user_id'),
+        ('id', 'title', 'content', 'has_external_body', 'user_id', 'date_created', 'date_updated'),
+    ),
+    'note_bodies': (
+        'note_id',
+        'note_id',
+        ('note_id',),
+        ('note_id', 'codec', 'raw_size', 'data'),
+    ),
+}
+
+
+def _create_new_tables(key_type: str, partitions: int) -> None:
+    op.execute(
+        f"""
+        CREATE TABLE users_new (
+            id {key_type} NOT NULL,
+            email VARCHAR NOT NULL,
+            hashed_password VARCHAR NOT NULL,
+            is_active BOOLEAN NOT NULL,
+            date_created TIMESTAMP WITH TIME ZONE NOT NULL,
+            date_updated TIMESTAMP WITH TIME ZONE NOT NULL,
+            CONSTRAINT users_new_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute('CREATE UNIQUE INDEX ix_users_new_email ON users_new (email)')
+
+    op.execute(
+        f"""
+        CREATE TABLE notes_new (
+            id {key_type} NOT NULL,
+            title VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            has_external_body BOOLEAN DEFAULT false NOT NULL,
+            user_id {key_type} NOT NULL,
+            date_created TIMESTAMP WITH TIME ZONE NOT NULL,
+            date_updated TIMESTAMP WITH TIME ZONE NOT NULL,
+            CONSTRAINT notes_new_pkey PRIMARY KEY (user_id, id),
+            CONSTRAINT notes_new_user_id_fkey FOREIGN KEY (user_id) REFERENCES users_new (id)
+        ) PARTITION BY HASH (user_id)
+        """
+    )
+    for remainder in range(partitions):
+        op.execute(
+            f'CREATE TABLE notes_new_p{remainder:02d} PARTITION OF notes_new '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        )
+    op.execute('CREATE INDEX ix_notes_new_id ON notes_new (id)')
+    op.execute('CREATE INDEX ix_notes_new_user_id_date_updated ON notes_new (user_id, date_updated)')
+
+    op.execute(
+        f"""
+        CREATE TABLE note_bodies_new (
+            note_id {key_type} NOT NULL,
+            codec VARCHAR NOT NULL,
+            raw_size INTEGER NOT NULL,
+            data BYTEA NOT NULL,
+            CONSTRAINT note_bodies_new_pkey PRIMARY KEY (note_id)
+        )
+        """
+    )
+
+
+def _mirror_writes(table: str, key_type: str) -> None:
+    _, conflict, converted, columns = TABLES[table]
+    column_list = ', '.join(columns)
+    values = ', '.join(
+        f'NEW.{c}::{key_type}' if c in converted else f'NEW.{c}' for c in columns
+    )
+    old_match = ' AND '.join(f'{c} = OLD.{c}::{key_type}' for c in converted)
+    updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in columns if c not in converted)
+    op.execute(
+        f"""
+        CREATE FUNCTION {table}_mirror_to_new() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {table}_new WHERE {old_match};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {table}_new ({column_list}) VALUES ({values})
+                ON CONFLICT ({conflict}) DO UPDATE SET {updates};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        f'CREATE TRIGGER {table}_mirror AFTER INSERT OR UPDATE OR DELETE ON {table} '
+        f'FOR EACH ROW EXECUTE FUNCTION {table}_mirror_to_new()'
+    )
+
+
+def _copy_rows(table: str, from_type: str, key_type: str) -> None:
+    # Rows written by the trigger meanwhile are newer than the batch snapshot,
+    # so conflicts keep the mirrored version. Locking the batch FOR SHARE skips
+    # rows deleted since the snapshot and makes later deletes wait for the
+    # batch to commit, so a deleted row is never copied back.
+    key, conflict, converted, columns = TABLES[table]
+    column_list = ', '.join(columns)
+    select_list = ', '.join(f'{c}::{key_type}' if c in converted else c for c in columns)
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_key = None
+        while True:
+            last_key = conn.execute(
+                sa.text(
+                    f'WITH batch AS ('
+                    f'  SELECT * FROM {table} '
+                    f'  WHERE CAST(:last_key AS {from_type}) IS NULL '
+                    f'     OR {key} > CAST(:last_key AS {from_type}) '
+                    f'  ORDER BY {key} LIMIT :limit FOR SHARE'
+                    f'), copied AS ('
+                    f'  INSERT INTO {table}_new ({column_list}) SELECT {select_list} FROM batch '
+                    f'  ON CONFLICT ({conflict}) DO NOTHING'
+                    f') '
+                    f'SELECT {key}::text FROM batch ORDER BY {key} DESC LIMIT 1'
+                ),
+                {'last_key': last_key, 'limit': BATCH_SIZE},
+            ).scalar()
+            if last_key is None:
+                break
+
+
+def _swap_tables(partitions: int) -> None:
+    op.execute('SET LOCAL lock_timeout = 5000')
+    op.execute('LOCK TABLE users, notes, note_bodies IN ACCESS EXCLUSIVE MODE')
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER {table}_mirror ON {table}')
+        op.execute(f'DROP FUNCTION {table}_mirror_to_new()')
+    op.execute('DROP TABLE note_bodies')
+    op.execute('DROP TABLE notes')
+    op.execute('DROP FUNCTION notes_delete_body()')
+    op.execute('DROP TABLE users')
+
+    for table in TABLES:
+        op.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        op.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {table}_new_pkey TO {table}_pkey')
+    for remainder in range(partitions):
+        op.execute(f'ALTER TABLE notes_new_p{remainder:02d} RENAME TO notes_p{remainder:02d}')
+    op.execute('ALTER INDEX ix_users_new_email RENAME TO ix_users_email')
+    op.execute('ALTER INDEX ix_notes_new_id RENAME TO ix_notes_id')
+    op.execute('ALTER INDEX ix_notes_new_user_id_date_updated RENAME TO ix_notes_user_id_date_updated')
+
+    op.execute('ALTER TABLE notes RENAME CONSTRAINT notes_new_user_id_fkey TO notes_user_id_fkey')
+    op.execute(
+        """
+        CREATE FUNCTION notes_delete_body() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM note_bodies WHERE note_id = OLD.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER notes_delete_body AFTER DELETE ON notes '
+        'FOR EACH ROW EXECUTE FUNCTION notes_delete_body()'
+    )
+
+
+def _convert_keys(from_type: str, key_type: str) -> None:
+    partitions = op.get_bind().execute(
+        sa.text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'notes'::regclass")
+    ).scalar_one()
+
+    _create_new_tables(key_type, partitions)
+    for table in TABLES:
+        _mirror_writes(table, key_type)
+        _copy_rows(table, from_type, key_type)
+    _swap_tables(partitions)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _convert_keys('VARCHAR', 'UUID')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _convert_keys('UUID', 'VARCHAR')
@@ -0,0 +1,56 @@
+"""note change notifications
+
+Revision ID: c5e8f2a9b713
+Revises: a41d0e6f83c2
+Create Date: 2026-10-18 13:48:19.660471
+
+Publishes every committed write on `notes` on the `note_changes` channel for
+the real-time event stream in `app.events`.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e8f2a9b713'
+down_revision: Union[str, Sequence[str], None] = 'a41d0e6f83c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE FUNCTION notes_notify_change() RETURNS trigger AS $$
+        DECLARE
+            changed RECORD;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed := OLD;
+            ELSE
+                changed := NEW;
+            END IF;
+            PERFORM pg_notify('note_changes', json_build_object(
+                'op', lower(TG_OP),
+                'id', changed.id,
+                'user_id', changed.user_id,
+                'date_updated', changed.date_updated
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER notes_notify_change AFTER INSERT OR UPDATE OR DELETE ON notes '
+        'FOR EACH ROW EXECUTE FUNCTION notes_notify_change()'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER notes_notify_change ON notes')
+    op.execute('DROP FUNCTION notes_notify_change()')
@@ -0,0 +1,155 @@
+"""user note stats
+
+Revision ID: d83b6a1e4f05
+Revises: c5e8f2a9b713
+Create Date: 2026-10-18 15:20:44.107385
+
+Adds `notes.content_size` and the trigger-maintained `user_note_stats` table.
+Existing sizes are backfilled in committed batches and the aggregates are then
+computed with `app.note_stats.reconcile`. Both run after the trigger exists, so
+writes made during the migration are counted.
+
+The change notification trigger now skips updates that leave date_updated
+untouched. Application writes always bump it, so only maintenance writes such
+as this backfill are not broadcast to clients.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.note_stats import reconcile
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd83b6a1e4f05'
+down_revision: Union[str, Sequence[str], None] = 'c5e8f2a9b713'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+NOTIFY_FUNCTION = """
+CREATE OR REPLACE FUNCTION notes_notify_change() RETURNS trigger AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := OLD;
+    ELSE
+        changed := NEW;
+    END IF;
+    {skip}
+    PERFORM pg_notify('note_changes', json_build_object(
+        'op', lower(TG_OP),
+        'id', changed.id,
+        'user_id', changed.user_id,
+        'date_updated', changed.date_updated
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column('content_size', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('user_note_stats',
+    sa.Column('user_id', sa.Uuid(as_uuid=False), nullable=False),
+    sa.Column('note_count', sa.BigInteger(), nullable=False),
+    sa.Column('total_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('last_modified', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION user_note_stats_apply(p_user_id uuid, p_count bigint, p_bytes bigint)
+        RETURNS void AS $$
+            INSERT INTO user_note_stats AS s (user_id, note_count, total_bytes, last_modified, version)
+            VALUES (p_user_id, p_count, p_bytes, now(), 1)
+            ON CONFLICT (user_id) DO UPDATE SET
+                note_count = s.note_count + EXCLUDED.note_count,
+                total_bytes = s.total_bytes + EXCLUDED.total_bytes,
+                last_modified = now(),
+                version = s.version + 1
+        $$ LANGUAGE sql
+        """
+    )
+    op.execute(
+        """
+        CREATE FUNCTION notes_update_stats() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM user_note_stats_apply(NEW.user_id, 1, NEW.content_size);
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM user_note_stats_apply(OLD.user_id, -1, -OLD.content_size);
+            ELSIF NEW.user_id = OLD.user_id THEN
+                PERFORM user_note_stats_apply(NEW.user_id, 0, NEW.content_size - OLD.content_size);
+            ELSE
+                PERFORM user_note_stats_apply(OLD.user_id, -1, -OLD.content_size);
+                PERFORM user_note_stats_apply(NEW.user_id, 1, NEW.content_size);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        'CREATE TRIGGER notes_update_stats AFTER INSERT OR UPDATE OR DELETE ON notes '
+        'FOR EACH ROW EXECUTE FUNCTION notes_update_stats()'
+    )
+    op.execute(
+        NOTIFY_FUNCTION.format(
+            skip="IF TG_OP = 'UPDATE' AND NEW.date_updated = OLD.date_updated THEN\n"
+            "        RETURN NULL;\n"
+            "    END IF;"
+        )
+    )
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = None
+        while True:
+            last_id = conn.execute(
+                sa.text(
+                    """
+                    WITH batch AS (
+                        SELECT n.id, n.user_id,
+                            CASE WHEN n.has_external_body THEN coalesce(b.raw_size, 0)
+                                 ELSE octet_length(n.content) END AS size
+                        FROM notes n
+                        LEFT JOIN note_bodies b ON b.note_id = n.id
+                        WHERE CAST(:last_id AS uuid) IS NULL OR n.id > CAST(:last_id AS uuid)
+                        ORDER BY n.id
+                        LIMIT :limit
+                    ), updated AS (
+                        UPDATE notes SET content_size = batch.size
+                        FROM batch
+                        WHERE notes.user_id = batch.user_id AND notes.id = batch.id
+                            AND notes.content_size <> batch.size
+                    )
+                    SELECT id::text FROM batch ORDER BY id DESC LIMIT 1
+                    """
+                ),
+                {'last_id': last_id, 'limit': BATCH_SIZE},
+            ).scalar()
+            if last_id is None:
+                break
+
+        with conn.engine.connect() as reconcile_conn:
+            reconcile(reconcile_conn)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(NOTIFY_FUNCTION.format(skip=''))
+    op.execute('DROP TRIGGER notes_update_stats ON notes')
+    op.execute('DROP FUNCTION notes_update_stats()')
+    op.execute('DROP FUNCTION user_note_stats_apply(uuid, bigint, bigint)')
+    op.drop_table('user_note_stats')
+    op.drop_column('notes', 'content_size')
@@ -1,8 +1,10 @@
 from fastapi import APIRouter
 
-from app.routers import auth, note
+from app.routers import auth, batch, events, note
 
 router = APIRouter()
 
 router.include_router(auth.router)
 router.include_router(note.router)
+router.include_router(events.router)
+router.include_router(batch.router)
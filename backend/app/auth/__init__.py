@@ -1,4 +1,4 @@
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import authenticated_as, get_current_user, get_user_from_token
 from app.auth.security import (
     create_access_token,
     create_refresh_token,
@@ -8,7 +8,9 @@ from app.auth.security import (
 )
 
 __all__ = [
+    'authenticated_as',
     'get_current_user',
+    'get_user_from_token',
     'create_access_token',
     'create_refresh_token',
     'decode_refresh_token',
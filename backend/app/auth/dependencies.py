@@ -1,4 +1,7 @@
-from typing import Optional
+import contextvars
+import hmac
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
@@ -6,20 +9,24 @@ from sqlalchemy.orm import Session
 
 from app.auth.security import decode_access_token
 from app.database import get_db
+from app.ids import is_uuid
 from app.models.user import User
+from app.tracing import traced
 
 security = HTTPBearer()
 
+_authenticated: contextvars.ContextVar[Optional[tuple[str, User]]] = contextvars.ContextVar(
+    'authenticated', default=None
+)
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+
+@traced('get_user_from_token')
+def get_user_from_token(token: str, db: Session) -> User:
     """
-    Dependency to get the current authenticated user from JWT token.
+    Resolve the active user an access token was issued for.
 
     Args:
-        credentials: HTTP Bearer token credentials
+        token: Encoded JWT access token
         db: Database session
 
     Returns:
@@ -28,7 +35,6 @@ def get_current_user(
     Raises:
         HTTPException: 401 if token is invalid or user not found
     """
-    token = credentials.credentials
     payload = decode_access_token(token)
 
     if payload is None:
@@ -39,7 +45,7 @@ def get_current_user(
         )
 
     user_id: Optional[str] = payload.get('sub')
-    if user_id is None:
+    if user_id is None or not is_uuid(user_id):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Could not validate credentials',
@@ -62,3 +68,42 @@ def get_current_user(
         )
 
     return user
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db, scope='function')
+) -> User:
+    """
+    Dependency to get the current authenticated user from JWT token.
+
+    Args:
+        credentials: HTTP Bearer token credentials
+        db: Database session
+
+    Returns:
+        User: The authenticated user
+
+    Raises:
+        HTTPException: 401 if token is invalid or user not found
+    """
+    authenticated = _authenticated.get()
+    if authenticated is not None and hmac.compare_digest(authenticated[0], credentials.credentials):
+        return authenticated[1]
+    return get_user_from_token(credentials.credentials, db)
+
+
+@contextmanager
+def authenticated_as(token: str, user: User) -> Iterator[None]:
+    """
+    Reuse an already authenticated user for requests made in this context.
+
+    `get_current_user` returns `user` without decoding the token or loading
+    the user again when it is given the same token, e.g. in the sub-requests
+    of a batch.
+    """
+    reset = _authenticated.set((token, user))
+    try:
+        yield
+    finally:
+        _authenticated.reset(reset)
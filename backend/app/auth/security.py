@@ -6,6 +6,8 @@ import jwt
 from pwdlib import PasswordHash
 from pwdlib.hashers.argon2 import Argon2Hasher
 
+from app.tracing import traced
+
 password_hash = PasswordHash((Argon2Hasher(),))
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
@@ -14,16 +16,19 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '15')
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', '7'))
 
 
+@traced('verify_password', timing='hash')
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return password_hash.verify(plain_password, hashed_password)
 
 
+@traced('get_password_hash', timing='hash')
 def get_password_hash(password: str) -> str:
     """Hash a password using Argon2."""
     return password_hash.hash(password)
 
 
+@traced('create_access_token', timing='jwt')
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -37,6 +42,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+@traced('decode_access_token', timing='jwt')
 def decode_access_token(token: str) -> Optional[dict[str, Any]]:
     """Decode and verify a JWT access token."""
     try:
@@ -4,9 +4,37 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from enum import Enum
+from typing import Annotated, Any, Dict, List, Optional
 
-from pydantic import AwareDatetime, BaseModel, ConfigDict
+from pydantic import AwareDatetime, BaseModel, ConfigDict, Field
+
+
+class BatchItemResponse(BaseModel):
+    model_config = ConfigDict(
+        extra='forbid',
+    )
+    id: Optional[str] = None
+    status: int
+    headers: Dict[str, str]
+    body: Optional[Any] = None
+
+
+class BatchMethod(Enum):
+    GET = 'GET'
+    POST = 'POST'
+    PATCH = 'PATCH'
+    DELETE = 'DELETE'
+
+
+class BatchResponse(BaseModel):
+    model_config = ConfigDict(
+        extra='forbid',
+    )
+    responses: Annotated[
+        List[BatchItemResponse],
+        Field(description='One response per request, in request order'),
+    ]
 
 
 class CreateNoteRequest(BaseModel):
@@ -37,6 +65,16 @@ class Note(BaseModel):
     date_updated: AwareDatetime
 
 
+class NoteStats(BaseModel):
+    model_config = ConfigDict(
+        extra='forbid',
+    )
+    note_count: int
+    total_bytes: int
+    last_modified: Optional[AwareDatetime] = None
+    version: int
+
+
 class Token(BaseModel):
     model_config = ConfigDict(
         extra='forbid',
@@ -78,3 +116,29 @@ class UserRegisterRequest(BaseModel):
     )
     email: str
     password: str
+
+
+class BatchItemRequest(BaseModel):
+    model_config = ConfigDict(
+        extra='forbid',
+    )
+    id: Annotated[
+        Optional[str],
+        Field(description='Client reference, echoed in the matching response'),
+    ] = None
+    method: BatchMethod
+    path: Annotated[
+        str,
+        Field(
+            description='API path with optional query string, e.g. /api/note/{id}'
+        ),
+    ]
+    headers: Optional[Dict[str, str]] = None
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    model_config = ConfigDict(
+        extra='forbid',
+    )
+    requests: List[BatchItemRequest]
@@ -0,0 +1,35 @@
+"""
+Compression codecs for large stored values.
+
+New values are compressed with zstd. The codec name is stored next to every
+compressed value, so values written with zlib stay readable.
+"""
+import zlib
+
+import zstandard
+
+CODEC_ZSTD = 'zstd'
+CODEC_ZLIB = 'zlib'
+
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+
+DEFAULT_CODEC = CODEC_ZSTD
+
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC) -> bytes:
+    """Compress bytes with the given codec."""
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    raise ValueError(f'Unknown codec: {codec}')
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Decompress bytes written by `compress` with the given codec."""
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    raise ValueError(f'Unknown codec: {codec}')
@@ -1,8 +1,22 @@
+import contextvars
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import Engine, create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
 
+from app.ids import is_uuid
+from app.load_shedding import TimedQueuePool
+from app.tracing import instrument_engine
+
 load_dotenv()
 
 DB_USER = os.getenv('DB_USER', 'test-fullstack-template-user')
@@ -13,13 +27,199 @@ DB_NAME = os.getenv('DB_NAME', 'test-fullstack-template')
 
 DATABASE_URL = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
-engine = create_engine(DATABASE_URL)
+# Databases of shards 1..N, comma-separated; DATABASE_URL is shard 0
+SHARD_DATABASE_URLS = [url.strip() for url in os.getenv('SHARD_DATABASE_URLS', '').split(',') if url.strip()]
+SHARD_DIRECTORY_CACHE_SECONDS = float(os.getenv('SHARD_DIRECTORY_CACHE_SECONDS', '5'))
+SHARD_DIRECTORY_CACHE_SIZE = 100_000
+
+HOME_SHARD = 0
+
+# Still served from the old shard while a user is being moved
+READ_ONLY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+def _create_engine(url: str) -> Engine:
+    shard_engine = create_engine(url, poolclass=TimedQueuePool)
+    instrument_engine(shard_engine)
+    return shard_engine
+
+
+engine = _create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
-def get_db():
-    db = SessionLocal()
+@dataclass(frozen=True)
+class Placement:
+    shard: int
+    moving_to: Optional[int] = None
+
+
+class ShardMap:
+    """
+    The databases users are spread over, and which one holds each user.
+
+    Shard 0 is the home shard: it holds `user_directory`, the global table of
+    every user's email and shard, as well as everything that is not per user.
+    A user's rows (`users`, `notes` and the tables hanging off them) live on
+    one shard, picked from the user ID when the user registers and changed
+    only by `app.sharding.move_user`. Directory lookups are cached for
+    `cache_seconds`, so a move waits that long before relying on every worker
+    having seen it.
+
+    With a single database everything is on shard 0 and the directory is
+    never consulted.
+    """
+
+    def __init__(self, engines: list[Engine], cache_seconds: float = SHARD_DIRECTORY_CACHE_SECONDS):
+        self.configure(engines, cache_seconds)
+
+    def configure(self, engines: list[Engine], cache_seconds: float = SHARD_DIRECTORY_CACHE_SECONDS) -> None:
+        self.engines = engines
+        self.cache_seconds = cache_seconds
+        self._sessions = [
+            SessionLocal if shard_engine is engine else sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+            for shard_engine in engines
+        ]
+        self._cache: OrderedDict[str, tuple[float, Optional[Placement]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def session(self, shard: int = HOME_SHARD) -> Session:
+        return self._sessions[shard]()
+
+    def url(self, shard: int) -> str:
+        return self.engines[shard].url.render_as_string(hide_password=False)
+
+    def placement(self, user_id: str) -> int:
+        """Shard a new user is created on."""
+        return uuid.UUID(user_id).int % len(self.engines)
+
+    def locate(self, user_id: str) -> Optional[Placement]:
+        """Where the directory puts a user, or None for unknown users."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] > now:
+                self._cache.move_to_end(user_id)
+                return cached[1]
+
+        with self.engines[HOME_SHARD].connect() as conn:
+            row = conn.execute(
+                text('SELECT shard, moving_to FROM user_directory WHERE user_id = :user_id'),
+                {'user_id': user_id},
+            ).first()
+        found = Placement(row.shard, row.moving_to) if row is not None else None
+
+        if self.cache_seconds > 0:
+            with self._lock:
+                self._cache[user_id] = (now + self.cache_seconds, found)
+                self._cache.move_to_end(user_id)
+                while len(self._cache) > SHARD_DIRECTORY_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return found
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget this worker's cached placement of a user."""
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+
+shard_map = ShardMap([engine] + [_create_engine(url) for url in SHARD_DATABASE_URLS])
+
+_shared_session: contextvars.ContextVar[Optional[Session]] = contextvars.ContextVar('shared_session', default=None)
+
+
+def _token_subject(request: Request) -> Optional[str]:
+    # app.auth imports this module, so import its token decoding lazily
+    from app.auth.security import decode_access_token
+
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    payload = decode_access_token(token)
+    user_id = payload.get('sub') if payload else None
+    return user_id if isinstance(user_id, str) and is_uuid(user_id) else None
+
+
+def request_shard(request: Request) -> int:
+    """
+    Shard of the user authenticated by the request's access token.
+
+    Requests without a valid token, and tokens of unknown users, go to the
+    home shard (where authentication then fails as usual). Raises 503 for
+    writes of a user who is being moved to another shard.
+    """
+    if len(shard_map) == 1:
+        return HOME_SHARD
+    user_id = _token_subject(request)
+    placement = shard_map.locate(user_id) if user_id is not None else None
+    if placement is None:
+        return HOME_SHARD
+    if placement.moving_to is not None and request.method not in READ_ONLY_METHODS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Account is being moved, retry shortly',
+            headers={'Retry-After': str(max(1, round(shard_map.cache_seconds)))},
+        )
+    return placement.shard
+
+
+def get_db(request: Request):
+    """
+    Database session for one request.
+
+    The session is on the shard of the user whose access token the request
+    carries (see `request_shard`), or on the home shard otherwise.
+
+    A session checks out a pooled connection only when it runs its first
+    query, and returns it to the pool when its transaction ends. Depend on
+    this with `scope='function'` so the session is closed as soon as the path
+    operation returns, rather than after the response has been written to
+    the client; handlers with slow work after their last query, such as
+    password hashing or serializing large listings, call `release_connection`
+    once their database work is done.
+
+    Inside `shared_session` the shared session is yielded instead, and left
+    open for its owner to close.
+    """
+    shared = _shared_session.get()
+    if shared is not None:
+        yield shared
+        return
+
+    db = shard_map.session(request_shard(request))
     try:
         yield db
     finally:
         db.close()
+
+
+def user_shard(user_id: Optional[str]) -> int:
+    """Shard holding a user, or the home shard for unknown users and invalid IDs."""
+    if len(shard_map) == 1 or not isinstance(user_id, str) or not is_uuid(user_id):
+        return HOME_SHARD
+    placement = shard_map.locate(user_id)
+    return placement.shard if placement is not None else HOME_SHARD
+
+
+def release_connection(db: Session) -> None:
+    """
+    Return the session's connection to the pool now.
+
+    Uncommitted changes are rolled back. Objects already loaded stay readable
+    (detached), and the session checks out a connection again if it is used
+    after this.
+    """
+    db.close()
+
+
+@contextmanager
+def shared_session(db: Session) -> Iterator[Session]:
+    """Serve `get_db` from `db` for everything run in this context, e.g. batched sub-requests."""
+    token = _shared_session.set(db)
+    try:
+        yield db
+    finally:
+        _shared_session.reset(token)
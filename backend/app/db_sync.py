@@ -0,0 +1,543 @@
+"""
+Copy the contents of one database into another with the same schema.
+
+Every table is streamed with COPY straight from the source into the target,
+in binary format and without intermediate files, on `jobs` tables at a time.
+Partitions such as those of `notes` are copied as separate tables, so large
+partitioned tables are split across the workers as well. All source
+connections share one exported snapshot, so the copy is consistent across
+tables even while the source is serving traffic.
+
+The target's rows are replaced as they are: triggers and foreign key checks
+are disabled with `session_replication_role = replica`, which needs a
+superuser (the database owner created by the Postgres Docker image is one).
+Trigger-maintained tables such as `user_note_stats` are copied, not rebuilt.
+
+A full sync copies every table into an unlogged shadow table in a separate
+schema next to the target's and verifies it there. Only when every table has
+been copied (and verified) are the target's tables truncated and filled from
+the shadow tables, in one transaction together with the new watermarks, so a
+failed run leaves the target as it was. An incremental sync only
+copies rows of the tables in INCREMENTAL_TABLES that changed after the
+watermark recorded by the previous sync from the same source, less
+SYNC_WATERMARK_OVERLAP_SECONDS for transactions that were still running at
+the time, and upserts them. Rows deleted on the source, and rows missing
+from the target whatever their watermark (notes restored from the archive
+keep their original `date_updated`), are found by comparing primary keys,
+which is much cheaper than copying the rows. The other tables are small and
+copied in full. Watermarks are kept in the
+target's `db_sync_state` table.
+
+Each table is verified afterwards by comparing its row count and an
+order-independent checksum of its rows between source and target.
+
+Both databases must be at the same Alembic revision; the schema itself is
+not copied, so run migrations on the target first.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import psycopg2
+from psycopg2 import sql
+
+SYNC_JOBS = int(os.getenv('SYNC_JOBS', '4'))
+SYNC_WATERMARK_OVERLAP_SECONDS = float(os.getenv('SYNC_WATERMARK_OVERLAP_SECONDS', '600'))
+
+COPY_BUFFER_SIZE = 1 << 20
+
+# Appended to the target's schema to name the schema full syncs load into
+SHADOW_SCHEMA_SUFFIX = '_db_sync'
+
+# Bookkeeping tables that belong to the database they are in
+EXCLUDED_TABLES = frozenset({'alembic_version', 'migration_progress', 'db_sync_state'})
+
+# Tables (or partitioned parents) copied incrementally: the expression whose
+# value is compared with the watermark and any join it needs. `t` is the
+# table being copied.
+INCREMENTAL_TABLES = {
+    'users': ('t.date_updated', ''),
+    'notes': ('t.date_updated', ''),
+    'archived_notes': ('t.date_archived', ''),
+    # A body changes exactly when its note does
+    'note_bodies': ('n.date_updated', 'JOIN notes n ON n.id = t.note_id'),
+}
+
+# Identical text output on both sides, which the checksums depend on
+SESSION_SETTINGS = {
+    'TimeZone': 'UTC',
+    'DateStyle': 'ISO, MDY',
+    'IntervalStyle': 'postgres',
+    'extra_float_digits': '3',
+    'bytea_output': 'hex',
+}
+
+
+@dataclass
+class Table:
+    name: str
+    parent: str
+    columns: list[str]
+    primary_key: list[str]
+    pages: int
+
+    @property
+    def incremental(self) -> Optional[tuple[str, str]]:
+        return INCREMENTAL_TABLES.get(self.parent)
+
+
+@dataclass
+class TableResult:
+    table: str
+    incremental: bool
+    copied: int
+    deleted: int
+    seconds: float
+    source_count: Optional[int] = None
+    target_count: Optional[int] = None
+    verified: Optional[bool] = None
+    watermark: Optional[datetime] = None
+
+
+def connect(url: str):
+    """Open a psycopg2 connection with the session settings both sides must share."""
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for name, value in SESSION_SETTINGS.items():
+            cur.execute('SELECT set_config(%s, %s, false)', (name, value))
+    conn.autocommit = False
+    return conn
+
+
+def describe_tables(conn) -> dict[str, Table]:
+    """Leaf tables in the current schema, with their parent, columns and primary key."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname,
+                   coalesce(p.relname, c.relname),
+                   array(SELECT a.attname::text FROM pg_attribute a
+                         WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                         ORDER BY a.attnum),
+                   array(SELECT a.attname::text FROM pg_index i
+                         JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                         WHERE i.indrelid = c.oid AND i.indisprimary
+                         ORDER BY array_position(i.indkey::int2[], a.attnum)),
+                   c.relpages
+            FROM pg_class c
+            LEFT JOIN pg_inherits h ON h.inhrelid = c.oid
+            LEFT JOIN pg_class p ON p.oid = h.inhparent
+            WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind = 'r'
+            """
+        )
+        rows = cur.fetchall()
+    conn.rollback()
+    return {
+        name: Table(name, parent, columns, primary_key, pages)
+        for name, parent, columns, primary_key, pages in rows
+        if parent not in EXCLUDED_TABLES
+    }
+
+
+def _alembic_revision(conn) -> Optional[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('alembic_version') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+        cur.execute('SELECT version_num FROM alembic_version')
+        row = cur.fetchone()
+    conn.rollback()
+    return row[0] if row else None
+
+
+def check_compatible(source, target) -> dict[str, Table]:
+    """
+    Check that both databases have the same schema and return the tables to copy.
+
+    Raises:
+        ValueError: If the Alembic revisions, tables or columns differ
+    """
+    source_revision, target_revision = _alembic_revision(source), _alembic_revision(target)
+    if source_revision != target_revision:
+        raise ValueError(
+            f'Source is at revision {source_revision} but target is at {target_revision}; migrate both to the same revision'
+        )
+
+    source_tables, target_tables = describe_tables(source), describe_tables(target)
+    if source_tables.keys() != target_tables.keys():
+        missing = sorted(source_tables.keys() ^ target_tables.keys())
+        raise ValueError(f'Tables differ between source and target: {", ".join(missing)}')
+    for name, table in target_tables.items():
+        if set(table.columns) != set(source_tables[name].columns):
+            raise ValueError(f'Columns of {name} differ between source and target')
+        if table.incremental and not table.primary_key:
+            raise ValueError(f'{name} needs a primary key to be synced incrementally')
+        table.pages = source_tables[name].pages
+    return target_tables
+
+
+def source_id(conn) -> str:
+    """Identifies the source database in the target's watermarks."""
+    info = conn.get_dsn_parameters()
+    return f"{info.get('host', '')}:{info.get('port', '')}/{info.get('dbname', '')}"
+
+
+def _ensure_state_table(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            'CREATE TABLE IF NOT EXISTS db_sync_state ('
+            '  source TEXT NOT NULL,'
+            '  table_name TEXT NOT NULL,'
+            '  watermark TIMESTAMPTZ,'
+            '  date_synced TIMESTAMPTZ NOT NULL DEFAULT now(),'
+            '  PRIMARY KEY (source, table_name)'
+            ')'
+        )
+    conn.commit()
+
+
+def read_watermarks(conn, source: str) -> dict[str, Optional[datetime]]:
+    """Watermarks of the last sync from `source`, by table."""
+    _ensure_state_table(conn)
+    with conn.cursor() as cur:
+        cur.execute('SELECT table_name, watermark FROM db_sync_state WHERE source = %s', (source,))
+        watermarks = dict(cur.fetchall())
+    conn.rollback()
+    return watermarks
+
+
+def _save_watermarks(conn, source: str, results: list[TableResult]) -> None:
+    # A table that failed verification gets no watermark, so the next
+    # incremental sync falls back to a full one instead of building on it
+    with conn.cursor() as cur:
+        cur.execute('DELETE FROM db_sync_state WHERE source = %s', (source,))
+        cur.executemany(
+            'INSERT INTO db_sync_state (source, table_name, watermark) VALUES (%s, %s, %s)',
+            [
+                (source, result.table, result.watermark)
+                for result in results
+                if result.watermark is not None and result.verified is not False
+            ],
+        )
+    conn.commit()
+
+
+def stream_copy(source_cur, copy_out: str, target_cur, copy_in: str) -> None:
+    """Pipe a COPY TO STDOUT on the source into a COPY FROM STDIN on the target."""
+    read_fd, write_fd = os.pipe()
+    reader, writer = os.fdopen(read_fd, 'rb'), os.fdopen(write_fd, 'wb')
+    errors: list[BaseException] = []
+
+    def produce():
+        try:
+            source_cur.copy_expert(copy_out, writer, size=COPY_BUFFER_SIZE)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                writer.close()
+            except OSError:
+                pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        target_cur.copy_expert(copy_in, reader, size=COPY_BUFFER_SIZE)
+    finally:
+        # Unblocks the producer with a broken pipe if the target gave up first
+        reader.close()
+        producer.join()
+    if errors:
+        raise errors[0]
+
+
+def _checksum(cur, table: Table, schema: Optional[str] = None) -> tuple[int, int]:
+    row = sql.SQL('ROW({})').format(sql.SQL(', ').join(sql.Identifier('t', c) for c in table.columns))
+    relation = sql.Identifier(schema, table.name) if schema else sql.Identifier(table.name)
+    cur.execute(
+        sql.SQL(
+            "SELECT count(*), coalesce(sum(('x' || substr(md5({}::text), 1, 15))::bit(60)::bigint), 0) FROM {} t"
+        ).format(row, relation)
+    )
+    row = cur.fetchone()
+    assert row is not None
+    count, checksum = row
+    return count, int(checksum)
+
+
+def _max_watermark(cur, table: Table) -> Optional[datetime]:
+    assert table.incremental is not None
+    expression, join = table.incremental
+    cur.execute(
+        sql.SQL('SELECT max({}) FROM {} t {}').format(sql.SQL(expression), sql.Identifier(table.name), sql.SQL(join))
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _copy_full(source_cur, target_cur, table: Table, schema: Optional[str]) -> int:
+    columns = sql.SQL(', ').join(map(sql.Identifier, table.columns))
+    stream_copy(
+        source_cur,
+        sql.SQL('COPY (SELECT {} FROM {}) TO STDOUT (FORMAT binary)').format(
+            columns, sql.Identifier(table.name)
+        ).as_string(source_cur),
+        target_cur,
+        sql.SQL('COPY {} ({}) FROM STDIN (FORMAT binary)').format(
+            sql.Identifier(schema, table.name) if schema else sql.Identifier(table.name), columns
+        ).as_string(target_cur),
+    )
+    return target_cur.rowcount
+
+
+def _copy_incremental(source_cur, target_cur, table: Table, since: datetime) -> tuple[int, int]:
+    assert table.incremental is not None
+    expression, join = table.incremental
+    name = sql.Identifier(table.name)
+    columns = sql.SQL(', ').join(map(sql.Identifier, table.columns))
+    source_columns = sql.SQL(', ').join(sql.Identifier('t', c) for c in table.columns)
+    key = sql.SQL(', ').join(map(sql.Identifier, table.primary_key))
+
+    # Keys of every source row, to find rows deleted since the last sync
+    target_cur.execute(sql.SQL('CREATE TEMP TABLE sync_keys ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA').format(key, name))
+    stream_copy(
+        source_cur, sql.SQL('COPY (SELECT {} FROM {}) TO STDOUT (FORMAT binary)').format(key, name).as_string(source_cur),
+        target_cur, 'COPY sync_keys FROM STDIN (FORMAT binary)',
+    )
+    target_cur.execute('ANALYZE sync_keys')
+    target_cur.execute(
+        sql.SQL('DELETE FROM {} t WHERE NOT EXISTS (SELECT 1 FROM sync_keys k WHERE ({}) = ({}))').format(
+            name,
+            sql.SQL(', ').join(sql.Identifier('k', c) for c in table.primary_key),
+            sql.SQL(', ').join(sql.Identifier('t', c) for c in table.primary_key),
+        )
+    )
+    deleted = target_cur.rowcount
+
+    # Rows a watermark cannot find, such as notes restored from the archive
+    target_cur.execute(
+        sql.SQL('SELECT {} FROM sync_keys k WHERE NOT EXISTS (SELECT 1 FROM {} t WHERE ({}) = ({}))').format(
+            key,
+            name,
+            sql.SQL(', ').join(sql.Identifier('k', c) for c in table.primary_key),
+            sql.SQL(', ').join(sql.Identifier('t', c) for c in table.primary_key),
+        )
+    )
+    missing = target_cur.fetchall()
+
+    target_cur.execute(sql.SQL('CREATE TEMP TABLE sync_rows ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA').format(columns, name))
+    condition = sql.SQL('{} > {}').format(sql.SQL(expression), sql.Literal(since))
+    if missing:
+        condition = sql.SQL('{} OR ({}) IN ({})').format(
+            condition,
+            sql.SQL(', ').join(sql.Identifier('t', c) for c in table.primary_key),
+            sql.SQL(', ').join(sql.SQL('({})').format(sql.SQL(', ').join(map(sql.Literal, row))) for row in missing),
+        )
+    changed = sql.SQL('COPY (SELECT {} FROM {} t {} WHERE {}) TO STDOUT (FORMAT binary)').format(
+        source_columns, name, sql.SQL(join), condition
+    )
+    stream_copy(source_cur, changed.as_string(source_cur), target_cur, 'COPY sync_rows FROM STDIN (FORMAT binary)')
+
+    updates = [c for c in table.columns if c not in table.primary_key]
+    on_conflict = (
+        sql.SQL('DO UPDATE SET {}').format(
+            sql.SQL(', ').join(sql.SQL('{0} = EXCLUDED.{0}').format(sql.Identifier(c)) for c in updates)
+        )
+        if updates else sql.SQL('DO NOTHING')
+    )
+    target_cur.execute(
+        sql.SQL('INSERT INTO {} ({}) SELECT {} FROM sync_rows ON CONFLICT ({}) {}').format(name, columns, columns, key, on_conflict)
+    )
+    return target_cur.rowcount, deleted
+
+
+def _create_shadow_tables(conn, tables: dict[str, Table]) -> str:
+    """Create empty unlogged copies of the tables in a fresh shadow schema and return its name."""
+    with conn.cursor() as cur:
+        cur.execute('SELECT current_schema()')
+        row = cur.fetchone()
+        assert row is not None
+        schema = row[0] + SHADOW_SCHEMA_SUFFIX
+        # Left behind by a run that was killed before it could clean up
+        cur.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE').format(sql.Identifier(schema)))
+        cur.execute(sql.SQL('CREATE SCHEMA {}').format(sql.Identifier(schema)))
+        for name in tables:
+            cur.execute(
+                sql.SQL('CREATE UNLOGGED TABLE {} (LIKE {})').format(sql.Identifier(schema, name), sql.Identifier(name))
+            )
+    conn.commit()
+    return schema
+
+
+def _drop_shadow_tables(conn, schema: str) -> None:
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL('DROP SCHEMA IF EXISTS {} CASCADE').format(sql.Identifier(schema)))
+    conn.commit()
+
+
+def _swap_in(conn, tables: dict[str, Table], schema: str) -> None:
+    """Replace the rows of every table with its shadow copy, in the connection's transaction."""
+    # Tables referenced by foreign keys can only be emptied together with their referrers
+    parents = sorted({table.parent for table in tables.values()})
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL session_replication_role = 'replica'")
+        cur.execute(sql.SQL('TRUNCATE {}').format(sql.SQL(', ').join(map(sql.Identifier, parents))))
+        for name, table in tables.items():
+            columns = sql.SQL(', ').join(map(sql.Identifier, table.columns))
+            cur.execute(
+                sql.SQL('INSERT INTO {} ({}) SELECT {} FROM {}').format(
+                    sql.Identifier(name), columns, columns, sql.Identifier(schema, name)
+                )
+            )
+        cur.execute(sql.SQL('DROP SCHEMA {} CASCADE').format(sql.Identifier(schema)))
+
+
+def _open_snapshot(url: str, snapshot: str):
+    conn = connect(url)
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    with conn.cursor() as cur:
+        cur.execute('SET TRANSACTION SNAPSHOT %s', (snapshot,))
+    return conn
+
+
+def sync_table(
+    source_url: str,
+    target_url: str,
+    snapshot: str,
+    table: Table,
+    snapshot_time: datetime,
+    since: Optional[datetime] = None,
+    verify: bool = True,
+    shadow: Optional[str] = None,
+) -> TableResult:
+    """
+    Copy one table from the source snapshot into the target and verify it.
+
+    Copies the rows changed after `since` when given. Otherwise copies all
+    rows, into the empty table of the same name in the `shadow` schema when
+    given (which is then what is verified), or in place of the table's rows.
+    The watermark of an empty table is the time the snapshot was taken.
+    """
+    start = time.monotonic()
+    source, target = _open_snapshot(source_url, snapshot), connect(target_url)
+    try:
+        with source.cursor() as source_cur, target.cursor() as target_cur:
+            target_cur.execute("SET LOCAL session_replication_role = 'replica'")
+            if since is not None:
+                copied, deleted = _copy_incremental(source_cur, target_cur, table, since)
+            elif shadow is not None:
+                copied, deleted = _copy_full(source_cur, target_cur, table, shadow), 0
+            else:
+                target_cur.execute(sql.SQL('DELETE FROM {}').format(sql.Identifier(table.name)))
+                deleted = target_cur.rowcount
+                copied = _copy_full(source_cur, target_cur, table, None)
+            target.commit()
+
+            result = TableResult(table.name, since is not None, copied, deleted, 0.0)
+            if table.incremental:
+                result.watermark = _max_watermark(source_cur, table) or snapshot_time
+            if verify:
+                result.source_count, source_checksum = _checksum(source_cur, table)
+                result.target_count, target_checksum = _checksum(target_cur, table, shadow)
+                result.verified = (result.source_count, source_checksum) == (result.target_count, target_checksum)
+                target.rollback()
+    finally:
+        source.close()
+        target.close()
+    result.seconds = time.monotonic() - start
+    return result
+
+
+def sync(
+    source_url: str,
+    target_url: str,
+    incremental: bool = False,
+    jobs: int = SYNC_JOBS,
+    verify: bool = True,
+    on_progress: Optional[Callable[[TableResult], None]] = None,
+) -> list[TableResult]:
+    """
+    Copy every table from the source database into the target.
+
+    Args:
+        source_url: libpq URL of the database to copy from
+        target_url: libpq URL of the database to copy into
+        incremental: Copy only rows changed since the last sync from this source;
+            falls back to a full sync when there is no complete earlier sync
+        jobs: Tables copied at the same time
+        verify: Compare row counts and checksums of every table afterwards
+        on_progress: Called with each table's result as it finishes
+
+    Returns:
+        list[TableResult]: One result per table, largest tables first
+
+    Raises:
+        ValueError: If the schemas differ
+        RuntimeError: If a table of a full sync fails verification; the
+            target is left unchanged, as it is when copying a table fails
+    """
+    coordinator, target = connect(source_url), connect(target_url)
+    shadow = None
+    try:
+        tables = check_compatible(coordinator, target)
+        source = source_id(coordinator)
+        watermarks = read_watermarks(target, source)
+        since: dict[str, datetime] = {}
+        if incremental:
+            overlap = timedelta(seconds=SYNC_WATERMARK_OVERLAP_SECONDS)
+            for name, table in tables.items():
+                watermark = watermarks.get(name)
+                if table.incremental and watermark is not None:
+                    since[name] = watermark - overlap
+            incremental = all(name in since for name, table in tables.items() if table.incremental)
+
+        # Holding this transaction open keeps the snapshot available to the workers
+        coordinator.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with coordinator.cursor() as cur:
+            cur.execute('SELECT pg_export_snapshot(), now()')
+            row = cur.fetchone()
+            assert row is not None
+            snapshot, snapshot_time = row
+
+        if not incremental:
+            shadow = _create_shadow_tables(target, tables)
+
+        ordered = sorted(tables.values(), key=lambda table: table.pages, reverse=True)
+        results = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    sync_table, source_url, target_url, snapshot, table, snapshot_time,
+                    since.get(table.name) if incremental else None,
+                    verify,
+                    shadow,
+                )
+                for table in ordered
+            ]
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                if on_progress is not None:
+                    on_progress(result)
+
+        if shadow is not None:
+            failed = [result.table for result in results if result.verified is False]
+            if failed:
+                raise RuntimeError(f'Verification failed for {", ".join(failed)}; the target was left unchanged')
+            _swap_in(target, tables, shadow)
+            shadow = None
+        # Commits the swap of a full sync
+        _save_watermarks(target, source, results)
+        return results
+    finally:
+        if shadow is not None:
+            _drop_shadow_tables(target, shadow)
+        coordinator.close()
+        target.close()
@@ -0,0 +1,172 @@
+"""
+Real-time note change events.
+
+A trigger on `notes` publishes every committed write on the `note_changes`
+Postgres channel. Each worker keeps one dedicated LISTEN connection per
+shard with subscribers, outside the SQLAlchemy pool, and fans the
+notifications out to the connected clients of the affected user.
+
+Every client gets a bounded queue. When a slow consumer lets its queue fill
+up, its backlog is dropped and replaced by a single `resync` event telling the
+client to refetch its notes. One slow client never blocks the others, and
+memory per connection stays bounded.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from app import metrics
+from app.database import DATABASE_URL, HOME_SHARD, shard_map
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'note_changes'
+QUEUE_SIZE = int(os.getenv('NOTE_EVENTS_QUEUE_SIZE', '100'))
+RECONNECT_DELAY_SECONDS = 1.0
+MAX_RECONNECT_DELAY_SECONDS = 30.0
+
+RESYNC_EVENT = {'op': 'resync'}
+
+connections_gauge = metrics.gauge('note_events_connections', 'Connected note event subscribers')
+delivered_counter = metrics.counter('note_events_delivered', 'Note events queued for subscribers')
+overflow_counter = metrics.counter('note_events_overflows', 'Subscriber queues reset because they were full')
+
+
+class Subscription:
+    """Bounded event queue of one connected client."""
+
+    def __init__(self, user_id: str, queue_size: int = QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, event: dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+            delivered_counter.inc()
+        except asyncio.QueueFull:
+            overflow_counter.inc()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_EVENT)
+
+    async def get(self) -> dict[str, Any]:
+        return await self.queue.get()
+
+
+class NoteEventBroker:
+    """Fans `note_changes` notifications out to subscribers per user."""
+
+    def __init__(self, dsn: str = DATABASE_URL):
+        self.dsn = dsn
+        self._subscribers: dict[str, set[Subscription]] = {}
+        self._conn: Optional[psycopg2.extensions.connection] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connect_task: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id: str) -> Subscription:
+        """Register a subscriber, starting the listener on first use."""
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        connections_gauge.inc()
+        self._ensure_listening()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+        connections_gauge.dec()
+
+    def publish(self, event: dict[str, Any]) -> None:
+        """Deliver an event to every subscriber of its user."""
+        for subscription in list(self._subscribers.get(event.get('user_id', ''), ())):
+            subscription.push(event)
+
+    def broadcast(self, event: dict[str, Any]) -> None:
+        for subscribers in list(self._subscribers.values()):
+            for subscription in list(subscribers):
+                subscription.push(event)
+
+    def _ensure_listening(self) -> None:
+        if self._conn is not None or (self._connect_task and not self._connect_task.done()):
+            return
+        self._loop = asyncio.get_running_loop()
+        self._connect_task = self._loop.create_task(self._connect())
+
+    async def _connect(self) -> None:
+        assert self._loop is not None
+        delay = RECONNECT_DELAY_SECONDS
+        while self._subscribers:
+            try:
+                conn = await self._loop.run_in_executor(None, self._open_listen_connection)
+            except psycopg2.Error:
+                logger.exception('Could not open %s listener, retrying in %.0fs', CHANNEL, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+                continue
+            self._conn = conn
+            self._loop.add_reader(conn.fileno(), self._on_readable)
+            return
+
+    def _open_listen_connection(self) -> psycopg2.extensions.connection:
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return conn
+
+    def _on_readable(self) -> None:
+        conn = self._conn
+        if conn is None:
+            return
+        try:
+            conn.poll()
+        except psycopg2.Error:
+            logger.exception('Lost %s listener connection', CHANNEL)
+            self._disconnect()
+            # Notifications may have been missed while reconnecting
+            self.broadcast(RESYNC_EVENT)
+            self._ensure_listening()
+            return
+
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                logger.warning('Ignoring malformed %s payload: %r', CHANNEL, notify.payload)
+                continue
+            self.publish(event)
+
+        if not self._subscribers:
+            self._disconnect()
+
+    def _disconnect(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._loop is not None:
+            self._loop.remove_reader(conn.fileno())
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+broker = NoteEventBroker()
+_shard_brokers: dict[int, NoteEventBroker] = {HOME_SHARD: broker}
+
+
+def broker_for(shard: int) -> NoteEventBroker:
+    """Broker of the shard a user's notes are on; each shard notifies about its own users."""
+    if shard not in _shard_brokers:
+        _shard_brokers[shard] = NoteEventBroker(shard_map.url(shard))
+    return _shard_brokers[shard]
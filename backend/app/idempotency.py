@@ -0,0 +1,196 @@
+"""
+Idempotency-Key support for non-idempotent POST endpoints.
+
+A client that times out can retry a request with the same `Idempotency-Key`
+header and get the original response back instead of creating a duplicate.
+
+The key is claimed by inserting its row in the request's own transaction and
+the response is written to the same row before commit. So:
+
+- a retry after the commit finds the stored response and replays it without
+  touching anything else;
+- a concurrent duplicate blocks on the uncommitted row until the original
+  request commits (then replays its response) or rolls back (then runs
+  itself), waiting at most IDEMPOTENCY_WAIT_TIMEOUT_MS before giving up
+  with 409;
+- failed requests roll the key back with everything else, so only
+  successful responses are stored.
+
+Rows hold a hash of the key rather than the key itself and expire after
+IDEMPOTENCY_TTL_SECONDS. Expired rows are reused on conflict and deleted in
+small batches by whichever request records a response next. Keys scoped to a
+user record the user's ID, so they move to another shard with the user.
+"""
+import hashlib
+import hmac
+import os
+import time
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.auth.security import SECRET_KEY
+from app.models.idempotency_key import IdempotencyKey
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+WAIT_TIMEOUT_MS = int(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT_MS', '10000'))
+PURGE_INTERVAL_SECONDS = 60.0
+PURGE_BATCH_SIZE = 1000
+
+LOCK_NOT_AVAILABLE = '55P03'
+
+replays_counter = metrics.counter('idempotency_replays', 'Responses replayed for a repeated Idempotency-Key')
+conflicts_counter = metrics.counter('idempotency_conflicts', 'Idempotency-Key requests rejected as in progress or mismatched')
+
+_last_purge = 0.0
+
+
+def key_hash(scope: str, key: str) -> bytes:
+    """Fixed-size row key for an Idempotency-Key within a scope (endpoint and user)."""
+    return hashlib.sha256(f'{scope}\0{key}'.encode('utf-8')).digest()
+
+
+def request_hash(body: BaseModel) -> bytes:
+    """Keyed digest of a request body; keyed because bodies may contain passwords."""
+    return hmac.new(SECRET_KEY.encode('utf-8'), body.model_dump_json().encode('utf-8'), hashlib.sha256).digest()
+
+
+def _claim(db: Session, row_key: bytes, row_request: bytes, user_id: Optional[str]) -> Optional[IdempotencyKey]:
+    db.execute(text(f'SET LOCAL lock_timeout = {WAIT_TIMEOUT_MS}'))
+    stmt = insert(IdempotencyKey).values(
+        key_hash=row_key,
+        request_hash=row_request,
+        expires_at=func.now() + timedelta(seconds=TTL_SECONDS),
+        user_id=user_id,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key_hash],
+        set_={
+            'request_hash': stmt.excluded.request_hash,
+            'status_code': None,
+            'response_body': None,
+            'expires_at': stmt.excluded.expires_at,
+            'user_id': stmt.excluded.user_id,
+        },
+        where=IdempotencyKey.expires_at < func.now(),
+    ).returning(IdempotencyKey.key_hash)
+    claimed = db.execute(stmt).scalar() is not None
+    db.execute(text('SET LOCAL lock_timeout TO DEFAULT'))
+    if claimed:
+        return None
+    return db.execute(select(IdempotencyKey).where(IdempotencyKey.key_hash == row_key)).scalar_one()
+
+
+async def claim(
+    db: Session, scope: str, key: str, body: BaseModel, user_id: Optional[str] = None
+) -> Optional[Response]:
+    """
+    Claim an Idempotency-Key in the session's transaction.
+
+    Must be called before the request does any work. Waiting for a concurrent
+    duplicate runs in the threadpool so it does not block the event loop.
+
+    Args:
+        db: Database session of the request
+        scope: Namespace of the key, e.g. the endpoint and user
+        key: Value of the Idempotency-Key header
+        body: Parsed request body
+        user_id: User the key belongs to, if the scope is a user's
+
+    Returns:
+        Optional[Response]: The stored response to replay, or None if the
+        caller should handle the request and then call `record`
+
+    Raises:
+        HTTPException: 400 if the key is empty or too long
+        HTTPException: 409 if the same key is still being processed
+        HTTPException: 422 if the key was used with a different request body
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters',
+        )
+
+    row_request = request_hash(body)
+    try:
+        stored = await run_in_threadpool(_claim, db, key_hash(scope, key), row_request, user_id)
+    except OperationalError as e:
+        if getattr(e.orig, 'pgcode', None) != LOCK_NOT_AVAILABLE:
+            raise
+        db.rollback()
+        conflicts_counter.inc()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='A request with this Idempotency-Key is still in progress',
+        )
+
+    if stored is None:
+        return None
+    if not hmac.compare_digest(stored.request_hash, row_request):
+        conflicts_counter.inc()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail='Idempotency-Key was already used with a different request',
+        )
+    if stored.status_code is None:
+        conflicts_counter.inc()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='A request with this Idempotency-Key is still in progress',
+        )
+
+    replays_counter.inc()
+    return Response(
+        content=stored.response_body,
+        status_code=stored.status_code,
+        media_type='application/json',
+        headers={REPLAYED_HEADER: 'true'},
+    )
+
+
+def record(db: Session, scope: str, key: str, status_code: int, response: BaseModel) -> None:
+    """
+    Store the response of a claimed key; it becomes visible when the caller commits.
+
+    Args:
+        db: Database session of the request
+        scope: Namespace passed to `claim`
+        key: Value of the Idempotency-Key header
+        status_code: Status code of the response
+        response: Response body
+    """
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key_hash == key_hash(scope, key))
+        .values(status_code=status_code, response_body=response.model_dump_json().encode('utf-8'))
+    )
+    _purge_expired(db)
+
+
+def _purge_expired(db: Session) -> None:
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = now
+    db.execute(
+        text(
+            'DELETE FROM idempotency_keys WHERE key_hash IN ('
+            '  SELECT key_hash FROM idempotency_keys WHERE expires_at < now()'
+            '  LIMIT :limit FOR UPDATE SKIP LOCKED'
+            ')'
+        ),
+        {'limit': PURGE_BATCH_SIZE},
+    )
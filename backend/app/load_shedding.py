@@ -0,0 +1,279 @@
+"""
+Adaptive concurrency limiting and readiness.
+
+Each worker admits at most `limit` requests at a time and answers the rest
+immediately with 503 and Retry-After, instead of queueing them behind an
+exhausted connection pool until they time out.
+
+The limit adapts with AIMD, driven by how long requests wait to check out a
+pooled database connection:
+
+- a request that waited longer than LOAD_POOL_WAIT_TARGET_MS, or timed out,
+  multiplies the limit by LOAD_LIMIT_BACKOFF (at most once per
+  LOAD_DECREASE_COOLDOWN_SECONDS, so one burst is one decrease);
+- otherwise a request that completed while the worker was near its limit
+  adds 1/limit, i.e. about one slot per limit's worth of requests.
+
+Requests are admitted by priority class. Health, readiness and metrics
+probes are never shed or counted, and neither are event streams, which hold
+no connection while open. Auth requests may exceed the limit by
+LOAD_AUTH_HEADROOM so users can still log in and refresh tokens while other
+traffic is being shed.
+
+`readiness` backs the `/ready` endpoint: not ready when the pool of any
+shard's database is fully checked out or that database cannot be reached.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from app import metrics
+
+LIMIT_INITIAL = float(os.getenv('LOAD_LIMIT_INITIAL', '32'))
+LIMIT_MIN = float(os.getenv('LOAD_LIMIT_MIN', '4'))
+LIMIT_MAX = float(os.getenv('LOAD_LIMIT_MAX', '256'))
+LIMIT_BACKOFF = float(os.getenv('LOAD_LIMIT_BACKOFF', '0.9'))
+POOL_WAIT_TARGET_MS = float(os.getenv('LOAD_POOL_WAIT_TARGET_MS', '50'))
+DECREASE_COOLDOWN_SECONDS = float(os.getenv('LOAD_DECREASE_COOLDOWN_SECONDS', '1'))
+AUTH_HEADROOM = float(os.getenv('LOAD_AUTH_HEADROOM', '0.25'))
+RETRY_AFTER_SECONDS = int(os.getenv('LOAD_RETRY_AFTER_SECONDS', '1'))
+
+# Near the limit means at least this share of it was in use
+NEAR_LIMIT_RATIO = 0.8
+
+PRIORITY_CRITICAL = 'critical'
+PRIORITY_AUTH = 'auth'
+PRIORITY_DEFAULT = 'default'
+
+CRITICAL_PATHS = frozenset({'/', '/health', '/ready', '/metrics'})
+EXEMPT_PREFIXES = ('/api/events', '/debug/')
+AUTH_PREFIXES = ('/api/auth',)
+
+limit_gauge = metrics.gauge('concurrency_limit', 'Adaptive limit of concurrent requests in this worker')
+in_flight_gauge = metrics.gauge('requests_in_flight', 'Requests counted against the concurrency limit')
+shed_counter = metrics.counter('requests_shed', 'Requests rejected with 503 by the concurrency limit')
+pool_wait_histogram = metrics.histogram('db_pool_wait_seconds', 'Time to check out a pooled database connection')
+pool_timeout_counter = metrics.counter('db_pool_timeouts', 'Connection checkouts that timed out')
+
+
+class _RequestLoad:
+    __slots__ = ('pool_wait', 'pool_timeout')
+
+    def __init__(self):
+        self.pool_wait = 0.0
+        self.pool_timeout = False
+
+
+_request_load: contextvars.ContextVar[Optional[_RequestLoad]] = contextvars.ContextVar('request_load', default=None)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited, per request."""
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        # Negative means unbounded, as does a pool size of 0 in QueuePool
+        self.max_overflow = -1 if pool_size == 0 else max_overflow
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            pool_timeout_counter.inc()
+            load = _request_load.get()
+            if load is not None:
+                load.pool_timeout = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            pool_wait_histogram.observe(waited)
+            load = _request_load.get()
+            if load is not None:
+                load.pool_wait += waited
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(
+        self,
+        initial: float = LIMIT_INITIAL,
+        minimum: float = LIMIT_MIN,
+        maximum: float = LIMIT_MAX,
+        backoff: float = LIMIT_BACKOFF,
+        cooldown: float = DECREASE_COOLDOWN_SECONDS,
+    ):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        limit_gauge.set(self.limit)
+
+    def try_acquire(self, headroom: float = 0.0) -> Optional[int]:
+        """Admit a request if in-flight stays within limit * (1 + headroom); returns in-flight at admission."""
+        with self._lock:
+            if self.in_flight >= int(self.limit * (1 + headroom)):
+                return None
+            self.in_flight += 1
+            in_flight_gauge.set(self.in_flight)
+            return self.in_flight
+
+    def release(self, in_flight_at_start: int, congested: bool) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            in_flight_gauge.set(self.in_flight)
+            now = time.monotonic()
+            if congested:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif in_flight_at_start >= self.limit * NEAR_LIMIT_RATIO:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            limit_gauge.set(self.limit)
+
+
+concurrency_limiter = AIMDLimiter()
+
+
+def priority(path: str) -> str:
+    """Priority class of a request path; critical requests are not limited at all."""
+    if path in CRITICAL_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return PRIORITY_CRITICAL
+    if path.startswith(AUTH_PREFIXES):
+        return PRIORITY_AUTH
+    return PRIORITY_DEFAULT
+
+
+class ConcurrencyLimitMiddleware:
+    """ASGI middleware shedding requests beyond the adaptive concurrency limit."""
+
+    def __init__(self, app, limiter: Optional[AIMDLimiter] = None):
+        self.app = app
+        self.limiter = limiter or concurrency_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_priority = priority(scope['path'])
+        if request_priority == PRIORITY_CRITICAL:
+            await self.app(scope, receive, send)
+            return
+
+        headroom = AUTH_HEADROOM if request_priority == PRIORITY_AUTH else 0.0
+        in_flight = self.limiter.try_acquire(headroom)
+        if in_flight is None:
+            shed_counter.inc()
+            await self._shed(send)
+            return
+
+        load = _RequestLoad()
+        token = _request_load.set(load)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_load.reset(token)
+            congested = load.pool_timeout or load.pool_wait * 1000 > POOL_WAIT_TARGET_MS
+            self.limiter.release(in_flight, congested)
+
+    @staticmethod
+    async def _shed(send) -> None:
+        body = json.dumps({'detail': 'Server is overloaded, please retry later'}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(RETRY_AFTER_SECONDS).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def pool_status(engine: Engine) -> Optional[dict[str, Any]]:
+    """
+    Usage of the engine's pool, or None for pools other than TimedQueuePool.
+
+    `capacity` and `saturation` are None when the pool's overflow is unbounded.
+    """
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return None
+    checked_out = pool.checkedout()
+    capacity = saturation = None
+    if pool.max_overflow >= 0:
+        capacity = pool.size() + pool.max_overflow
+        saturation = round(checked_out / capacity, 3) if capacity else 1.0
+    return {
+        'size': pool.size(),
+        'overflow': max(pool.overflow(), 0),
+        'capacity': capacity,
+        'checked_out': checked_out,
+        'saturation': saturation,
+        'wait_p95_ms': round(pool_wait_histogram.percentile(0.95) * 1000, 2),
+        'timeouts': pool_timeout_counter.value,
+    }
+
+
+def _probe(engine: Engine) -> tuple[str, Optional[dict[str, Any]]]:
+    pool = pool_status(engine)
+    if pool is not None and pool['capacity'] is not None and pool['checked_out'] >= pool['capacity']:
+        return 'unknown', pool
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        return 'ok', pool
+    except Exception:
+        return 'unreachable', pool
+
+
+def readiness(engines: Sequence[Engine], limiter: Optional[AIMDLimiter] = None) -> tuple[bool, dict[str, Any]]:
+    """
+    Report whether this worker should receive traffic.
+
+    Every shard's database is probed, each only when a pooled connection to
+    it is free, so the probe never waits behind a saturated pool. The worker
+    is ready only when all of them answer.
+
+    Args:
+        engines: Engines of every shard, the home shard first
+        limiter: Limiter whose state is added to the report
+
+    Returns:
+        tuple[bool, dict]: Ready flag and a report of pool and database state;
+        `database` is the first state other than "ok" of any shard, `pool`
+        the home shard's, and `shards` lists both per shard when there are
+        several
+    """
+    probes = [_probe(engine) for engine in engines]
+    database = next((state for state, _ in probes if state != 'ok'), 'ok')
+
+    report: dict[str, Any] = {
+        'status': 'ready' if database == 'ok' else 'not_ready',
+        'database': database,
+        'pool': probes[0][1],
+    }
+    if len(probes) > 1:
+        report['shards'] = [{'database': state, 'pool': pool} for state, pool in probes]
+    if limiter is not None:
+        report['concurrency'] = {
+            'limit': round(limiter.limit, 2),
+            'in_flight': limiter.in_flight,
+            'shed': shed_counter.value,
+        }
+    return database == 'ok', report
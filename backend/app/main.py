@@ -1,16 +1,43 @@
+import hmac
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
 
+from app import memory_diagnostics, metrics
 from app.api.routes import router as api_router
+from app.database import shard_map
+from app.load_shedding import ConcurrencyLimitMiddleware, concurrency_limiter, readiness
+from app.profiling import ProfilingMiddleware
+from app.startup import openapi_json, warm_up
+from app.tracing import TracingMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the worker before it accepts requests (see app/startup.py)"""
+    await warm_up(app)
+    yield
+
 
 app = FastAPI(
     title="Test Fullstack Template API",
     description="REST API for Test Fullstack Template application",
     version="0.1.0",
-    debug=True  # Enable debug mode to show stack traces in development
+    debug=True,  # Enable debug mode to show stack traces in development
+    lifespan=lifespan,
+    # Served below from the schema serialized once at startup
+    openapi_url=None,
+    docs_url=None,
+    redoc_url=None,
 )
 
+# Shed load beyond the adaptive concurrency limit; inside CORS so 503s carry CORS headers
+app.add_middleware(ConcurrencyLimitMiddleware)
+
 # Configure CORS
 # Get CORS origins from environment variable, fallback to localhost for development
 cors_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://localhost:3000")
@@ -24,10 +51,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Trace every request: Server-Timing header plus sampled JSON-lines traces
+app.add_middleware(TracingMiddleware)
+
+# Profile individual requests on demand; a no-op unless PROFILE_TOKEN is set
+app.add_middleware(ProfilingMiddleware)
+
 # Include API routes
 app.include_router(api_router)
 
 
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_schema():
+    """OpenAPI schema, serialized once per worker"""
+    return Response(openapi_json(app), media_type="application/json")
+
+
+@app.get("/docs", include_in_schema=False)
+async def swagger_ui():
+    return get_swagger_ui_html(
+        openapi_url="/openapi.json",
+        title=f"{app.title} - Swagger UI",
+        oauth2_redirect_url="/docs/oauth2-redirect",
+    )
+
+
+@app.get("/docs/oauth2-redirect", include_in_schema=False)
+async def swagger_ui_redirect():
+    return get_swagger_ui_oauth2_redirect_html()
+
+
+@app.get("/redoc", include_in_schema=False)
+async def redoc():
+    return get_redoc_html(openapi_url="/openapi.json", title=f"{app.title} - ReDoc")
+
+
 @app.get("/")
 async def root():
     """Root endpoint - health check"""
@@ -38,3 +96,89 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    """Readiness probe - 503 when a shard's database is unreachable or its connection pool is saturated"""
+    ready, report = readiness(shard_map.engines, concurrency_limiter)
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return report
+
+
+@app.get("/metrics")
+async def metrics_snapshot():
+    """In-process metrics for this worker"""
+    return metrics.snapshot()
+
+
+def require_diagnostics_token(x_diagnostics_token: Optional[str] = Header(default=None)):
+    """Hide the diagnostics endpoints unless DIAGNOSTICS_TOKEN is set, and require it"""
+    if not memory_diagnostics.DIAGNOSTICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_diagnostics_token is None or not hmac.compare_digest(
+        x_diagnostics_token.encode(), memory_diagnostics.DIAGNOSTICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid diagnostics token")
+
+
+diagnostics = APIRouter(include_in_schema=False, dependencies=[Depends(require_diagnostics_token)])
+
+
+@diagnostics.get("/debug/memory")
+def memory_overview():
+    """Memory use, garbage collector and tracemalloc state of this worker"""
+    return {
+        **memory_diagnostics.process_info(),
+        "gc": memory_diagnostics.gc_stats(),
+        "tracemalloc": memory_diagnostics.tracemalloc_status(),
+    }
+
+
+@diagnostics.post("/debug/memory/tracemalloc/start")
+def start_tracemalloc(frames: int = Query(default=1, ge=1, le=100)):
+    """Start tracing allocations in this worker, keeping `frames` frames per allocation"""
+    return {**memory_diagnostics.process_info(), **memory_diagnostics.start(frames)}
+
+
+@diagnostics.post("/debug/memory/tracemalloc/stop")
+def stop_tracemalloc():
+    """Stop tracing allocations in this worker and drop its snapshots"""
+    return {**memory_diagnostics.process_info(), **memory_diagnostics.stop()}
+
+
+@diagnostics.post("/debug/memory/snapshots", status_code=status.HTTP_201_CREATED)
+def take_memory_snapshot():
+    """Snapshot the traced allocations of this worker"""
+    try:
+        snapshot = memory_diagnostics.take_snapshot()
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {**memory_diagnostics.process_info(), **snapshot}
+
+
+@diagnostics.get("/debug/memory/snapshots/{base}/diff")
+def diff_memory_snapshots(
+    base: int,
+    target: Optional[int] = None,
+    group_by: str = Query(default="lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(default=25, ge=1, le=500),
+):
+    """Allocation growth since snapshot `base`, up to snapshot `target` or now, by file and line"""
+    try:
+        result = memory_diagnostics.diff(base, target, group_by, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {**memory_diagnostics.process_info(), **result}
+
+
+@diagnostics.get("/debug/memory/objects")
+def memory_object_counts(limit: int = Query(default=50, ge=1, le=1000), collect: bool = False):
+    """Most common object types in this worker, optionally after a full garbage collection"""
+    return {**memory_diagnostics.process_info(), **memory_diagnostics.object_counts(limit, collect)}
+
+
+app.include_router(diagnostics)
@@ -0,0 +1,199 @@
+"""
+Live memory diagnostics for one worker process.
+
+Exposed by the `/debug/memory` endpoints in `app.main` to callers presenting
+the secret DIAGNOSTICS_TOKEN in the `X-Diagnostics-Token` header; they do not
+exist (404) when it is not set. Every response carries the worker's pid, since
+each uvicorn worker has its own heap and a load balancer picks the worker.
+
+To find what makes a worker grow, start tracemalloc, take a snapshot, let
+traffic run, and diff a later snapshot against it: the diff lists the
+file:line locations (or files) whose allocations grew the most, e.g. the
+session identity map in SQLAlchemy or model construction in Pydantic. Object
+type counts from the garbage collector answer the same question by type
+without the tracing overhead. tracemalloc slows allocations down noticeably
+and its own bookkeeping takes memory, so stop it when done.
+
+Snapshots are kept in memory, at most MEMORY_SNAPSHOT_LIMIT per worker, the
+oldest dropped first.
+"""
+import gc
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Optional
+
+DIAGNOSTICS_TOKEN = os.getenv('DIAGNOSTICS_TOKEN', '')
+MEMORY_SNAPSHOT_LIMIT = int(os.getenv('MEMORY_SNAPSHOT_LIMIT', '5'))
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Allocations made by the diagnostics themselves
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+@dataclass
+class _Snapshot:
+    id: int
+    taken_at: float
+    snapshot: tracemalloc.Snapshot
+
+    def summary(self) -> dict[str, Any]:
+        traces = self.snapshot.statistics('filename')
+        return {
+            'id': self.id,
+            'taken_at': self.taken_at,
+            'size': sum(stat.size for stat in traces),
+            'count': sum(stat.count for stat in traces),
+        }
+
+
+_snapshots: dict[int, _Snapshot] = {}
+_next_id = 1
+_lock = threading.Lock()
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, where /proc is available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def process_info() -> dict[str, Any]:
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        'pid': os.getpid(),
+        'rss_bytes': rss_bytes(),
+        'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def tracemalloc_status() -> dict[str, Any]:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    return {
+        'tracing': tracing,
+        'frames': tracemalloc.get_traceback_limit() if tracing else 0,
+        'traced_bytes': current,
+        'traced_peak_bytes': peak,
+        'overhead_bytes': tracemalloc.get_tracemalloc_memory() if tracing else 0,
+        'snapshots': [snapshot.summary() for snapshot in _snapshots.values()],
+    }
+
+
+def start(frames: int = 1) -> dict[str, Any]:
+    """Start tracing allocations with `frames` frames per traceback; restarts if the depth differs."""
+    if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+        stop()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracemalloc_status()
+
+
+def stop() -> dict[str, Any]:
+    """Stop tracing and drop all snapshots."""
+    with _lock:
+        _snapshots.clear()
+    tracemalloc.stop()
+    return tracemalloc_status()
+
+
+def _take() -> tracemalloc.Snapshot:
+    if not tracemalloc.is_tracing():
+        raise RuntimeError('tracemalloc is not running')
+    return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+
+def take_snapshot() -> dict[str, Any]:
+    """Take and keep a snapshot of the traced allocations; RuntimeError unless tracing."""
+    global _next_id
+    snapshot = _take()
+    with _lock:
+        kept = _Snapshot(id=_next_id, taken_at=time.time(), snapshot=snapshot)
+        _next_id += 1
+        _snapshots[kept.id] = kept
+        while len(_snapshots) > max(1, MEMORY_SNAPSHOT_LIMIT):
+            del _snapshots[min(_snapshots)]
+    return kept.summary()
+
+
+def _stat(stat, group_by: str) -> dict[str, Any]:
+    frame = stat.traceback[0]
+    entry: dict[str, Any] = {
+        'file': frame.filename,
+        'size': stat.size,
+        'size_diff': stat.size_diff,
+        'count': stat.count,
+        'count_diff': stat.count_diff,
+    }
+    if group_by != 'filename':
+        entry['line'] = frame.lineno
+    if group_by == 'traceback':
+        entry['traceback'] = [f'{f.filename}:{f.lineno}' for f in stat.traceback]
+    return entry
+
+
+def diff(base: int, target: Optional[int] = None, group_by: str = 'lineno', limit: int = 25) -> dict[str, Any]:
+    """
+    Allocation growth from snapshot `base` to snapshot `target` (or now).
+
+    Locations are ordered by how much their allocated size grew. Raises
+    ValueError for unknown snapshots or groupings, and RuntimeError when
+    diffing against now without tracemalloc running.
+    """
+    if group_by not in GROUP_BY:
+        raise ValueError(f'group_by must be one of {", ".join(GROUP_BY)}')
+    with _lock:
+        old = _snapshots.get(base)
+        new = _snapshots.get(target) if target is not None else None
+    if old is None or (target is not None and new is None):
+        raise ValueError(f'Unknown snapshot {base if old is None else target}')
+
+    stats = (new.snapshot if new is not None else _take()).compare_to(old.snapshot, group_by)
+    return {
+        'base': base,
+        'target': target,
+        'group_by': group_by,
+        'size_diff': sum(stat.size_diff for stat in stats),
+        'count_diff': sum(stat.count_diff for stat in stats),
+        'top': [_stat(stat, group_by) for stat in stats[:limit]],
+    }
+
+
+def gc_stats() -> dict[str, Any]:
+    return {
+        'counts': gc.get_count(),
+        'thresholds': gc.get_threshold(),
+        'generations': gc.get_stats(),
+        'garbage': len(gc.garbage),
+        'tracked_objects': len(gc.get_objects()),
+    }
+
+
+def object_counts(limit: int = 50, collect: bool = False) -> dict[str, Any]:
+    """
+    Most common types among the objects tracked by the garbage collector.
+
+    Only containers are tracked, so e.g. str and int objects are not counted.
+    With `collect`, unreachable objects are collected first, so that what
+    remains is actually held on to.
+    """
+    collected = gc.collect() if collect else None
+    counts = Counter(f'{type(obj).__module__}.{type(obj).__qualname__}' for obj in gc.get_objects())
+    return {
+        'collected': collected,
+        'total': sum(counts.values()),
+        'types': [{'type': name, 'count': count} for name, count in counts.most_common(limit)],
+    }
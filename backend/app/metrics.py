@@ -0,0 +1,135 @@
+"""
+Minimal in-process metrics registry.
+
+Counters and histograms are kept per worker process and exposed as JSON
+through the `/metrics` endpoint in `app.main`.
+"""
+import threading
+from collections import deque
+from typing import Any
+
+HISTOGRAM_WINDOW = 1024
+
+
+class Counter:
+    """Monotonically increasing counter."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {'type': 'counter', 'description': self.description, 'value': self._value}
+
+
+class Gauge:
+    """Value that can go up and down."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {'type': 'gauge', 'description': self.description, 'value': self._value}
+
+
+class Histogram:
+    """Observation count and sum plus percentiles over a sliding window."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._count = 0
+        self._sum = 0.0
+        self._window: deque[float] = deque(maxlen=HISTOGRAM_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            self._window.append(value)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            values = sorted(self._window)
+        if not values:
+            return 0.0
+        index = min(len(values) - 1, int(q * len(values)))
+        return values[index]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            'type': 'histogram',
+            'description': self.description,
+            'count': self._count,
+            'sum': self._sum,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+_registry: dict[str, Counter | Gauge | Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, description: str):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, description)
+            _registry[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f'Metric {name} already registered as {type(metric).__name__}')
+        return metric
+
+
+def counter(name: str, description: str = '') -> Counter:
+    """Get or create a counter."""
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name: str, description: str = '') -> Gauge:
+    """Get or create a gauge."""
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name: str, description: str = '') -> Histogram:
+    """Get or create a histogram."""
+    return _get_or_create(Histogram, name, description)
+
+
+def snapshot() -> dict[str, dict[str, Any]]:
+    """Return the current value of every registered metric."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
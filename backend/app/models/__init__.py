@@ -7,5 +7,10 @@ class Base(DeclarativeBase):
 
 from .user import User
 from .note import Note
+from .note_body import NoteBody
+from .user_note_stats import UserNoteStats
+from .idempotency_key import IdempotencyKey
+from .archived_note import ArchivedNote
+from .user_directory import UserDirectoryEntry
 
-__all__ = ['Base', 'User', 'Note']
+__all__ = ['Base', 'User', 'Note', 'NoteBody', 'UserNoteStats', 'IdempotencyKey', 'ArchivedNote', 'UserDirectoryEntry']
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+from sqlalchemy import String, Integer, LargeBinary, DateTime, ForeignKey, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.compression import decompress
+from app.models import Base
+
+
+class ArchivedNote(Base):
+    """A note not updated for a long time, moved out of `notes` with its body compressed."""
+
+    __tablename__ = "archived_notes"
+
+    id: Mapped[str] = mapped_column(Uuid(as_uuid=False), primary_key=True)
+    user_id: Mapped[str] = mapped_column(
+        Uuid(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    title: Mapped[str] = mapped_column(String, nullable=False)
+    codec: Mapped[str] = mapped_column(String, nullable=False)
+    raw_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    date_created: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    date_updated: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    date_archived: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+    @property
+    def content(self) -> str:
+        return decompress(self.data, self.codec).decode("utf-8")
@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DateTime, ForeignKey, LargeBinary, SmallInteger, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models import Base
+
+
+class IdempotencyKey(Base):
+    """Stored response of a request made with an Idempotency-Key header."""
+
+    __tablename__ = "idempotency_keys"
+
+    # SHA-256 of the key and its scope, so rows are fixed-size whatever the client sends
+    key_hash: Mapped[bytes] = mapped_column(LargeBinary, primary_key=True)
+    # HMAC of the request body, to reject a key reused for a different request
+    request_hash: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    status_code: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)
+    response_body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    # Owner of a key scoped to a user, moved with the user's other rows between shards
+    user_id: Mapped[Optional[str]] = mapped_column(
+        Uuid(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True
+    )
@@ -1,20 +1,41 @@
 from __future__ import annotations
 
+import os
+import time
 from datetime import datetime, timezone
-from sqlalchemy import String, DateTime, Text, ForeignKey
-from sqlalchemy.orm import Mapped, mapped_column
-
+from typing import Optional
+from sqlalchemy import String, DateTime, Text, ForeignKey, Boolean, Integer, Uuid, false
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from app import metrics
+from app.compression import DEFAULT_CODEC, compress
 from app.models import Base
+from app.models.note_body import NoteBody
+
+# Bodies larger than this many UTF-8 bytes are compressed into `note_bodies`
+NOTE_BODY_EXTERNAL_THRESHOLD = int(os.getenv('NOTE_BODY_EXTERNAL_THRESHOLD', '4096'))
+
+compression_ratio = metrics.histogram(
+    'note_body_compression_ratio', 'Raw size divided by compressed size of external note bodies'
+)
+body_load_seconds = metrics.histogram(
+    'note_body_load_seconds', 'Time to fetch and decompress an external note body'
+)
 
 
 class Note(Base):
     __tablename__ = "notes"
 
-    id: Mapped[str] = mapped_column(String, primary_key=True)
+    id: Mapped[str] = mapped_column(Uuid(as_uuid=False), primary_key=True)
     title: Mapped[str] = mapped_column(String, nullable=False)
-    content: Mapped[str] = mapped_column(Text, nullable=False, default="")
-    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), nullable=False)
+    # Only loaded on first access so metadata-only queries skip the body
+    inline_content: Mapped[str] = mapped_column("content", Text, nullable=False, default="", deferred=True)
+    has_external_body: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
+    # UTF-8 size of the body, summed into user_note_stats by a trigger
+    content_size: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    user_id: Mapped[str] = mapped_column(Uuid(as_uuid=False), ForeignKey("users.id"), nullable=False)
     date_created: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         nullable=False,
@@ -26,3 +47,44 @@ class Note(Base):
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc)
     )
+
+    body: Mapped[Optional[NoteBody]] = relationship(
+        uselist=False,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    @property
+    def content(self) -> str:
+        """The note body, read from `note_bodies` when stored externally."""
+        if not self.has_external_body:
+            return self.inline_content
+
+        start = time.perf_counter()
+        body = self.body
+        text = body.text if body is not None else ""
+        body_load_seconds.observe(time.perf_counter() - start)
+        return text
+
+    @content.setter
+    def content(self, value: str) -> None:
+        raw = value.encode("utf-8")
+        self.content_size = len(raw)
+        if len(raw) <= NOTE_BODY_EXTERNAL_THRESHOLD:
+            if self.has_external_body:
+                self.body = None
+            self.has_external_body = False
+            self.inline_content = value
+            return
+
+        data = compress(raw, DEFAULT_CODEC)
+        compression_ratio.observe(len(raw) / max(len(data), 1))
+
+        if self.has_external_body and self.body is not None:
+            self.body.codec = DEFAULT_CODEC
+            self.body.raw_size = len(raw)
+            self.body.data = data
+        else:
+            self.body = NoteBody(codec=DEFAULT_CODEC, raw_size=len(raw), data=data)
+        self.has_external_body = True
+        self.inline_content = ""
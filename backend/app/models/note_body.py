@@ -0,0 +1,20 @@
+from sqlalchemy import String, Integer, LargeBinary, ForeignKey, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.compression import decompress
+from app.models import Base
+
+
+class NoteBody(Base):
+    """Compressed body of a note too large to be stored inline in `notes`."""
+
+    __tablename__ = "note_bodies"
+
+    note_id: Mapped[str] = mapped_column(Uuid(as_uuid=False), ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True)
+    codec: Mapped[str] = mapped_column(String, nullable=False)
+    raw_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    @property
+    def text(self) -> str:
+        return decompress(self.data, self.codec).decode("utf-8")
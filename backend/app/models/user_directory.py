@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import DateTime, Integer, String, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models import Base
+
+
+class UserDirectoryEntry(Base):
+    """Email and shard of every user, kept on the home shard only (see `app.sharding`)."""
+
+    __tablename__ = "user_directory"
+
+    user_id: Mapped[str] = mapped_column(Uuid(as_uuid=False), primary_key=True)
+    email: Mapped[str] = mapped_column(String, unique=True, index=True)
+    shard: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Set while `move_user` copies the user to this shard; writes are refused meanwhile
+    moving_to: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    date_created: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc)
+    )
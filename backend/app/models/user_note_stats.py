@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models import Base
+
+
+class UserNoteStats(Base):
+    """Per-user note aggregates, maintained by a trigger on `notes`."""
+
+    __tablename__ = "user_note_stats"
+
+    user_id: Mapped[str] = mapped_column(
+        Uuid(as_uuid=False), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    note_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    total_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    last_modified: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Incremented on every write to the user's notes
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
@@ -0,0 +1,243 @@
+"""
+Cold tier for notes that have not been updated for a long time.
+
+`archive` moves notes whose `date_updated` is older than a cutoff from
+`notes` into `archived_notes`, so listings and the per-user index on `notes`
+only cover notes that are actually in use. Each batch is its own transaction
+and removes the notes it moved, so an interrupted run is resumed simply by
+running it again. Bodies are stored compressed; bodies already compressed in
+`note_bodies` are moved as they are.
+
+Archived notes are left out of listings and of `user_note_stats`, which the
+triggers on `notes` keep in step as notes move in and out (bumping the
+collection version, so cached listings are invalidated). `get_note` falls
+back to the archive, and updating an archived note first restores it into
+`notes`. Moving notes between the tiers publishes no change events.
+"""
+import os
+from datetime import datetime
+from typing import Callable, Optional, Sequence
+
+from sqlalchemy import Connection, Row, text
+from sqlalchemy.orm import Session
+
+from app import metrics
+from app.compression import DEFAULT_CODEC, compress, decompress
+from app.models.archived_note import ArchivedNote
+from app.models.note import NOTE_BODY_EXTERNAL_THRESHOLD
+
+NOTE_ARCHIVE_AFTER_DAYS = int(os.getenv('NOTE_ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_BATCH_SIZE = 500
+
+_ARCHIVED_COLUMNS = 'id, user_id, title, codec, raw_size, data, date_created, date_updated'
+
+archived_counter = metrics.counter('notes_archived', 'Notes moved to the archive')
+restored_counter = metrics.counter('notes_restored', 'Archived notes moved back to notes')
+
+
+def _suppress_notifications(conn: Connection, suppress: bool) -> None:
+    # Read by the notes_notify_change trigger, for the current transaction only
+    conn.execute(
+        text("SELECT set_config('app.note_archival', :value, true)"),
+        {'value': 'on' if suppress else 'off'},
+    )
+
+
+def archive_batch(conn: Connection, cutoff: datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move up to `batch_size` notes last updated before `cutoff` into the archive.
+
+    Runs in the caller's transaction. Notes locked by a concurrent write are
+    skipped and left for a later batch.
+
+    Returns:
+        int: Number of notes archived
+    """
+    _suppress_notifications(conn, True)
+    rows = conn.execute(
+        text(
+            'SELECT n.id, n.user_id, n.title, n.content, n.has_external_body, '
+            '  b.codec, b.raw_size, b.data, n.date_created, n.date_updated '
+            'FROM notes n LEFT JOIN note_bodies b ON b.note_id = n.id '
+            'WHERE n.date_updated < :cutoff '
+            'ORDER BY n.date_updated '
+            'LIMIT :limit '
+            'FOR UPDATE OF n SKIP LOCKED'
+        ),
+        {'cutoff': cutoff, 'limit': batch_size},
+    ).all()
+    if not rows:
+        _suppress_notifications(conn, False)
+        return 0
+
+    values = []
+    for row in rows:
+        if row.has_external_body and row.data is not None:
+            codec, raw_size, data = row.codec, row.raw_size, row.data
+        else:
+            raw = row.content.encode('utf-8')
+            codec, raw_size, data = DEFAULT_CODEC, len(raw), compress(raw, DEFAULT_CODEC)
+        values.append({
+            'id': row.id,
+            'user_id': row.user_id,
+            'title': row.title,
+            'codec': codec,
+            'raw_size': raw_size,
+            'data': data,
+            'date_created': row.date_created,
+            'date_updated': row.date_updated,
+        })
+
+    conn.execute(
+        text(
+            'INSERT INTO archived_notes '
+            '(id, user_id, title, codec, raw_size, data, date_created, date_updated, date_archived) '
+            'VALUES (:id, :user_id, :title, :codec, :raw_size, :data, :date_created, :date_updated, now())'
+        ),
+        values,
+    )
+    # The notes_delete_body trigger deletes their note_bodies rows
+    conn.execute(
+        text('DELETE FROM notes WHERE id = ANY(CAST(:ids AS uuid[]))'),
+        {'ids': [str(row.id) for row in rows]},
+    )
+    _suppress_notifications(conn, False)
+    archived_counter.inc(len(rows))
+    return len(rows)
+
+
+def archive(
+    conn: Connection,
+    cutoff: datetime,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Move all notes last updated before `cutoff` into the archive, one transaction per batch.
+
+    Args:
+        conn: Connection not inside a transaction
+        cutoff: Notes updated before this are archived
+        batch_size: Number of notes per transaction
+        on_progress: Called with the number of notes archived so far after each batch
+
+    Returns:
+        int: Number of notes archived
+    """
+    archived = 0
+    while True:
+        with conn.begin():
+            count = archive_batch(conn, cutoff, batch_size)
+        if count == 0:
+            return archived
+        archived += count
+        if on_progress is not None:
+            on_progress(archived)
+
+
+def _restore_rows(conn: Connection, rows: Sequence[Row]) -> None:
+    """Move archived rows back into `notes`, inside the caller's transaction."""
+    notes = []
+    bodies = []
+    for row in rows:
+        external = row.raw_size > NOTE_BODY_EXTERNAL_THRESHOLD
+        notes.append({
+            'id': row.id,
+            'user_id': row.user_id,
+            'title': row.title,
+            'content': '' if external else decompress(row.data, row.codec).decode('utf-8'),
+            'has_external_body': external,
+            'content_size': row.raw_size,
+            'date_created': row.date_created,
+            'date_updated': row.date_updated,
+        })
+        if external:
+            bodies.append({'note_id': row.id, 'codec': row.codec, 'raw_size': row.raw_size, 'data': row.data})
+
+    _suppress_notifications(conn, True)
+    conn.execute(
+        text(
+            'INSERT INTO notes '
+            '(id, user_id, title, content, has_external_body, content_size, date_created, date_updated) '
+            'VALUES (:id, :user_id, :title, :content, :has_external_body, :content_size, :date_created, :date_updated)'
+        ),
+        notes,
+    )
+    if bodies:
+        conn.execute(
+            text('INSERT INTO note_bodies (note_id, codec, raw_size, data) VALUES (:note_id, :codec, :raw_size, :data)'),
+            bodies,
+        )
+    conn.execute(
+        text('DELETE FROM archived_notes WHERE id = ANY(CAST(:ids AS uuid[]))'),
+        {'ids': [str(row.id) for row in rows]},
+    )
+    _suppress_notifications(conn, False)
+    restored_counter.inc(len(rows))
+
+
+def get_archived_note(db: Session, id: str, user_id: str, lock: bool = False) -> Optional[ArchivedNote]:
+    """Fetch an archived note owned by the user, locked FOR UPDATE with `lock`."""
+    query = db.query(ArchivedNote).filter(
+        ArchivedNote.id == id,
+        ArchivedNote.user_id == user_id
+    )
+    return (query.with_for_update() if lock else query).first()
+
+
+def restore(db: Session, id: str, user_id: str) -> bool:
+    """
+    Move an archived note owned by the user back into `notes`.
+
+    Runs in the session's transaction; the note can be loaded from `notes`
+    afterwards and is committed together with whatever the caller does next.
+
+    Returns:
+        bool: Whether an archived note was found and restored
+    """
+    conn = db.connection()
+    row = conn.execute(
+        text(
+            f'SELECT {_ARCHIVED_COLUMNS} FROM archived_notes '
+            'WHERE id = :id AND user_id = :user_id FOR UPDATE'
+        ),
+        {'id': id, 'user_id': user_id},
+    ).first()
+    if row is None:
+        return False
+    _restore_rows(conn, [row])
+    return True
+
+
+def restore_all(
+    conn: Connection,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Move every archived note back into `notes`, one transaction per batch.
+
+    Args:
+        conn: Connection not inside a transaction
+        batch_size: Number of notes per transaction
+        on_progress: Called with the number of notes restored so far after each batch
+
+    Returns:
+        int: Number of notes restored
+    """
+    restored = 0
+    while True:
+        with conn.begin():
+            rows = conn.execute(
+                text(f'SELECT {_ARCHIVED_COLUMNS} FROM archived_notes LIMIT :limit FOR UPDATE SKIP LOCKED'),
+                {'limit': batch_size},
+            ).all()
+            if not rows:
+                break
+            _restore_rows(conn, rows)
+
+        restored += len(rows)
+        if on_progress is not None:
+            on_progress(restored)
+
+    return restored
@@ -0,0 +1,227 @@
+"""
+Server-side cache of serialized note listings.
+
+Entries are keyed by user, collection version and query string, and hold the
+exact JSON bytes of the response. The version is `user_note_stats.version`,
+which the `notes_update_stats` trigger bumps in the same transaction as every
+note insert, update and delete, and which `list_notes` already reads for its
+ETag. A write therefore invalidates all of a user's cached listings, in every
+worker, without scanning or deleting anything: later requests simply ask for
+a key that does not exist yet, and stale entries age out of the backend.
+
+Backends, chosen with NOTE_CACHE_BACKEND:
+
+- `memory` (default): LRU per worker, bounded by NOTE_CACHE_MAX_BYTES.
+- `sqlite`: a SQLite file at NOTE_CACHE_PATH shared by all workers on the
+  host, standing in for a shared key-value store such as Redis. Entries
+  expire after NOTE_CACHE_TTL_SECONDS and the oldest are trimmed to stay
+  under NOTE_CACHE_MAX_BYTES.
+- `none`: caching disabled.
+
+Hits, misses, hit ratio, entries and bytes are reported in /metrics.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Protocol
+from urllib.parse import parse_qsl, urlencode
+
+from app import metrics
+
+NOTE_CACHE_BACKEND = os.getenv('NOTE_CACHE_BACKEND', 'memory')
+NOTE_CACHE_MAX_BYTES = int(os.getenv('NOTE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+NOTE_CACHE_PATH = os.getenv('NOTE_CACHE_PATH', '/tmp/note-cache.sqlite3')
+NOTE_CACHE_TTL_SECONDS = float(os.getenv('NOTE_CACHE_TTL_SECONDS', '300'))
+
+# Trim the shared store, and refresh the size gauges, at most this often
+SQLITE_TRIM_INTERVAL_SECONDS = 10.0
+USAGE_REFRESH_SECONDS = 5.0
+
+hits_counter = metrics.counter('note_cache_hits', 'Note listings served from the cache')
+misses_counter = metrics.counter('note_cache_misses', 'Note listings not found in the cache')
+hit_ratio_gauge = metrics.gauge('note_cache_hit_ratio', 'Share of note listing lookups served from the cache')
+entries_gauge = metrics.gauge('note_cache_entries', 'Entries in the note listing cache')
+bytes_gauge = metrics.gauge('note_cache_bytes', 'Bytes of serialized listings held by the note listing cache')
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes) -> None: ...
+
+    def usage(self) -> tuple[int, int]:
+        """Number of entries and total bytes stored."""
+        ...
+
+
+class MemoryLRUBackend:
+    """In-process LRU bounded by the total size of the stored values."""
+
+    def __init__(self, max_bytes: int = NOTE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def usage(self) -> tuple[int, int]:
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+class SQLiteBackend:
+    """Key-value store in a local SQLite file, shared by the workers of a host."""
+
+    def __init__(
+        self,
+        path: str = NOTE_CACHE_PATH,
+        max_bytes: int = NOTE_CACHE_MAX_BYTES,
+        ttl_seconds: float = NOTE_CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._last_trim = 0.0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS note_cache ('
+            '  key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL'
+            ')'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must stay on the thread that created them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            row = self._connection().execute(
+                'SELECT value FROM note_cache WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO note_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, time.time() + self.ttl_seconds),
+            )
+            if time.monotonic() - self._last_trim >= SQLITE_TRIM_INTERVAL_SECONDS:
+                self._last_trim = time.monotonic()
+                self._trim(conn)
+        except sqlite3.Error:
+            # The cache is an optimization: a locked or broken file only costs a miss
+            pass
+
+    def _trim(self, conn: sqlite3.Connection) -> None:
+        conn.execute('DELETE FROM note_cache WHERE expires_at <= ?', (time.time(),))
+        total = 0
+        cutoff: Optional[float] = None
+        # Keep the entries expiring last, i.e. the most recently written, within max_bytes
+        for size, expires_at in conn.execute(
+            'SELECT length(value), expires_at FROM note_cache ORDER BY expires_at DESC'
+        ):
+            total += size
+            if total > self.max_bytes:
+                cutoff = expires_at
+                break
+        if cutoff is not None:
+            conn.execute('DELETE FROM note_cache WHERE expires_at <= ?', (cutoff,))
+
+    def usage(self) -> tuple[int, int]:
+        try:
+            count, size = self._connection().execute(
+                'SELECT count(*), coalesce(sum(length(value)), 0) FROM note_cache WHERE expires_at > ?',
+                (time.time(),),
+            ).fetchone()
+        except sqlite3.Error:
+            return 0, 0
+        return count, size
+
+
+class NullBackend:
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes) -> None:
+        pass
+
+    def usage(self) -> tuple[int, int]:
+        return 0, 0
+
+
+def create_backend(name: str = NOTE_CACHE_BACKEND) -> CacheBackend:
+    if name == 'memory':
+        return MemoryLRUBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'none':
+        return NullBackend()
+    raise ValueError(f'Unknown NOTE_CACHE_BACKEND: {name}')
+
+
+class NoteListCache:
+    """Version-stamped cache of serialized note listings."""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._last_usage_refresh = 0.0
+
+    @staticmethod
+    def key(user_id: str, version: int, query_string: str = '') -> str:
+        # Normalize parameter order so equivalent URLs share an entry
+        query = urlencode(sorted(parse_qsl(query_string, keep_blank_values=True)))
+        return f'notes:{user_id}:{version}:{query}'
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.backend.get(key)
+        if value is None:
+            misses_counter.inc()
+        else:
+            hits_counter.inc()
+        lookups = hits_counter.value + misses_counter.value
+        hit_ratio_gauge.set(hits_counter.value / lookups if lookups else 0.0)
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        self.backend.set(key, value)
+        if time.monotonic() - self._last_usage_refresh >= USAGE_REFRESH_SECONDS:
+            self._last_usage_refresh = time.monotonic()
+            entries, size = self.backend.usage()
+            entries_gauge.set(entries)
+            bytes_gauge.set(size)
+
+
+note_list_cache = NoteListCache(create_backend())
@@ -0,0 +1,108 @@
+"""
+Per-user note aggregates.
+
+`user_note_stats` is kept up to date by the `notes_update_stats` trigger in
+the same transaction as every note write, so reading a user's note count,
+total size, last modification time and collection version is a single
+primary key lookup. `version` changes on every write and doubles as the
+validator for cached note listings.
+
+`reconcile` recomputes the aggregates from `notes` in bulk to repair any drift.
+"""
+from typing import Callable, Optional
+
+from sqlalchemy import Connection, text
+from sqlalchemy.orm import Session
+
+from app.models.user_note_stats import UserNoteStats
+
+RECONCILE_BATCH_SIZE = 1000
+
+
+def get_note_stats(db: Session, user_id: str) -> UserNoteStats:
+    """Return the user's aggregates, or zeroed stats if they have no notes yet."""
+    stats = db.get(UserNoteStats, user_id)
+    if stats is None:
+        return UserNoteStats(user_id=user_id, note_count=0, total_bytes=0, last_modified=None, version=0)
+    return stats
+
+
+def list_etag(user_id: str, version: int) -> str:
+    """Weak ETag for a user's note listing at a given collection version."""
+    return f'W/"notes-{user_id}-{version}"'
+
+
+def reconcile(
+    conn: Connection,
+    batch_size: int = RECONCILE_BATCH_SIZE,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Recompute note aggregates for every user, one transaction per batch.
+
+    The batch's stats rows are locked before counting, so note writes of
+    those users wait until the batch commits instead of racing with it.
+
+    Args:
+        conn: Connection not inside a transaction
+        batch_size: Number of users per transaction
+        on_progress: Called with (users scanned, users repaired) after each batch
+
+    Returns:
+        int: Number of users whose stats were repaired
+    """
+    last_user_id: Optional[str] = None
+    scanned = 0
+    repaired = 0
+
+    while True:
+        with conn.begin():
+            user_ids = conn.execute(
+                text(
+                    'SELECT id::text FROM users '
+                    'WHERE CAST(:last_user_id AS uuid) IS NULL OR id > CAST(:last_user_id AS uuid) '
+                    'ORDER BY id LIMIT :limit'
+                ),
+                {'last_user_id': last_user_id, 'limit': batch_size},
+            ).scalars().all()
+            if not user_ids:
+                break
+
+            conn.execute(
+                text(
+                    'SELECT user_id FROM user_note_stats '
+                    'WHERE user_id = ANY(CAST(:user_ids AS uuid[])) ORDER BY user_id FOR UPDATE'
+                ),
+                {'user_ids': user_ids},
+            )
+            result = conn.execute(
+                text(
+                    """
+                    INSERT INTO user_note_stats AS s
+                        (user_id, note_count, total_bytes, last_modified, version)
+                    SELECT u.id, count(n.id), coalesce(sum(n.content_size), 0), max(n.date_updated), 1
+                    FROM unnest(CAST(:user_ids AS uuid[])) AS u(id)
+                    LEFT JOIN notes n ON n.user_id = u.id
+                    GROUP BY u.id
+                    HAVING count(n.id) > 0
+                        OR u.id IN (SELECT user_id FROM user_note_stats)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        note_count = EXCLUDED.note_count,
+                        total_bytes = EXCLUDED.total_bytes,
+                        last_modified = greatest(s.last_modified, EXCLUDED.last_modified),
+                        version = s.version + 1
+                    WHERE s.note_count <> EXCLUDED.note_count
+                        OR s.total_bytes <> EXCLUDED.total_bytes
+                    """
+                ),
+                {'user_ids': user_ids},
+            )
+
+        last_user_id = user_ids[-1]
+        scanned += len(user_ids)
+        repaired += result.rowcount
+        if on_progress is not None:
+            on_progress(scanned, repaired)
+
+    return repaired
+
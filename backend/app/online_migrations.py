@@ -0,0 +1,450 @@
+"""
+Helpers for migrations that must not lock busy tables.
+
+Call these from Alembic revisions instead of `op.create_index` and hand-written
+UPDATE loops when the table is large:
+
+- `create_index_concurrently` / `drop_index_concurrently` build and drop
+  indexes with CONCURRENTLY, outside the migration transaction. On a
+  partitioned table such as `notes` the index is created ON ONLY the parent,
+  built concurrently on each partition and attached, since Postgres cannot
+  build partitioned indexes concurrently. Invalid leftovers of an interrupted
+  build are dropped and rebuilt, so re-running is safe.
+- `backfill` updates rows in keyset-ordered batches, one statement and thus
+  one short transaction per batch, throttled by a pause and an optional rows
+  per second ceiling. Progress is saved in `migration_progress` by the same
+  statement that updates the batch, so an interrupted backfill resumes where
+  it stopped, and is logged with an ETA.
+- `execute_with_lock_timeout` runs short DDL with a lock_timeout and retries
+  with backoff, so a migration waiting for a lock never queues every other
+  query on the table behind it.
+
+With `alembic -x dry_run=true upgrade head` the helpers run nothing and log
+an estimate based on table statistics (pg_class sizes and the planner's row
+estimates) instead; env.py rolls back everything else the revisions did.
+Only revisions that set `dry_run_safe = True` (or, for revisions older than
+the marker, are listed in env.py's DRY_RUN_SAFE_REVISIONS) can be dry-run:
+those whose work outside the helpers is quick DDL. env.py refuses a dry run reaching any
+other revision, which would copy its data and hold its locks until the
+rollback.
+
+Every helper also accepts an explicit AUTOCOMMIT connection, which is how
+scripts and tests use them outside Alembic.
+"""
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '5s')
+LOCK_RETRIES = int(os.getenv('MIGRATION_LOCK_RETRIES', '5'))
+LOCK_RETRY_DELAY_SECONDS = 1.0
+
+# Throughput assumed by dry-run estimates; tune to the production hardware
+INDEX_BUILD_MB_PER_SECOND = float(os.getenv('MIGRATION_INDEX_MB_PER_SECOND', '20'))
+BACKFILL_ROWS_PER_SECOND = float(os.getenv('MIGRATION_BACKFILL_ROWS_PER_SECOND', '10000'))
+
+PROGRESS_LOG_INTERVAL_SECONDS = 10.0
+
+LOCK_NOT_AVAILABLE = '55P03'
+IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+
+def _identifier(name: str) -> str:
+    if not IDENTIFIER_RE.match(name):
+        raise ValueError(f'Not a plain SQL identifier: {name!r}')
+    return name
+
+
+def is_dry_run() -> bool:
+    """True when Alembic was invoked with `-x dry_run=true`."""
+    from alembic import context
+
+    return context.get_x_argument(as_dictionary=True).get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+
+@contextmanager
+def _autocommit_connection(conn: Optional[Connection]) -> Iterator[Connection]:
+    if conn is not None:
+        yield conn
+        return
+    from alembic import op
+
+    with op.get_context().autocommit_block():
+        yield op.get_bind()
+
+
+@contextmanager
+def lock_timeout(conn: Connection, timeout: str) -> Iterator[None]:
+    """Set the session lock_timeout for the duration of the block."""
+    previous = conn.execute(text('SHOW lock_timeout')).scalar()
+    conn.execute(text("SELECT set_config('lock_timeout', :timeout, false)"), {'timeout': timeout})
+    try:
+        yield
+    finally:
+        conn.execute(text("SELECT set_config('lock_timeout', :timeout, false)"), {'timeout': previous})
+
+
+def _is_lock_timeout(error: OperationalError) -> bool:
+    return getattr(error.orig, 'pgcode', None) == LOCK_NOT_AVAILABLE
+
+
+def _with_lock_retries(conn: Connection, action: Callable[[], Any], timeout: str, retries: int) -> Any:
+    delay = LOCK_RETRY_DELAY_SECONDS
+    with lock_timeout(conn, timeout):
+        for attempt in range(retries + 1):
+            try:
+                return action()
+            except OperationalError as e:
+                if not _is_lock_timeout(e) or attempt == retries:
+                    raise
+                logger.warning('Lock not acquired within %s, retrying in %.0fs (%d/%d)', timeout, delay, attempt + 1, retries)
+                time.sleep(delay)
+                delay *= 2
+
+
+def execute_with_lock_timeout(
+    sql: str,
+    timeout: str = LOCK_TIMEOUT,
+    retries: int = LOCK_RETRIES,
+    conn: Optional[Connection] = None,
+) -> None:
+    """
+    Run a short statement in its own transaction, giving up on locks after `timeout`.
+
+    Lock timeouts are retried with exponential backoff before failing.
+    """
+    if conn is None and is_dry_run():
+        logger.info('[dry-run] would execute with lock_timeout=%s: %s', timeout, sql)
+        return
+    with _autocommit_connection(conn) as c:
+        _with_lock_retries(c, lambda: c.execute(text(sql)), timeout, retries)
+
+
+def table_estimate(conn: Connection, table_name: str) -> tuple[int, int]:
+    """Estimated rows and bytes of a table, summed over its partitions, from pg_class."""
+    rows, size = conn.execute(
+        text(
+            'SELECT coalesce(sum(greatest(c.reltuples, 0)), 0)::bigint, '
+            '  coalesce(sum(pg_relation_size(c.oid)), 0)::bigint '
+            'FROM pg_class c '
+            "WHERE c.oid = CAST(:table AS regclass) AND c.relkind = 'r' "
+            '  OR c.oid IN (SELECT relid FROM pg_partition_tree(CAST(:table AS regclass)) WHERE isleaf)'
+        ),
+        {'table': _identifier(table_name)},
+    ).one()
+    return rows, size
+
+
+def estimate_rows(conn: Connection, table_name: str, where: Optional[str] = None, params: Optional[dict] = None) -> int:
+    """The planner's estimate of rows matching `where`."""
+    plan = conn.execute(
+        text(f'EXPLAIN (FORMAT JSON) SELECT 1 FROM {_identifier(table_name)} WHERE {where or "true"}'),
+        params or {},
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m{seconds % 60:02d}s'
+    return f'{seconds}s'
+
+
+def _invalid_index(conn: Connection, index_name: str) -> bool:
+    return bool(conn.execute(
+        text('SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+        {'name': index_name},
+    ).scalar())
+
+
+def _build_concurrently(conn: Connection, index_name: str, table_name: str, definition: str, timeout: str, retries: int) -> None:
+    if _invalid_index(conn, index_name):
+        logger.info('Dropping invalid index %s left by an interrupted build', index_name)
+        _with_lock_retries(conn, lambda: conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')), timeout, retries)
+    start = time.monotonic()
+    _with_lock_retries(
+        conn,
+        lambda: conn.execute(text(f'CREATE {definition.format(name=index_name, table=table_name, concurrently="CONCURRENTLY")}')),
+        timeout,
+        retries,
+    )
+    logger.info('Built index %s on %s in %s', index_name, table_name, _format_duration(time.monotonic() - start))
+
+
+def create_index_concurrently(
+    index_name: str,
+    table_name: str,
+    columns: Sequence[str],
+    unique: bool = False,
+    where: Optional[str] = None,
+    timeout: str = LOCK_TIMEOUT,
+    retries: int = LOCK_RETRIES,
+    conn: Optional[Connection] = None,
+) -> None:
+    """
+    Create an index without blocking writes to the table.
+
+    Args:
+        index_name: Name of the index
+        table_name: Table, partitioned or not
+        columns: Column names or expressions
+        unique: Create a unique index
+        where: Predicate of a partial index
+        timeout: lock_timeout for each step
+        retries: Retries of a step that timed out waiting for a lock
+        conn: AUTOCOMMIT connection; inside Alembic, omit to use the migration's
+    """
+    _identifier(index_name)
+    _identifier(table_name)
+    definition = (
+        f"{'UNIQUE ' if unique else ''}INDEX {{concurrently}} IF NOT EXISTS {{name}} ON {{table}} "
+        f"({', '.join(columns)})" + (f' WHERE {where}' if where else '')
+    )
+
+    if conn is None and is_dry_run():
+        from alembic import op
+
+        _, size = table_estimate(op.get_bind(), table_name)
+        # A concurrent build scans the table twice
+        seconds = 2 * size / (INDEX_BUILD_MB_PER_SECOND * 1024 * 1024)
+        logger.info(
+            '[dry-run] create index %s on %s: %.1f MB of table data, est. %s',
+            index_name, table_name, size / 1024 / 1024, _format_duration(seconds),
+        )
+        return
+
+    with _autocommit_connection(conn) as c:
+        partitions = c.execute(
+            text(
+                "SELECT p.relid::regclass::text FROM pg_partition_tree(CAST(:table AS regclass)) p "
+                "WHERE p.isleaf AND p.level > 0 ORDER BY 1"
+            ),
+            {'table': table_name},
+        ).scalars().all()
+
+        if not partitions:
+            _build_concurrently(c, index_name, table_name, definition, timeout, retries)
+            return
+
+        # Partitioned: invalid parent index first, then build and attach each partition's
+        parent = definition.format(name=index_name, table=f'ONLY {table_name}', concurrently='')
+        _with_lock_retries(c, lambda: c.execute(text(f'CREATE {parent}')), timeout, retries)
+        for partition in partitions:
+            child_name = f'{index_name}_{partition.rsplit(".", 1)[-1]}'[:63]
+            _build_concurrently(c, child_name, partition, definition, timeout, retries)
+            attached = c.execute(
+                text(
+                    'SELECT 1 FROM pg_inherits '
+                    'WHERE inhparent = to_regclass(:parent) AND inhrelid = to_regclass(:child)'
+                ),
+                {'parent': index_name, 'child': child_name},
+            ).scalar()
+            if not attached:
+                _with_lock_retries(
+                    c, lambda: c.execute(text(f'ALTER INDEX {index_name} ATTACH PARTITION {child_name}')), timeout, retries
+                )
+
+
+def drop_index_concurrently(
+    index_name: str,
+    timeout: str = LOCK_TIMEOUT,
+    retries: int = LOCK_RETRIES,
+    conn: Optional[Connection] = None,
+) -> None:
+    """
+    Drop an index without blocking the table.
+
+    Partitioned indexes cannot be dropped concurrently; they are dropped
+    with a plain DROP INDEX under the lock timeout instead.
+    """
+    _identifier(index_name)
+    if conn is None and is_dry_run():
+        logger.info('[dry-run] drop index %s', index_name)
+        return
+
+    with _autocommit_connection(conn) as c:
+        kind = c.execute(
+            text('SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)'), {'name': index_name}
+        ).scalar()
+        if kind is None:
+            return
+        concurrently = '' if kind == 'I' else 'CONCURRENTLY '
+        _with_lock_retries(c, lambda: c.execute(text(f'DROP INDEX {concurrently}IF EXISTS {index_name}')), timeout, retries)
+
+
+def _ensure_progress_table(conn: Connection) -> None:
+    conn.execute(
+        text(
+            'CREATE TABLE IF NOT EXISTS migration_progress ('
+            '  name VARCHAR PRIMARY KEY,'
+            '  last_key VARCHAR,'
+            '  rows_done BIGINT NOT NULL DEFAULT 0,'
+            '  finished BOOLEAN NOT NULL DEFAULT false,'
+            '  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()'
+            ')'
+        )
+    )
+
+
+def backfill(
+    name: str,
+    table_name: str,
+    set_clause: str,
+    where: str,
+    key: str = 'id',
+    batch_size: int = 5000,
+    pause_seconds: float = 0.1,
+    max_rows_per_second: Optional[float] = None,
+    timeout: str = LOCK_TIMEOUT,
+    retries: int = LOCK_RETRIES,
+    params: Optional[dict[str, Any]] = None,
+    conn: Optional[Connection] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Update rows matching `where` in throttled, resumable batches.
+
+    `where` must stop matching a row once it has been updated, e.g.
+    `content_size IS NULL`; together with the saved progress this makes the
+    backfill safe to interrupt and re-run.
+
+    Args:
+        name: Unique name under which progress is saved in migration_progress
+        table_name: Table to update, partitioned or not
+        set_clause: SET clause, e.g. "content_size = octet_length(content)"
+        where: Rows still needing the backfill
+        key: Unique, indexed column batches are ordered by
+        batch_size: Rows per batch (and per transaction)
+        pause_seconds: Sleep between batches to let replicas and vacuum keep up
+        max_rows_per_second: Additional throughput ceiling, if set
+        timeout: lock_timeout for each batch
+        retries: Retries of a batch that timed out waiting for a lock
+        params: Bind parameters used in set_clause or where
+        conn: AUTOCOMMIT connection; inside Alembic, omit to use the migration's
+        on_progress: Called with (rows updated so far, estimated total) after each batch
+
+    Returns:
+        int: Rows updated by this run
+    """
+    _identifier(table_name)
+    _identifier(key)
+    params = params or {}
+
+    if conn is None and is_dry_run():
+        from alembic import op
+
+        bind = op.get_bind()
+        rows = estimate_rows(bind, table_name, where, params)
+        batches = -(-rows // batch_size)
+        seconds = rows / (max_rows_per_second or BACKFILL_ROWS_PER_SECOND) + batches * pause_seconds
+        logger.info(
+            '[dry-run] backfill %s on %s: ~%d rows in %d batches, est. %s',
+            name, table_name, rows, batches, _format_duration(seconds),
+        )
+        return 0
+
+    with _autocommit_connection(conn) as c:
+        _ensure_progress_table(c)
+        state = c.execute(
+            text('SELECT last_key, rows_done, finished FROM migration_progress WHERE name = :name'), {'name': name}
+        ).one_or_none()
+        last_key, rows_done, finished = state if state else (None, 0, False)
+        if finished:
+            logger.info('Backfill %s already finished (%d rows)', name, rows_done)
+            return 0
+
+        total = rows_done + estimate_rows(c, table_name, where, params)
+        logger.info('Backfill %s on %s: ~%d rows to go%s', name, table_name, total - rows_done, ' (resuming)' if state else '')
+
+        # Update the batch and save progress in one statement, i.e. one transaction
+        batch_sql = text(
+            f"""
+            WITH batch AS (
+                SELECT {key} FROM {table_name}
+                WHERE (CAST(:last_key AS text) IS NULL OR {key} > :last_key) AND ({where})
+                ORDER BY {key}
+                LIMIT :batch_size
+            ), updated AS (
+                UPDATE {table_name} SET {set_clause}
+                FROM batch WHERE {table_name}.{key} = batch.{key}
+                RETURNING 1
+            ), progress AS (
+                INSERT INTO migration_progress AS p (name, last_key, rows_done)
+                SELECT :name, (SELECT {key}::text FROM batch ORDER BY {key} DESC LIMIT 1),
+                    (SELECT count(*) FROM updated)
+                WHERE EXISTS (SELECT 1 FROM batch)
+                ON CONFLICT (name) DO UPDATE SET
+                    last_key = EXCLUDED.last_key,
+                    rows_done = p.rows_done + EXCLUDED.rows_done,
+                    updated_at = now()
+                RETURNING last_key
+            )
+            SELECT (SELECT last_key FROM progress), (SELECT count(*) FROM updated)
+            """
+        )
+
+        updated_total = 0
+        started = time.monotonic()
+        last_log = started
+        while True:
+            batch_start = time.monotonic()
+            next_key, count = _with_lock_retries(
+                c,
+                lambda: c.execute(
+                    batch_sql, {**params, 'last_key': last_key, 'batch_size': batch_size, 'name': name}
+                ).one(),
+                timeout,
+                retries,
+            )
+            if next_key is None:
+                break
+            last_key = next_key
+            updated_total += count
+            rows_done += count
+            if on_progress is not None:
+                on_progress(rows_done, total)
+
+            if rows_done >= total:
+                # The planner underestimated, e.g. on a column added without ANALYZE
+                total = rows_done + estimate_rows(c, table_name, where, params)
+
+            now = time.monotonic()
+            if now - last_log >= PROGRESS_LOG_INTERVAL_SECONDS:
+                last_log = now
+                rate = updated_total / (now - started)
+                remaining = max(total - rows_done, 0)
+                logger.info(
+                    'Backfill %s: %d/%d rows (%.1f%%), %.0f rows/s, ETA %s',
+                    name, rows_done, total, 100 * rows_done / total if total else 100.0, rate,
+                    _format_duration(remaining / rate) if rate else '?',
+                )
+
+            pause = pause_seconds
+            if max_rows_per_second:
+                pause = max(pause, count / max_rows_per_second - (time.monotonic() - batch_start))
+            if pause > 0:
+                time.sleep(pause)
+
+        c.execute(
+            text(
+                'INSERT INTO migration_progress AS p (name, rows_done, finished) VALUES (:name, :rows_done, true) '
+                'ON CONFLICT (name) DO UPDATE SET finished = true, updated_at = now()'
+            ),
+            {'name': name, 'rows_done': rows_done},
+        )
+        logger.info('Backfill %s finished: %d rows updated in %s', name, updated_total, _format_duration(time.monotonic() - started))
+        return updated_total
@@ -0,0 +1,204 @@
+"""
+On-demand sampling profiler for individual requests.
+
+A request carrying the secret PROFILE_TOKEN in the `X-Profile-Token` header
+(or the `profile_token` query parameter, for browsers) is profiled by a
+background thread that samples the stacks of every thread in the worker every
+PROFILE_INTERVAL_MS. The samples are written to PROFILE_DIR in collapsed-stack
+format (`frame;frame;frame count` per line), which speedscope, flamegraph.pl
+and most other flame graph tools read directly. The file name is returned in
+the `X-Profile` response header.
+
+Sampling costs nothing when no profile is running, and the profiled request
+pays only for the sampler thread. Still, each worker profiles at most one
+request at a time, at most PROFILE_RATE_PER_MINUTE requests a minute and for
+at most PROFILE_MAX_SECONDS, and keeps only the newest PROFILE_MAX_FILES
+files, so the feature can stay enabled in production. Requests over the limit
+are served normally with `X-Profile: skipped`.
+
+Samples cover all threads, so requests running concurrently in the same
+worker show up in the profile too. Idle threadpool threads are left out.
+Profiling is disabled when PROFILE_TOKEN is not set.
+"""
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+from app import metrics
+
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', '/tmp/profiles'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '2'))
+PROFILE_RATE_PER_MINUTE = float(os.getenv('PROFILE_RATE_PER_MINUTE', '6'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '30'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '100'))
+
+TOKEN_HEADER = b'x-profile-token'
+TOKEN_QUERY_PARAM = 'profile_token'
+RESULT_HEADER = b'x-profile'
+
+profiles_counter = metrics.counter('profiles_written', 'Request profiles written to disk')
+skipped_counter = metrics.counter('profiles_skipped', 'Profile requests skipped by the rate limit or a running profile')
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` events a minute with bursts of one."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else float('inf')
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_allowed:
+                return False
+            self._next_allowed = now + self.interval
+            return True
+
+
+_PATH_PREFIXES = sorted(
+    {os.path.join(path, '') for path in (*sys.path, os.getcwd()) if path and os.path.isdir(path)},
+    key=len,
+    reverse=True,
+)
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    # Shorten to the module path below the longest matching import root
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    # ';' separates frames in collapsed stacks
+    return f'{code.co_qualname} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+def _is_idle(frame) -> bool:
+    """Threadpool workers wait for work in threading.Condition.wait."""
+    return frame.f_code.co_filename == threading.__file__
+
+
+class StackSampler:
+    """Samples the stacks of all other threads into collapsed-stack counts."""
+
+    def __init__(self, interval: float, max_seconds: float):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that present the profile token."""
+
+    def __init__(
+        self,
+        app,
+        token: str = PROFILE_TOKEN,
+        output_dir: Path = PROFILE_DIR,
+        rate_per_minute: float = PROFILE_RATE_PER_MINUTE,
+    ):
+        self.app = app
+        self.token = token
+        self.output_dir = output_dir
+        self.limiter = RateLimiter(rate_per_minute)
+        self._running = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.token or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        if not self._running.acquire(blocking=False):
+            skipped_counter.inc()
+            await self.app(scope, receive, self._with_result_header(send, b'skipped'))
+            return
+        try:
+            if not self.limiter.acquire():
+                skipped_counter.inc()
+                await self.app(scope, receive, self._with_result_header(send, b'skipped'))
+                return
+
+            path = self.output_dir / self._file_name(scope)
+            sampler = StackSampler(PROFILE_INTERVAL_MS / 1000, PROFILE_MAX_SECONDS)
+            sampler.start()
+            try:
+                await self.app(scope, receive, self._with_result_header(send, path.name.encode()))
+            finally:
+                sampler.stop()
+                self._write(path, sampler.collapsed())
+        finally:
+            self._running.release()
+
+    def _requested(self, scope) -> bool:
+        token: Optional[str] = None
+        for name, value in scope['headers']:
+            if name == TOKEN_HEADER:
+                token = value.decode('latin-1')
+                break
+        if token is None:
+            token = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(TOKEN_QUERY_PARAM, [None])[0]
+        return token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+
+    @staticmethod
+    def _with_result_header(send, value: bytes):
+        async def send_with_header(message):
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': [*message.get('headers', []), (RESULT_HEADER, value)]}
+            await send(message)
+
+        return send_with_header
+
+    @staticmethod
+    def _file_name(scope) -> str:
+        now = time.time()
+        route = re.sub(r'[^A-Za-z0-9]+', '_', scope['path']).strip('_') or 'root'
+        timestamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f'{now % 1:.3f}'[1:]
+        return f"{timestamp}-{scope['method']}-{route}.folded"
+
+    def _write(self, path: Path, collapsed: str) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path.write_text(collapsed)
+        profiles_counter.inc()
+
+        profiles = sorted(self.output_dir.glob('*.folded'))
+        for old in profiles[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+            old.unlink(missing_ok=True)
@@ -1,5 +1,6 @@
-import uuid
-from fastapi import APIRouter, HTTPException, status, Depends, Response, Request
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Response, Request
 from sqlalchemy.orm import Session
 
 from app.auth import (
@@ -10,11 +11,15 @@ from app.auth import (
     get_password_hash,
     verify_password,
 )
-from app.database import get_db
+from app import idempotency
+from app.database import get_db, release_connection
+from app.ids import is_uuid, uuid7
 from app.autogenerated.pydantic_models import User as UserResponse, UserRegisterRequest, UserLoginRequest, Token, ErrorResponse
 from app.models.user import User as UserModel
+from app.sharding import add_user, get_user, load_user, lookup_email
+from app.tracing import TracedRoute
 
-router = APIRouter(prefix='/api/auth', tags=['Authentication'])
+router = APIRouter(prefix='/api/auth', tags=['Authentication'], route_class=TracedRoute)
 
 
 @router.post(
@@ -23,34 +28,54 @@ router = APIRouter(prefix='/api/auth', tags=['Authentication'])
     status_code=status.HTTP_201_CREATED,
     responses={
         400: {'model': ErrorResponse, 'description': 'Bad request'},
+        409: {'model': ErrorResponse, 'description': 'Request with this Idempotency-Key in progress'},
+        422: {'model': ErrorResponse, 'description': 'Idempotency-Key reused with a different request'},
         500: {'model': ErrorResponse, 'description': 'Server error'},
     },
     summary='Register a new user',
 )
-async def register(user: UserRegisterRequest, db: Session = Depends(get_db)) -> UserResponse:
+async def register(
+    user: UserRegisterRequest,
+    db: Session = Depends(get_db, scope='function'),
+    idempotency_key: Optional[str] = Header(default=None),
+):
     """
     Register a new user with email and password.
 
+    A retry with the same Idempotency-Key header replays the original
+    response without hashing the password again.
+
     Args:
         user: User registration data
         db: Database session
+        idempotency_key: Optional key identifying retries of the same request
 
     Returns:
         UserResponse: The created user
 
     Raises:
         HTTPException: 400 if email already registered
+        HTTPException: 409 if a request with the same Idempotency-Key is in progress
+        HTTPException: 422 if the Idempotency-Key was used for a different request
         HTTPException: 500 if server error occurs
     """
     try:
-        existing_user = db.query(UserModel).filter(UserModel.email == user.email).first()
-        if existing_user:
+        if idempotency_key is not None:
+            replay = await idempotency.claim(db, 'register', idempotency_key, user)
+            if replay is not None:
+                return replay
+
+        if lookup_email(db, user.email) is not None:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='Email already registered'
             )
 
-        user_id = str(uuid.uuid4())
+        if idempotency_key is None:
+            # Otherwise the claim's row lock must be held until the commit
+            release_connection(db)
+
+        user_id = str(uuid7())
         hashed_password = get_password_hash(user.password)
 
         db_user = UserModel(
@@ -60,17 +85,20 @@ async def register(user: UserRegisterRequest, db: Session = Depends(get_db)) ->
             is_active=True,
         )
 
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        add_user(db, db_user)
 
-        return UserResponse(
+        response = UserResponse(
             id=db_user.id,
             email=db_user.email,
             is_active=db_user.is_active,
             date_created=db_user.date_created,
             date_updated=db_user.date_updated,
         )
+        if idempotency_key is not None:
+            idempotency.record(db, 'register', idempotency_key, status.HTTP_201_CREATED, response)
+        db.commit()
+
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -94,7 +122,7 @@ async def register(user: UserRegisterRequest, db: Session = Depends(get_db)) ->
 async def login(
     credentials: UserLoginRequest,
     response: Response,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope='function'),
 ) -> Token:
     """
     Login with email and password to get a JWT token.
@@ -112,7 +140,10 @@ async def login(
         HTTPException: 500 if server error occurs
     """
     try:
-        user = db.query(UserModel).filter(UserModel.email == credentials.email).first()
+        entry = lookup_email(db, credentials.email)
+        user = load_user(db, entry) if entry is not None else None
+        # Verifying the password takes a while and needs no connection
+        release_connection(db)
 
         if not user or not verify_password(credentials.password, user.hashed_password):
             raise HTTPException(
@@ -199,7 +230,7 @@ async def get_me(current_user: UserModel = Depends(get_current_user)) -> UserRes
 async def refresh(
     request: Request,
     response: Response,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_db, scope='function'),
 ) -> Token:
     """
     Refresh the access token using the refresh token from httpOnly cookie.
@@ -233,13 +264,13 @@ async def refresh(
             )
 
         user_id = payload.get('sub')
-        if not user_id or not isinstance(user_id, str):
+        if not user_id or not isinstance(user_id, str) or not is_uuid(user_id):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail='Invalid refresh token',
             )
 
-        user = db.query(UserModel).filter(UserModel.id == user_id).first()
+        user = get_user(db, user_id)
         if not user or not user.is_active:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
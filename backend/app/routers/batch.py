@@ -0,0 +1,173 @@
+# FastAPI router for the batch endpoint
+# Generated from OpenAPI specification
+
+import asyncio
+import json
+import os
+from typing import Any, List, Optional
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.orm import Session
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from app.auth import authenticated_as, get_current_user
+from app.auth.dependencies import security
+from app.autogenerated.pydantic_models import (
+    BatchItemRequest,
+    BatchItemResponse,
+    BatchMethod,
+    BatchRequest,
+    BatchResponse,
+    ErrorResponse,
+)
+from app.database import get_db, shared_session
+from app.models.user import User as UserModel
+from app.tracing import TracedRoute, span
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+
+# Sub-requests may not nest batches or open event streams
+EXCLUDED_PREFIXES = ("/api/batch", "/api/events")
+# Headers of the batch request that every sub-request inherits
+INHERITED_HEADERS = frozenset({b"authorization", b"host", b"user-agent", b"accept-language"})
+# Headers a sub-request may not set itself
+RESERVED_HEADERS = frozenset({"authorization", "host", "content-length", "content-type", "cookie"})
+# Response headers left out of the per-item headers
+DROPPED_RESPONSE_HEADERS = frozenset({"content-length", "set-cookie", "server-timing"})
+
+router = APIRouter(prefix="/api/batch", tags=["Batch"], route_class=TracedRoute)
+
+
+def _item_response(
+    item: BatchItemRequest, status_code: int, body: Any, headers: Optional[dict[str, str]] = None
+) -> BatchItemResponse:
+    return BatchItemResponse(id=item.id, status=status_code, headers=headers or {}, body=body)
+
+
+async def _dispatch(request: Request, item: BatchItemRequest, db: Session) -> BatchItemResponse:
+    """Run one sub-request through the application's router and capture its response."""
+    url = urlsplit(item.path)
+    path = url.path
+    if not path.startswith("/api/") or path.startswith(EXCLUDED_PREFIXES):
+        return _item_response(item, status.HTTP_400_BAD_REQUEST, {"detail": "Path not allowed in a batch"})
+
+    body = b"" if item.body is None else json.dumps(item.body).encode()
+    headers = [(name, value) for name, value in request.scope["headers"] if name in INHERITED_HEADERS]
+    headers += [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in (item.headers or {}).items()
+        if name.lower() not in RESERVED_HEADERS
+    ]
+    if body:
+        headers.append((b"content-type", b"application/json"))
+    headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        key: value
+        for key, value in request.scope.items()
+        if key not in ("route", "endpoint", "path_params")
+    }
+    scope.update({
+        "method": item.method.value,
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": url.query.encode(),
+        "headers": headers,
+    })
+
+    done = asyncio.Event()
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    start: dict[str, Any] = {}
+    chunks: List[bytes] = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    with span(f"batch {item.method.value} {path}"):
+        try:
+            await request.app.router(scope, receive, send)
+        except StarletteHTTPException as e:
+            # Unmatched paths and methods are raised by the router itself
+            return _item_response(item, e.status_code, {"detail": e.detail})
+        except Exception:
+            # Keep the shared session usable for the remaining sub-requests
+            db.rollback()
+            return _item_response(item, status.HTTP_500_INTERNAL_SERVER_ERROR, {"detail": "Internal server error"})
+        finally:
+            done.set()
+
+    response_headers = {
+        name.decode("latin-1"): value.decode("latin-1")
+        for name, value in start.get("headers", [])
+        if name.decode("latin-1").lower() not in DROPPED_RESPONSE_HEADERS
+    }
+    content = b"".join(chunks)
+    if not content:
+        response_body = None
+    elif response_headers.get("content-type", "").startswith("application/json"):
+        response_body = json.loads(content)
+    else:
+        response_body = content.decode("utf-8", errors="replace")
+    return _item_response(item, start.get("status", status.HTTP_500_INTERNAL_SERVER_ERROR), response_body, response_headers)
+
+
+@router.post(
+    "",
+    response_model=BatchResponse,
+    status_code=status.HTTP_200_OK,
+    responses={
+        400: {"model": ErrorResponse, "description": "Bad request"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        500: {"model": ErrorResponse, "description": "Server error"},
+    },
+    summary="Execute several API requests in one round trip",
+)
+async def execute_batch(
+    batch: BatchRequest,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: UserModel = Depends(get_current_user),
+    db: Session = Depends(get_db, scope="function"),
+) -> BatchResponse:
+    """
+    Execute several API requests in one round trip.
+
+    The caller is authenticated once, and every sub-request reuses that user
+    and this request's database session. Consecutive GET requests run
+    concurrently; any other method waits for the requests before it and
+    runs on its own, so writes apply in order. Each sub-request gets its own
+    status, headers and body in the response, in request order.
+    """
+    if len(batch.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {BATCH_MAX_REQUESTS} requests",
+        )
+
+    responses: List[BatchItemResponse] = []
+    with shared_session(db), authenticated_as(credentials.credentials, current_user):
+        reads: List[BatchItemRequest] = []
+        for item in batch.requests:
+            if item.method == BatchMethod.GET:
+                reads.append(item)
+                continue
+            responses += await asyncio.gather(*(_dispatch(request, read, db) for read in reads))
+            reads = []
+            responses.append(await _dispatch(request, item, db))
+        responses += await asyncio.gather(*(_dispatch(request, read, db) for read in reads))
+
+    return BatchResponse(responses=responses)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from app.auth import get_user_from_token
+from app.auth.security import decode_access_token
+from app.autogenerated.pydantic_models import ErrorResponse
+from app.database import shard_map, user_shard
+from app.events import NoteEventBroker, broker_for
+from app.tracing import TracedRoute
+
+router = APIRouter(prefix='/api/events', tags=['Events'], route_class=TracedRoute)
+
+optional_security = HTTPBearer(auto_error=False)
+
+HEARTBEAT_SECONDS = float(os.getenv('NOTE_EVENTS_HEARTBEAT_SECONDS', '20'))
+
+
+async def _event_stream(broker: NoteEventBroker, user_id: str, expires_at: float) -> AsyncIterator[str]:
+    subscription = broker.subscribe(user_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            timeout = min(HEARTBEAT_SECONDS, expires_at - time.time())
+            if timeout <= 0:
+                # Token expired: the client reconnects with a fresh one
+                yield 'event: expired\ndata: {}\n\n'
+                return
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield f"event: {event['op']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@router.get(
+    '/notes',
+    status_code=status.HTTP_200_OK,
+    responses={
+        200: {'content': {'text/event-stream': {}}, 'description': 'Stream of note change events'},
+        401: {'model': ErrorResponse, 'description': 'Unauthorized'},
+    },
+    summary='Stream note changes for the authenticated user',
+)
+async def note_events(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    access_token: Optional[str] = Query(default=None),
+) -> StreamingResponse:
+    """
+    Stream note changes for the authenticated user as server-sent events.
+
+    Each event is named after the change (`insert`, `update`, `delete`) and
+    carries the note id, user_id and date_updated. A `resync` event means
+    events were dropped and the client should refetch its notes. The stream
+    ends with an `expired` event when the access token expires.
+
+    Browsers cannot set headers on EventSource, so the access token may also
+    be passed as the `access_token` query parameter.
+
+    Args:
+        credentials: HTTP Bearer token credentials
+        access_token: Access token when no Authorization header is sent
+
+    Returns:
+        StreamingResponse: text/event-stream response
+
+    Raises:
+        HTTPException: 401 if not authenticated
+    """
+    token = credentials.credentials if credentials else access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Not authenticated',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+
+    payload = decode_access_token(token) or {}
+    shard = user_shard(payload.get('sub'))
+
+    # Authenticate with a short-lived session so idle streams hold no connection
+    db = shard_map.session(shard)
+    try:
+        user_id = get_user_from_token(token, db).id
+    finally:
+        db.close()
+
+    expires_at = float(payload.get('exp', time.time()))
+
+    return StreamingResponse(
+        _event_stream(broker_for(shard), user_id, expires_at),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -1,22 +1,47 @@
 # FastAPI router for Note endpoints
 # Generated from OpenAPI specification
 
-from typing import List
-import uuid
-from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from pydantic import TypeAdapter
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Request, Response
+from sqlalchemy.orm import Session, selectinload, undefer
 from app.auth import get_current_user
 from app.autogenerated.pydantic_models import (
     Note as NoteResponse,
+    NoteStats as NoteStatsResponse,
     CreateNoteRequest,
     UpdateNoteRequest,
     ErrorResponse,
 )
 from app.models.note import Note as NoteModel
 from app.models.user import User as UserModel
-from app.database import get_db
+from app import idempotency
+from app.database import get_db, release_connection
+from app.ids import is_uuid, uuid7
+from app.note_archive import get_archived_note, restore
+from app.note_cache import note_list_cache
+from app.note_stats import get_note_stats, list_etag
+from app.tracing import TracedRoute, span
 
-router = APIRouter(prefix="/api/note", tags=["Note"])
+note_list_adapter = TypeAdapter(List[NoteResponse])
+
+router = APIRouter(prefix="/api/note", tags=["Note"], route_class=TracedRoute)
+
+
+def _find_note(db: Session, id: str, user_id: str, *options, lock: bool = False) -> Optional[NoteModel]:
+    """
+    Fetch a note owned by the user, treating malformed IDs as not found.
+
+    With `lock`, the row is locked FOR UPDATE: the archiver skips it, and a
+    note the archiver is moving is waited for and then not found.
+    """
+    if not is_uuid(id):
+        return None
+    query = db.query(NoteModel).options(*options).filter(
+        NoteModel.id == id,
+        NoteModel.user_id == user_id
+    )
+    return (query.with_for_update() if lock else query).first()
 
 
 @router.get(
@@ -24,28 +49,55 @@ router = APIRouter(prefix="/api/note", tags=["Note"])
     response_model=List[NoteResponse],
     status_code=status.HTTP_200_OK,
     responses={
+        304: {"description": "Not modified"},
         500: {"model": ErrorResponse, "description": "Server error"},
     },
     summary="List all notes for the authenticated user",
 )
 async def list_notes(
+    request: Request,
     current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> List[NoteResponse]:
-    """List all notes for the authenticated user."""
-    notes = db.query(NoteModel).filter(NoteModel.user_id == current_user.id).all()
-
-    return [
-        NoteResponse(
-            id=note.id,
-            title=note.title,
-            content=note.content,
-            user_id=note.user_id,
-            date_created=note.date_created,
-            date_updated=note.date_updated,
+    db: Session = Depends(get_db, scope="function")
+):
+    """
+    List all notes for the authenticated user.
+
+    The ETag is derived from the user's note collection version, so a
+    matching If-None-Match is answered with 304 without loading any notes.
+    Otherwise the serialized listing for that version is served from the
+    note list cache when present.
+    """
+    version = get_note_stats(db, current_user.id).version
+    etag = list_etag(current_user.id, version)
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    cache_key = note_list_cache.key(current_user.id, version, request.url.query)
+    body = note_list_cache.get(cache_key)
+    if body is None:
+        notes = (
+            db.query(NoteModel)
+            .options(undefer(NoteModel.inline_content), selectinload(NoteModel.body))
+            .filter(NoteModel.user_id == current_user.id)
+            .all()
         )
-        for note in notes
-    ]
+        release_connection(db)
+        with span("serialize notes", timing="serialize"):
+            body = note_list_adapter.dump_json([
+                NoteResponse(
+                    id=note.id,
+                    title=note.title,
+                    content=note.content,
+                    user_id=note.user_id,
+                    date_created=note.date_created,
+                    date_updated=note.date_updated,
+                )
+                for note in notes
+            ])
+        note_list_cache.set(cache_key, body)
+
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @router.post(
@@ -54,6 +106,8 @@ async def list_notes(
     status_code=status.HTTP_201_CREATED,
     responses={
         400: {"model": ErrorResponse, "description": "Bad request"},
+        409: {"model": ErrorResponse, "description": "Request with this Idempotency-Key in progress"},
+        422: {"model": ErrorResponse, "description": "Idempotency-Key reused with a different request"},
         500: {"model": ErrorResponse, "description": "Server error"},
     },
     summary="Create a new note",
@@ -61,21 +115,33 @@ async def list_notes(
 async def create_note(
     note_data: CreateNoteRequest,
     current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> NoteResponse:
-    """Create a new note."""
+    db: Session = Depends(get_db, scope="function"),
+    idempotency_key: Optional[str] = Header(default=None),
+):
+    """
+    Create a new note.
+
+    Retrying with the same Idempotency-Key header returns the original
+    response instead of creating another note.
+    """
+    scope = f"note:{current_user.id}"
+    if idempotency_key is not None:
+        replay = await idempotency.claim(db, scope, idempotency_key, note_data, current_user.id)
+        if replay is not None:
+            return replay
+
     note = NoteModel(
-        id=str(uuid.uuid4()),
+        id=str(uuid7()),
         title=note_data.title,
         content=note_data.content,
         user_id=current_user.id,
     )
 
     db.add(note)
-    db.commit()
+    db.flush()
     db.refresh(note)
 
-    return NoteResponse(
+    response = NoteResponse(
         id=note.id,
         title=note.title,
         content=note.content,
@@ -83,6 +149,35 @@ async def create_note(
         date_created=note.date_created,
         date_updated=note.date_updated,
     )
+    if idempotency_key is not None:
+        idempotency.record(db, scope, idempotency_key, status.HTTP_201_CREATED, response)
+    db.commit()
+
+    return response
+
+
+@router.get(
+    "/stats",
+    response_model=NoteStatsResponse,
+    status_code=status.HTTP_200_OK,
+    responses={
+        500: {"model": ErrorResponse, "description": "Server error"},
+    },
+    summary="Get note statistics for the authenticated user",
+)
+async def get_stats(
+    current_user: UserModel = Depends(get_current_user),
+    db: Session = Depends(get_db, scope="function")
+) -> NoteStatsResponse:
+    """Get note count, total size, last modification time and collection version."""
+    stats = get_note_stats(db, current_user.id)
+
+    return NoteStatsResponse(
+        note_count=stats.note_count,
+        total_bytes=stats.total_bytes,
+        last_modified=stats.last_modified,
+        version=stats.version,
+    )
 
 
 @router.get(
@@ -98,13 +193,12 @@ async def create_note(
 async def get_note(
     id: str,
     current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db, scope="function")
 ) -> NoteResponse:
-    """Get a specific note by ID."""
-    note = db.query(NoteModel).filter(
-        NoteModel.id == id,
-        NoteModel.user_id == current_user.id
-    ).first()
+    """Get a specific note by ID, falling back to the archive."""
+    note = _find_note(db, id, current_user.id, undefer(NoteModel.inline_content))
+    if not note and is_uuid(id):
+        note = get_archived_note(db, id, current_user.id)
 
     if not note:
         raise HTTPException(
@@ -137,13 +231,15 @@ async def update_note(
     id: str,
     note_data: UpdateNoteRequest,
     current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db, scope="function")
 ) -> NoteResponse:
-    """Update a note."""
-    note = db.query(NoteModel).filter(
-        NoteModel.id == id,
-        NoteModel.user_id == current_user.id
-    ).first()
+    """Update a note, restoring it from the archive first if needed."""
+    note = _find_note(db, id, current_user.id, lock=True)
+    if not note and is_uuid(id):
+        # Look again even if nothing was restored: a concurrent update may have
+        # restored the note while restore() waited for the archived row's lock
+        restore(db, id, current_user.id)
+        note = _find_note(db, id, current_user.id, lock=True)
 
     if not note:
         raise HTTPException(
@@ -181,13 +277,14 @@ async def update_note(
 async def delete_note(
     id: str,
     current_user: UserModel = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db, scope="function")
 ):
-    """Delete a note."""
-    note = db.query(NoteModel).filter(
-        NoteModel.id == id,
-        NoteModel.user_id == current_user.id
-    ).first()
+    """Delete a note, whether active or archived."""
+    note = _find_note(db, id, current_user.id, lock=True)
+    if not note and is_uuid(id):
+        # Or restored from the archive by a concurrent update meanwhile
+        note = (get_archived_note(db, id, current_user.id, lock=True)
+                or _find_note(db, id, current_user.id, lock=True))
 
     if not note:
         raise HTTPException(
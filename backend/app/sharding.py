@@ -0,0 +1,278 @@
+"""
+Users spread over several databases.
+
+Each user's rows (`users`, `notes`, the tables hanging off them and the
+user's idempotency keys) live on one shard of `app.database.shard_map`. The
+home shard (DATABASE_URL) also holds `user_directory`, a small global table
+of every user's email and shard: registration claims the email there, login
+finds the user there, and `get_db` finds the shard of an access token's user
+there.
+
+New users are placed by their ID. `move_user` rebalances a user onto another
+shard while the application keeps serving them:
+
+1. The directory entry is marked `moving_to`. Once every worker's directory
+   cache has expired and in-flight requests have finished (`settle_seconds`),
+   the user's writes get 503 + Retry-After; reads are still served from the
+   old shard.
+2. The user's rows are streamed with COPY into the new shard in one
+   transaction, compared by row count and checksum, and committed.
+3. The directory entry is switched to the new shard, and after another
+   `settle_seconds` the rows are deleted from the old shard.
+
+A move that fails before the switch leaves the user where they were. Rows
+are copied verbatim with triggers disabled (`session_replication_role`,
+which needs a superuser), then the user's `user_note_stats.version` is
+bumped so cached listings and ETags from the old shard are not reused.
+Note event streams opened before the move keep listening on the old shard
+until the client reconnects with a new access token.
+"""
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+from psycopg2 import sql
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import HOME_SHARD, shard_map
+from app.db_sync import connect, stream_copy
+from app.models import Base
+from app.models.user import User
+from app.models.user_directory import UserDirectoryEntry
+
+SHARD_MOVE_GRACE_SECONDS = float(os.getenv('SHARD_MOVE_GRACE_SECONDS', '10'))
+
+# A user's rows in each table, in copy order; deleted in reverse
+USER_ROWS = {
+    'users': 'id = %(user_id)s',
+    'user_note_stats': 'user_id = %(user_id)s',
+    'notes': 'user_id = %(user_id)s',
+    'note_bodies': 'note_id IN (SELECT id FROM notes WHERE user_id = %(user_id)s)',
+    'archived_notes': 'user_id = %(user_id)s',
+    # Otherwise a retry after the move would create its note again
+    'idempotency_keys': 'user_id = %(user_id)s',
+}
+
+
+@dataclass
+class MoveResult:
+    user_id: str
+    source: int
+    target: int
+    rows: dict[str, int] = field(default_factory=dict)
+
+
+@contextmanager
+def _session_on(db: Session, shard: int) -> Iterator[Session]:
+    """`db` if it is on `shard`, otherwise a session on `shard` for the duration."""
+    if len(shard_map) == 1 or db.get_bind() is shard_map.engines[shard]:
+        yield db
+        return
+    session = shard_map.session(shard)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def lookup_email(db: Session, email: str) -> Optional[UserDirectoryEntry]:
+    """Directory entry of the user with this email, if any."""
+    with _session_on(db, HOME_SHARD) as home:
+        return home.query(UserDirectoryEntry).filter(UserDirectoryEntry.email == email).first()
+
+
+def load_user(db: Session, entry: UserDirectoryEntry) -> Optional[User]:
+    """Load the user of a directory entry from its shard."""
+    with _session_on(db, entry.shard) as session:
+        return session.get(User, entry.user_id)
+
+
+def get_user(db: Session, user_id: str) -> Optional[User]:
+    """Load a user by ID from the shard the directory puts them on."""
+    placement = shard_map.locate(user_id) if len(shard_map) > 1 else None
+    with _session_on(db, placement.shard if placement is not None else HOME_SHARD) as session:
+        return session.get(User, user_id)
+
+
+def add_user(db: Session, user: User) -> None:
+    """
+    Create a user on the shard picked from its ID, and add it to the directory.
+
+    The directory entry is flushed first, so a taken email fails before the
+    user is written anywhere. When `db` is on the home shard the entry (and a
+    user placed there) are left for the caller to commit; a user on another
+    shard is committed there right away. If the caller's transaction then
+    fails, that user is unreachable without a directory entry and can be
+    registered again.
+    """
+    shard = shard_map.placement(user.id)
+    with _session_on(db, HOME_SHARD) as home:
+        home.add(UserDirectoryEntry(user_id=user.id, email=user.email, shard=shard))
+        home.flush()
+        if shard == HOME_SHARD:
+            home.add(user)
+            home.flush()
+            home.refresh(user)
+        else:
+            with _session_on(db, shard) as session:
+                session.add(user)
+                session.commit()
+                session.refresh(user)
+        if home is not db:
+            home.commit()
+
+
+def shard_counts() -> dict[int, int]:
+    """Number of users on each shard, according to the directory."""
+    with shard_map.engines[HOME_SHARD].connect() as conn:
+        rows = conn.execute(text('SELECT shard, count(*) AS users FROM user_directory GROUP BY shard')).all()
+    counts = {row.shard: row.users for row in rows}
+    return {shard: counts.get(shard, 0) for shard in range(len(shard_map))}
+
+
+def _set_placement(user_id: str, **values) -> None:
+    with shard_map.engines[HOME_SHARD].begin() as conn:
+        conn.execute(
+            text('UPDATE user_directory SET shard = :shard, moving_to = :moving_to WHERE user_id = :user_id'),
+            {'user_id': user_id, **values},
+        )
+    shard_map.invalidate(user_id)
+
+
+def _begin_move(user_id: str, target: int) -> int:
+    with shard_map.engines[HOME_SHARD].begin() as conn:
+        row = conn.execute(
+            text('SELECT shard, moving_to FROM user_directory WHERE user_id = :user_id FOR UPDATE'),
+            {'user_id': user_id},
+        ).first()
+        if row is None:
+            raise ValueError(f'No user {user_id} in the directory')
+        if not 0 <= target < len(shard_map):
+            raise ValueError(f'No shard {target}: there are {len(shard_map)} shards')
+        if row.moving_to is not None:
+            raise ValueError(f'User {user_id} is already being moved to shard {row.moving_to}')
+        if row.shard == target:
+            raise ValueError(f'User {user_id} is already on shard {target}')
+        conn.execute(
+            text('UPDATE user_directory SET moving_to = :target WHERE user_id = :user_id'),
+            {'user_id': user_id, 'target': target},
+        )
+    shard_map.invalidate(user_id)
+    return row.shard
+
+
+def _rows(table: str) -> sql.Composed:
+    columns = [column.name for column in Base.metadata.tables[table].columns]
+    return sql.SQL('SELECT {} FROM {} WHERE {}').format(
+        sql.SQL(', ').join(sql.Identifier(column) for column in columns),
+        sql.Identifier(table),
+        sql.SQL(USER_ROWS[table]),
+    )
+
+
+def _checksum(cur, table: str, user_id: str) -> tuple[int, int]:
+    cur.execute(
+        sql.SQL(
+            "SELECT count(*), coalesce(sum(('x' || substr(md5(ROW(r.*)::text), 1, 15))::bit(60)::bigint), 0) "
+            "FROM ({}) r"
+        ).format(_rows(table)),
+        {'user_id': user_id},
+    )
+    count, checksum = cur.fetchone()
+    return count, int(checksum)
+
+
+def _delete_user_rows(cur, user_id: str) -> None:
+    for table in reversed(USER_ROWS):
+        cur.execute(
+            sql.SQL('DELETE FROM {} WHERE {}').format(sql.Identifier(table), sql.SQL(USER_ROWS[table])),
+            {'user_id': user_id},
+        )
+
+
+def _copy_user(source_url: str, target_url: str, user_id: str) -> dict[str, int]:
+    source, target = connect(source_url), connect(target_url)
+    try:
+        source.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with source.cursor() as source_cur, target.cursor() as target_cur:
+            target_cur.execute("SET LOCAL session_replication_role = 'replica'")
+            # Leftovers of an earlier move that failed after committing here
+            _delete_user_rows(target_cur, user_id)
+
+            rows = {}
+            for table in USER_ROWS:
+                columns = sql.SQL(', ').join(
+                    sql.Identifier(column.name) for column in Base.metadata.tables[table].columns
+                )
+                stream_copy(
+                    source_cur,
+                    source_cur.mogrify(
+                        sql.SQL('COPY ({}) TO STDOUT (FORMAT binary)').format(_rows(table)), {'user_id': user_id}
+                    ).decode(),
+                    target_cur,
+                    sql.SQL('COPY {} ({}) FROM STDIN (FORMAT binary)').format(
+                        sql.Identifier(table), columns
+                    ).as_string(target_cur),
+                )
+                expected = _checksum(source_cur, table, user_id)
+                if _checksum(target_cur, table, user_id) != expected:
+                    raise ValueError(f'{table} rows of user {user_id} differ after copying')
+                rows[table] = expected[0]
+
+            target_cur.execute(
+                'UPDATE user_note_stats SET version = version + 1 WHERE user_id = %(user_id)s', {'user_id': user_id}
+            )
+        target.commit()
+        return rows
+    finally:
+        source.close()
+        target.close()
+
+
+def _delete_user(url: str, user_id: str) -> None:
+    conn = connect(url)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL session_replication_role = 'replica'")
+            _delete_user_rows(cur, user_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def move_user(
+    user_id: str,
+    target: int,
+    settle_seconds: Optional[float] = None,
+    on_progress: Optional[Callable[[str], None]] = None,
+) -> MoveResult:
+    """
+    Move a user's rows to another shard while the application is running.
+
+    `settle_seconds` defaults to the directory cache lifetime plus
+    SHARD_MOVE_GRACE_SECONDS. Raises ValueError if the user is unknown,
+    already on `target` or already being moved, or if the copy does not match.
+    """
+    if settle_seconds is None:
+        settle_seconds = shard_map.cache_seconds + SHARD_MOVE_GRACE_SECONDS
+    progress = on_progress or (lambda message: None)
+
+    source = _begin_move(user_id, target)
+    result = MoveResult(user_id=user_id, source=source, target=target)
+    try:
+        progress(f'writes paused, waiting {settle_seconds:g}s for workers to notice')
+        time.sleep(settle_seconds)
+        progress(f'copying from shard {source} to shard {target}')
+        result.rows = _copy_user(shard_map.url(source), shard_map.url(target), user_id)
+    except BaseException:
+        _set_placement(user_id, shard=source, moving_to=None)
+        raise
+
+    _set_placement(user_id, shard=target, moving_to=None)
+    progress(f'switched to shard {target}, waiting {settle_seconds:g}s before deleting from shard {source}')
+    time.sleep(settle_seconds)
+    _delete_user(shard_map.url(source), user_id)
+    return result
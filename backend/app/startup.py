@@ -0,0 +1,200 @@
+"""
+Worker startup: warm-up work done before the first request, and measuring it.
+
+A new worker would otherwise pay for several things on its first requests:
+opening database connections, loading the Argon2 and JWT code on the first
+login, and building the OpenAPI schema on the first `/docs` visit. The
+lifespan hook in `app.main` runs `warm_up` before the worker accepts
+connections instead. The steps run concurrently in threads, and a step
+that fails or takes longer than STARTUP_WARMUP_TIMEOUT_SECONDS is logged and
+skipped, so a database that is down or unreachable does not keep the worker
+from starting (`/ready` reports it).
+
+- STARTUP_POOL_CONNECTIONS connections are opened on each shard's pool and
+  returned to it, up to the pool size;
+- an access token is signed and decoded, and a password hashed;
+- the OpenAPI schema is built and serialized once; `/openapi.json` serves
+  the cached bytes.
+
+`import_times` and `time_to_first_request` measure startup from the outside,
+for `scripts/benchmark-startup.py` and the startup benchmarks.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Callable, Optional
+
+from fastapi import FastAPI
+from sqlalchemy import Engine, event
+from sqlalchemy.pool import QueuePool
+
+from app import metrics
+from app.auth.security import create_access_token, decode_access_token, get_password_hash, verify_password
+from app.database import shard_map
+
+logger = logging.getLogger(__name__)
+
+STARTUP_POOL_CONNECTIONS = int(os.getenv('STARTUP_POOL_CONNECTIONS', '2'))
+STARTUP_WARMUP_TIMEOUT_SECONDS = float(os.getenv('STARTUP_WARMUP_TIMEOUT_SECONDS', '10'))
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+warmup_gauge = metrics.gauge('startup_warmup_seconds', 'Time spent warming up this worker before serving')
+
+_openapi_json: Optional[bytes] = None
+
+# Set while warm-up opens connections, which then give up connecting in time
+_warming_up = contextvars.ContextVar('warming_up', default=False)
+
+
+def openapi_json(app: FastAPI) -> bytes:
+    """The app's OpenAPI schema as JSON, built once per worker."""
+    global _openapi_json
+    if _openapi_json is None:
+        _openapi_json = json.dumps(app.openapi(), separators=(',', ':')).encode()
+    return _openapi_json
+
+
+def _warm_up_connect_timeout(dialect, connection_record, cargs, cparams):
+    if not _warming_up.get():
+        return None
+    # Connect here rather than edit `cparams`, which every later connection shares.
+    # libpq takes whole seconds, and treats anything below 2 as 2.
+    return dialect.connect(*cargs, **{'connect_timeout': max(2, math.ceil(STARTUP_WARMUP_TIMEOUT_SECONDS)), **cparams})
+
+
+def _open(engine: Engine, count: int) -> int:
+    if not event.contains(engine, 'do_connect', _warm_up_connect_timeout):
+        event.listen(engine, 'do_connect', _warm_up_connect_timeout)
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.raw_connection())
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def open_pool_connections(count: int = STARTUP_POOL_CONNECTIONS) -> int:
+    """
+    Open up to `count` connections on every shard's pool and leave them idle there.
+
+    Each connection attempt gives up after STARTUP_WARMUP_TIMEOUT_SECONDS, so
+    the thread does not outlive the warm-up by long when a database hangs.
+    """
+    opened = 0
+    token = _warming_up.set(True)
+    try:
+        for engine in shard_map.engines:
+            pool = engine.pool
+            # Other pools keep no idle connections to warm
+            if isinstance(pool, QueuePool):
+                opened += _open(engine, min(count, pool.size()))
+    finally:
+        _warming_up.reset(token)
+    return opened
+
+
+def warm_auth() -> None:
+    """Run the JWT and Argon2 code paths once, so their lazy setup is done."""
+    decode_access_token(create_access_token({'sub': 'warm-up'}))
+    verify_password('warm-up', get_password_hash('warm-up'))
+
+
+async def warm_up(app: FastAPI, timeout: float = STARTUP_WARMUP_TIMEOUT_SECONDS) -> dict[str, float]:
+    """Run the warm-up steps concurrently, each for up to `timeout` seconds; returns the seconds each took."""
+    steps: dict[str, Callable[[], object]] = {
+        'pool_connections': open_pool_connections,
+        'auth': warm_auth,
+        'openapi': lambda: openapi_json(app),
+    }
+
+    async def run(name: str, step: Callable[[], object]) -> float:
+        start = time.perf_counter()
+        try:
+            # A step that times out keeps running in its thread, but startup goes on
+            await asyncio.wait_for(asyncio.to_thread(step), timeout)
+        except TimeoutError:
+            logger.warning('Startup warm-up step %s timed out after %.0fs', name, timeout)
+        except Exception:
+            logger.exception('Startup warm-up step %s failed', name)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    durations = dict(zip(steps, await asyncio.gather(*(run(name, step) for name, step in steps.items()))))
+    total = time.perf_counter() - start
+    warmup_gauge.set(total)
+    logger.info(
+        'Warmed up in %.0fms (%s)',
+        total * 1000,
+        ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in durations.items()),
+    )
+    return durations
+
+
+def import_times(module: str = 'app.main') -> dict[str, tuple[float, float]]:
+    """
+    Seconds spent importing each module when a fresh interpreter imports `module`.
+
+    Measured with `python -X importtime`. Returns (self, cumulative) seconds
+    per module, in import order; `module`'s cumulative time is the total.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix('import time:').split('|')
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return times
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_request(path: str = '/ready', timeout: float = 60, env: Optional[dict[str, str]] = None) -> float:
+    """
+    Seconds from launching a uvicorn worker until `path` first answers 200.
+
+    Includes interpreter start, imports and the lifespan warm-up. Raises
+    TimeoutError if the worker does not answer successfully within `timeout`.
+    """
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f'uvicorn exited with status {server.returncode}')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=timeout) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f'{path} did not answer 200 within {timeout:.0f}s')
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,471 @@
+"""
+Lightweight in-process request tracing.
+
+Every HTTP request gets a trace whose root span covers the whole request.
+Child spans are opened with `span()`; the current span lives in a context
+variable, so spans opened in threadpool code (sync dependencies, password
+hashing) attach to the request that caused them. Out of the box there are
+spans for:
+
+- dependency resolution, the endpoint and response serialization of every
+  route using `TracedRoute`;
+- each SQL statement run through an engine passed to `instrument_engine`;
+- JWT encoding/decoding and password hashing in `app.auth.security`.
+
+Spans with a `timing` name are summed into the `Server-Timing` response
+header, which browser dev tools show next to the request.
+
+A sampled fraction of traces (TRACE_SAMPLE_RATE) is appended to TRACE_FILE,
+one OTLP/JSON `resourceSpans` document per line. That is the format of the
+OpenTelemetry collector's `otlpjsonfile` receiver, so a local collector can
+ingest the file as is. An incoming W3C `traceparent` header continues its
+trace, but its sampled flag is only honored TRACEPARENT_SAMPLED_PER_SECOND
+times a second per worker, since any client can set it. Traces are written by
+a background thread through a bounded queue (dropped when it is full), and
+the file is rotated to `<TRACE_FILE>.1` once it reaches TRACE_FILE_MAX_BYTES.
+Tracing is disabled entirely with TRACING_ENABLED=false.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_FILE = Path(os.getenv('TRACE_FILE', '/tmp/traces.jsonl'))
+TRACE_FILE_MAX_BYTES = int(os.getenv('TRACE_FILE_MAX_BYTES', str(100 * 1024 * 1024)))
+TRACEPARENT_SAMPLED_PER_SECOND = float(os.getenv('TRACEPARENT_SAMPLED_PER_SECOND', '1'))
+SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'test-fullstack-template-backend')
+
+MAX_STATEMENT_LENGTH = 1000
+EXPORT_QUEUE_SIZE = 1000
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'timing', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(
+        self,
+        trace: 'Trace',
+        name: str,
+        parent_id: Optional[str],
+        kind: int = KIND_INTERNAL,
+        timing: Optional[str] = None,
+        attributes: Optional[dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+    ):
+        self.trace = trace
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.timing = timing
+        self.attributes = attributes or {}
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> dict[str, Any]:
+        span: dict[str, Any] = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Trace:
+    """Spans of one request."""
+
+    def __init__(self, trace_id: Optional[str] = None, sampled: bool = False):
+        self.trace_id = trace_id or f'{random.getrandbits(128):032x}'
+        self.sampled = sampled
+        self.spans: list[Span] = []
+
+    def server_timing(self, total: Span) -> str:
+        """Server-Timing header value summing finished spans by their timing name."""
+        durations: dict[str, float] = {}
+        counts: dict[str, int] = {}
+        for span in self.spans:
+            if span.timing and span.end_ns is not None:
+                durations[span.timing] = durations.get(span.timing, 0.0) + span.duration_ms
+                counts[span.timing] = counts.get(span.timing, 0) + 1
+        metrics = [
+            f'{name};dur={duration:.2f}' + (f';desc="{counts[name]}x"' if counts[name] > 1 else '')
+            for name, duration in durations.items()
+        ]
+        metrics.append(f'total;dur={total.duration_ms:.2f}')
+        return ', '.join(metrics)
+
+    def to_otlp(self) -> dict[str, Any]:
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.to_otlp() for span in self.spans],
+                }],
+            }],
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+_export_lock = threading.Lock()
+
+dropped_counter = metrics.counter('traces_dropped', 'Sampled traces dropped because the export queue was full')
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, timing: Optional[str] = None, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Time a block as a child of the current span.
+
+    Does nothing outside a traced request.
+
+    Args:
+        name: Span name
+        timing: Server-Timing metric the duration is added to, if any
+        kind: OTLP span kind
+        **attributes: Span attributes
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, kind=kind, timing=timing, attributes=attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def traced(name: str, timing: Optional[str] = None) -> Callable:
+    """Decorator form of `span` for plain functions."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            with span(name, timing=timing):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def export(trace: Trace, path: Path = TRACE_FILE, max_bytes: int = TRACE_FILE_MAX_BYTES) -> None:
+    """Append a trace to the JSON-lines file, rotating it to `<path>.1` when full."""
+    line = json.dumps(trace.to_otlp(), separators=(',', ':')) + '\n'
+    try:
+        with _export_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open('a') as f:
+                f.write(line)
+                size = f.tell()
+            if size >= max_bytes:
+                path.replace(path.with_name(path.name + '.1'))
+    except OSError:
+        logger.exception('Could not write trace to %s', path)
+
+
+class Exporter:
+    """Writes traces from a daemon thread, so request handling never waits on the disk."""
+
+    def __init__(self, size: int = EXPORT_QUEUE_SIZE):
+        self._queue: queue.Queue[tuple[Trace, Path]] = queue.Queue(maxsize=size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: Trace, path: Path) -> None:
+        """Queue a finished trace; drops it if the writer has fallen behind."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait((trace, path))
+        except queue.Full:
+            dropped_counter.inc()
+
+    def flush(self) -> None:
+        """Wait until every queued trace is written."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            trace, path = self._queue.get()
+            try:
+                export(trace, path)
+            finally:
+                self._queue.task_done()
+
+
+exporter = Exporter()
+
+
+class RateLimit:
+    """Token bucket allowing `rate` events a second, in bursts of up to one second's worth."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if self.rate <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record a client span for every SQL statement run on the engine."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        conn.info.setdefault('trace_spans', []).append(
+            Span(
+                parent.trace,
+                'db.query',
+                parent.span_id,
+                kind=KIND_CLIENT,
+                timing='db',
+                attributes={'db.system': 'postgresql', 'db.statement': statement[:MAX_STATEMENT_LENGTH]},
+            )
+        )
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get('trace_spans')
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        spans = context.connection.info.get('trace_spans') if context.connection is not None else None
+        if spans:
+            failed = spans.pop()
+            failed.error = type(context.original_exception).__name__
+            failed.end()
+
+
+class _RouteTiming:
+    __slots__ = ('handler_start_ns', 'endpoint_end_ns')
+
+    def __init__(self):
+        self.handler_start_ns = time.time_ns()
+        self.endpoint_end_ns: Optional[int] = None
+
+
+_route_timing: contextvars.ContextVar[Optional[_RouteTiming]] = contextvars.ContextVar('route_timing', default=None)
+
+
+def _record_dependencies() -> None:
+    parent = _current_span.get()
+    timing = _route_timing.get()
+    if parent is not None and timing is not None:
+        Span(parent.trace, 'resolve dependencies', parent.span_id, timing='deps', start_ns=timing.handler_start_ns).end()
+
+
+def _trace_endpoint(endpoint: Callable) -> Callable:
+    # Routes are copied, endpoint included, each time a router is included
+    if getattr(endpoint, '__traced_endpoint__', False):
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            _record_dependencies()
+            try:
+                with span('endpoint', timing='app'):
+                    return await endpoint(*args, **kwargs)
+            finally:
+                timing = _route_timing.get()
+                if timing is not None:
+                    timing.endpoint_end_ns = time.time_ns()
+
+        async_wrapper.__traced_endpoint__ = True  # type: ignore[attr-defined]
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        _record_dependencies()
+        try:
+            with span('endpoint', timing='app'):
+                return endpoint(*args, **kwargs)
+        finally:
+            timing = _route_timing.get()
+            if timing is not None:
+                timing.endpoint_end_ns = time.time_ns()
+
+    wrapper.__traced_endpoint__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+class TracedRoute(APIRoute):
+    """
+    APIRoute that splits its handling into dependency resolution, endpoint
+    and response serialization spans, and names the request span after the
+    route template.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        super().__init__(path, _trace_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            root = _current_span.get()
+            if root is None:
+                return await handler(request)
+            root.name = f'{request.method} {self.path_format}'
+            root.attributes['http.route'] = self.path_format
+
+            timing = _RouteTiming()
+            token = _route_timing.set(timing)
+            try:
+                response = await handler(request)
+            finally:
+                _route_timing.reset(token)
+            if timing.endpoint_end_ns is not None:
+                Span(root.trace, 'serialize response', root.span_id, timing='serialize', start_ns=timing.endpoint_end_ns).end()
+            return response
+
+        return traced_handler
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of every HTTP request."""
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        path: Path = TRACE_FILE,
+        traceparent_sampled_per_second: float = TRACEPARENT_SAMPLED_PER_SECOND,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.path = path
+        self.traceparent_sampling = RateLimit(traceparent_sampled_per_second)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = None, None, random.random() < self.sample_rate
+        for name, value in scope['headers']:
+            if name == b'traceparent':
+                match = TRACEPARENT_RE.match(value.decode('latin-1'))
+                if match:
+                    trace_id, parent_id = match.group(1), match.group(2)
+                    if not sampled and int(match.group(3), 16) & 1:
+                        sampled = self.traceparent_sampling.allow()
+                break
+
+        trace = Trace(trace_id, sampled)
+        root = Span(
+            trace,
+            f"{scope['method']} {scope['path']}",
+            parent_id,
+            kind=KIND_SERVER,
+            attributes={'http.request.method': scope['method'], 'url.path': scope['path']},
+        )
+        token = _current_span.set(root)
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                root.attributes['http.response.status_code'] = message['status']
+                headers = [
+                    *message.get('headers', []),
+                    (b'server-timing', trace.server_timing(root).encode('latin-1')),
+                ]
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            root.end()
+            if trace.sampled:
+                exporter.submit(trace, self.path)
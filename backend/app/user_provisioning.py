@@ -0,0 +1,344 @@
+"""
+Bulk user provisioning and password resets.
+
+Users are read from CSV (with an `email` header column and optional
+`password` and `is_active` columns) or NDJSON (one object with the same keys
+per line). Passwords are hashed with `get_password_hash`, so bulk-created
+accounts get exactly the hasher policy of registration, in a process pool
+sized to the machine since Argon2 is deliberately slow. Users are then
+upserted by email in chunks, one transaction per chunk:
+
+- `upsert` creates missing users and resets the password (and `is_active`,
+  when given) of existing ones;
+- `reset` only updates existing users and reports unknown emails.
+
+Existing users are written on the shard `user_directory` puts them on, new
+users on the shard picked from their ID (as registration does), and new
+users are added to the directory with that shard. The chunk's home shard
+writes and directory entries share one transaction; writes on other shards
+are committed first, so if the chunk then fails those users are unreachable
+without a directory entry, as with registration. Users being moved between
+shards are skipped and reported.
+
+After each committed chunk the number of records consumed is written to a
+state file, so an interrupted run continues after the last committed chunk.
+Re-applying a chunk after a crash between commit and checkpoint is harmless.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import Connection, Row, text
+
+from app.auth.security import get_password_hash
+from app.database import HOME_SHARD, shard_map
+from app.ids import uuid7
+
+MODE_UPSERT = 'upsert'
+MODE_RESET = 'reset'
+
+PROVISION_CHUNK_SIZE = 500
+
+TRUE_VALUES = frozenset({'1', 'true', 'yes', 'y', 't'})
+FALSE_VALUES = frozenset({'0', 'false', 'no', 'n', 'f'})
+
+
+@dataclass
+class UserRecord:
+    line: int
+    email: str
+    password: Optional[str]
+    is_active: Optional[bool] = None
+    # Why the input could not be read; such records are reported and skipped
+    error: Optional[str] = None
+
+
+@dataclass
+class ProvisionResult:
+    processed: int = 0
+    created: int = 0
+    updated: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+def _parse_bool(value, line: int) -> Optional[bool]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    normalized = str(value).strip().lower()
+    if normalized in TRUE_VALUES:
+        return True
+    if normalized in FALSE_VALUES:
+        return False
+    raise ValueError(f'line {line}: is_active must be true or false, got {value!r}')
+
+
+def _invalid(line: int, error: str) -> UserRecord:
+    return UserRecord(line=line, email='', password=None, error=f'line {line}: {error}')
+
+
+def _record(line: int, data) -> UserRecord:
+    if not isinstance(data, dict):
+        return _invalid(line, 'expected an object')
+    email = data.get('email') or ''
+    password = data.get('password') or None
+    if not isinstance(email, str) or not isinstance(password, (str, type(None))):
+        return _invalid(line, 'email and password must be strings')
+    try:
+        is_active = _parse_bool(data.get('is_active'), line)
+    except ValueError as e:
+        return UserRecord(line=line, email=email.strip(), password=None, error=str(e))
+    return UserRecord(line=line, email=email.strip(), password=password, is_active=is_active)
+
+
+def read_users(path: Path, format: Optional[str] = None) -> Iterator[UserRecord]:
+    """
+    Read user records from a CSV or NDJSON file.
+
+    The format is taken from the file extension (.csv, .ndjson or .jsonl)
+    unless given. Blank NDJSON lines are skipped. Records that cannot be read
+    (malformed JSON, a bad is_active value) are yielded with `error` set, so
+    they are reported without ending the run.
+    """
+    format = format or ('csv' if path.suffix.lower() == '.csv' else 'ndjson')
+    with path.open(newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or 'email' not in reader.fieldnames:
+                raise ValueError('CSV input needs an email column')
+            for row in reader:
+                yield _record(reader.line_num, row)
+        elif format == 'ndjson':
+            for line, raw in enumerate(f, start=1):
+                if not raw.strip():
+                    continue
+                try:
+                    data = json.loads(raw)
+                except json.JSONDecodeError as e:
+                    yield _invalid(line, f'invalid JSON: {e.msg}')
+                    continue
+                yield _record(line, data)
+        else:
+            raise ValueError(f'Unknown format: {format}')
+
+
+def _columns(rows: list[dict]) -> dict[str, list]:
+    return {
+        'ids': [row['id'] for row in rows],
+        'emails': [row['email'] for row in rows],
+        'hashes': [row['hashed_password'] for row in rows],
+        'active': [row['is_active'] for row in rows],
+    }
+
+
+def _upsert(conn: Connection, rows: list[dict]) -> list[Row]:
+    written = conn.execute(
+        text(
+            'INSERT INTO users (id, email, hashed_password, is_active, date_created, date_updated) '
+            'SELECT v.id, v.email, v.hashed_password, coalesce(v.is_active, true), now(), now() '
+            'FROM unnest(CAST(:ids AS uuid[]), CAST(:emails AS text[]), CAST(:hashes AS text[]), CAST(:active AS boolean[])) '
+            '  AS v(id, email, hashed_password, is_active) '
+            'ON CONFLICT (email) DO UPDATE SET '
+            '  hashed_password = EXCLUDED.hashed_password, date_updated = now() '
+            'RETURNING id, email, (xmax = 0) AS inserted'
+        ),
+        _columns(rows),
+    ).all()
+    # EXCLUDED cannot tell a missing is_active from true, so existing users get theirs separately
+    conn.execute(
+        text(
+            'UPDATE users u SET is_active = v.is_active '
+            'FROM unnest(CAST(:emails AS text[]), CAST(:active AS boolean[])) AS v(email, is_active) '
+            'WHERE u.email = v.email AND v.is_active IS NOT NULL AND u.is_active <> v.is_active'
+        ),
+        {'emails': [row['email'] for row in rows], 'active': [row['is_active'] for row in rows]},
+    )
+    return list(written)
+
+
+def _add_to_directory(conn: Connection, users: list[Row], shard: int) -> None:
+    conn.execute(
+        text(
+            'INSERT INTO user_directory (user_id, email, shard, date_created) '
+            'SELECT v.user_id, v.email, :shard, now() '
+            'FROM unnest(CAST(:ids AS uuid[]), CAST(:emails AS text[])) AS v(user_id, email) '
+            'ON CONFLICT DO NOTHING'
+        ),
+        {'ids': [str(user.id) for user in users], 'emails': [user.email for user in users], 'shard': shard},
+    )
+
+
+def _directory(conn: Connection, emails: list[str]) -> dict[str, Row]:
+    rows = conn.execute(
+        text('SELECT email, user_id, shard, moving_to FROM user_directory WHERE email = ANY(:emails)'),
+        {'emails': emails},
+    ).all()
+    return {row.email: row for row in rows}
+
+
+@contextmanager
+def _on_shard(conn: Connection, shard: int) -> Iterator[Connection]:
+    """`conn` for the home shard, otherwise a transaction on `shard` committed on exit."""
+    if shard == HOME_SHARD:
+        yield conn
+        return
+    with shard_map.engines[shard].begin() as shard_conn:
+        yield shard_conn
+
+
+def _reset(conn: Connection, rows: list[dict]) -> set[str]:
+    updated = conn.execute(
+        text(
+            'UPDATE users u SET hashed_password = v.hashed_password, '
+            '  is_active = coalesce(v.is_active, u.is_active), date_updated = now() '
+            'FROM unnest(CAST(:emails AS text[]), CAST(:hashes AS text[]), CAST(:active AS boolean[])) '
+            '  AS v(email, hashed_password, is_active) '
+            'WHERE u.email = v.email '
+            'RETURNING u.email'
+        ),
+        _columns(rows),
+    ).scalars().all()
+    return set(updated)
+
+
+def apply_chunk(conn: Connection, records: list[UserRecord], hashes: list[str], mode: str = MODE_UPSERT) -> ProvisionResult:
+    """
+    Write one chunk of hashed records, each on its user's shard.
+
+    `conn` is on the home shard; its writes and the new directory entries are
+    left in the caller's transaction. When an email appears more than once in
+    the chunk, its last record wins.
+    """
+    if mode not in (MODE_UPSERT, MODE_RESET):
+        raise ValueError(f'Unknown mode: {mode}')
+    latest: dict[str, dict] = {}
+    for record, hashed in zip(records, hashes):
+        latest[record.email] = {
+            'id': str(uuid7()),
+            'email': record.email,
+            'hashed_password': hashed,
+            'is_active': record.is_active,
+            'line': record.line,
+        }
+    rows = list(latest.values())
+
+    result = ProvisionResult(processed=len(records))
+    placed = _directory(conn, [row['email'] for row in rows]) if rows else {}
+    by_shard: dict[int, list[dict]] = {}
+    for row in rows:
+        entry = placed.get(row['email'])
+        if entry is None:
+            shard = shard_map.placement(row['id'])
+        elif entry.moving_to is not None:
+            result.errors.append(f"line {row['line']}: user {row['email']} is being moved to shard {entry.moving_to}")
+            continue
+        else:
+            row['id'], shard = str(entry.user_id), entry.shard
+        by_shard.setdefault(shard, []).append(row)
+
+    # The home shard last, so a failure on another shard rolls its writes back
+    for shard in sorted(by_shard, key=lambda shard: shard == HOME_SHARD):
+        group = by_shard[shard]
+        with _on_shard(conn, shard) as shard_conn:
+            if mode == MODE_UPSERT:
+                written = _upsert(shard_conn, group)
+                created = sum(user.inserted for user in written)
+                result.created += created
+                result.updated += len(written) - created
+                _add_to_directory(conn, written, shard)
+            else:
+                found = _reset(shard_conn, group)
+                result.updated += len(found)
+                result.errors += [
+                    f"line {row['line']}: no user with email {row['email']}"
+                    for row in group if row['email'] not in found
+                ]
+    return result
+
+
+def _chunks(records: Iterable[UserRecord], size: int) -> Iterator[list[UserRecord]]:
+    it = iter(records)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def read_checkpoint(state_path: Path) -> int:
+    """Number of input records already committed by an earlier run."""
+    try:
+        return int(json.loads(state_path.read_text())['processed'])
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(state_path: Path, processed: int) -> None:
+    tmp = state_path.with_name(state_path.name + '.tmp')
+    tmp.write_text(json.dumps({'processed': processed}))
+    os.replace(tmp, state_path)
+
+
+def provision(
+    conn: Connection,
+    records: Iterable[UserRecord],
+    executor: Executor,
+    mode: str = MODE_UPSERT,
+    chunk_size: int = PROVISION_CHUNK_SIZE,
+    state_path: Optional[Path] = None,
+    on_progress: Optional[Callable[[ProvisionResult, float], None]] = None,
+) -> ProvisionResult:
+    """
+    Hash and write users in chunks, one transaction per chunk.
+
+    Records that could not be read, or lack an email or a password, are
+    reported as errors and skipped.
+
+    Args:
+        conn: Connection not inside a transaction
+        records: User records, e.g. from `read_users`
+        executor: Pool the password hashes are computed in
+        mode: MODE_UPSERT or MODE_RESET
+        chunk_size: Records per transaction
+        state_path: Checkpoint file; records committed by an earlier run are skipped
+        on_progress: Called with the running totals and the elapsed seconds after each chunk
+
+    Returns:
+        ProvisionResult: Totals of this run, including records skipped as invalid
+    """
+    skip = read_checkpoint(state_path) if state_path is not None else 0
+    total = ProvisionResult(processed=skip)
+    start = time.monotonic()
+
+    for chunk in _chunks(islice(records, skip, None), chunk_size):
+        valid = []
+        for record in chunk:
+            if record.error:
+                total.errors.append(record.error)
+            elif not record.email or not record.password:
+                total.errors.append(f'line {record.line}: email and password are required')
+            else:
+                valid.append(record)
+
+        # A few pieces per core keeps every worker busy without a round trip per hash
+        pieces = max(1, len(valid) // (4 * (os.cpu_count() or 1)))
+        hashes = list(executor.map(get_password_hash, [record.password for record in valid], chunksize=pieces))
+
+        with conn.begin():
+            result = apply_chunk(conn, valid, hashes, mode)
+
+        total.processed += len(chunk)
+        total.created += result.created
+        total.updated += result.updated
+        total.errors += result.errors
+        if state_path is not None:
+            _write_checkpoint(state_path, total.processed)
+        if on_progress is not None:
+            on_progress(total, time.monotonic() - start)
+
+    return total
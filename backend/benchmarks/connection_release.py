@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Connection Release Benchmark
+
+Measures how many concurrent note listing requests a small connection pool
+can serve when each request
+
+- held: keeps its connection until the response has been written, as
+  `get_db` did when the session was closed after the response was sent
+- released: returns its connection right after its last query, as
+  `list_notes` does with `release_connection`
+
+Each simulated request loads a user's notes with the same query as
+`list_notes`, serializes them with the same TypeAdapter, then sleeps for
+--write-ms to stand in for writing the response to a slow client. Requests
+run on --concurrency threads against a pool of --pool-size connections with
+no overflow, and the report shows throughput per pool slot and latency.
+
+The notes are created for a scratch user in the configured database and
+deleted afterwards.
+
+Usage:
+    python benchmarks/connection_release.py [--pool-size 4] [--concurrency 32] [--requests 2000] [--notes 50] [--write-ms 20]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import selectinload, sessionmaker, undefer
+
+from app.auth import get_password_hash
+from app.database import DATABASE_URL, release_connection
+from app.ids import uuid7
+from app.load_shedding import TimedQueuePool
+from app.models.note import Note
+from app.models.user import User
+from app.routers.note import NoteResponse, note_list_adapter
+
+MODES = ('held', 'released')
+
+
+def seed(session_factory, notes: int) -> str:
+    db = session_factory()
+    try:
+        user = User(
+            id=str(uuid7()),
+            email=f'bench-{uuid.uuid4().hex}@example.com',
+            hashed_password=get_password_hash(uuid.uuid4().hex),
+            is_active=True,
+        )
+        db.add(user)
+        db.flush()
+        db.add_all(
+            Note(id=str(uuid7()), title=f'Note {i}', content='lorem ipsum ' * 40, user_id=user.id)
+            for i in range(notes)
+        )
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def cleanup(session_factory, user_id: str) -> None:
+    db = session_factory()
+    try:
+        db.execute(text('DELETE FROM notes WHERE user_id = :id'), {'id': user_id})
+        db.execute(text('DELETE FROM users WHERE id = :id'), {'id': user_id})
+        db.commit()
+    finally:
+        db.close()
+
+
+def handle(session_factory, user_id: str, mode: str, write_seconds: float) -> float:
+    start = time.perf_counter()
+    db = session_factory()
+    try:
+        notes = (
+            db.query(Note)
+            .options(undefer(Note.inline_content), selectinload(Note.body))
+            .filter(Note.user_id == user_id)
+            .all()
+        )
+        if mode == 'released':
+            release_connection(db)
+        note_list_adapter.dump_json([
+            NoteResponse(
+                id=note.id,
+                title=note.title,
+                content=note.content,
+                user_id=note.user_id,
+                date_created=note.date_created,
+                date_updated=note.date_updated,
+            )
+            for note in notes
+        ])
+        time.sleep(write_seconds)
+    finally:
+        db.close()
+    return time.perf_counter() - start
+
+
+def run(mode: str, session_factory, user_id: str, args: argparse.Namespace) -> dict[str, float]:
+    write_seconds = args.write_ms / 1000
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        start = time.perf_counter()
+        latencies = list(executor.map(
+            lambda _: handle(session_factory, user_id, mode, write_seconds), range(args.requests)
+        ))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    throughput = args.requests / elapsed
+    return {
+        'throughput': throughput,
+        'per_slot': throughput / args.pool_size,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare holding and releasing pooled connections')
+    parser.add_argument('--pool-size', type=int, default=4, help='Pooled connections (no overflow)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent requests')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+    parser.add_argument('--notes', type=int, default=50, help='Notes in the listing')
+    parser.add_argument('--write-ms', type=float, default=20, help='Simulated time to write the response')
+    args = parser.parse_args()
+
+    engine = create_engine(
+        DATABASE_URL, poolclass=TimedQueuePool, pool_size=args.pool_size, max_overflow=0, pool_timeout=60
+    )
+    session_factory = sessionmaker(autoflush=False, bind=engine)
+
+    print(
+        f'🏁 {args.requests} listings of {args.notes} notes, {args.concurrency} concurrent, '
+        f'{args.pool_size} pooled connections, {args.write_ms:g} ms response write\n'
+    )
+    user_id = seed(session_factory, args.notes)
+    try:
+        # Warm up the pool and the query plans
+        run('released', session_factory, user_id, argparse.Namespace(**{**vars(args), 'requests': args.concurrency}))
+
+        print(f"{'mode':<10} {'req/s':>9} {'req/s/slot':>11} {'p50 ms':>9} {'p95 ms':>9}")
+        results = {}
+        for mode in MODES:
+            results[mode] = run(mode, session_factory, user_id, args)
+            r = results[mode]
+            print(f"{mode:<10} {r['throughput']:>9.1f} {r['per_slot']:>11.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f}")
+
+        print(f"\n📈 Releasing early serves {results['released']['throughput'] / results['held']['throughput']:.1f}x the requests per pool slot")
+    finally:
+        cleanup(session_factory, user_id)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Notes Partitioning Benchmark
+
+Compares a plain heap `notes` table with one hash-partitioned by user_id as the
+total row count grows. For every size it reports the mean latency of the list
+query (all notes of one user), the get query (one note by id and user_id) and
+the time to VACUUM after churning one user's notes. The number of users grows
+with the table so every user keeps the same number of notes. For the
+partitioned layout only the partition holding that user is vacuumed, which is
+what autovacuum does.
+
+Tables are created in a scratch `bench_partitioning` schema of the configured
+database and dropped afterwards.
+
+Usage:
+    python benchmarks/notes_partitioning.py [--sizes 10000 100000 1000000]
+        [--rows-per-user 100] [--partitions 16] [--queries 200]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.database import engine
+
+SCHEMA = 'bench_partitioning'
+
+COLUMNS = """
+    id VARCHAR NOT NULL,
+    title VARCHAR NOT NULL,
+    content TEXT NOT NULL,
+    has_external_body BOOLEAN DEFAULT false NOT NULL,
+    user_id VARCHAR NOT NULL,
+    date_created TIMESTAMP WITH TIME ZONE NOT NULL,
+    date_updated TIMESTAMP WITH TIME ZONE NOT NULL
+"""
+
+
+def create_heap(conn) -> None:
+    conn.execute(text(f'CREATE TABLE {SCHEMA}.notes ({COLUMNS}, PRIMARY KEY (id))'))
+    conn.execute(text(f'CREATE INDEX ON {SCHEMA}.notes (user_id, date_updated)'))
+
+
+def create_partitioned(conn, partitions: int) -> None:
+    conn.execute(
+        text(
+            f'CREATE TABLE {SCHEMA}.notes ({COLUMNS}, PRIMARY KEY (user_id, id)) '
+            f'PARTITION BY HASH (user_id)'
+        )
+    )
+    for remainder in range(partitions):
+        conn.execute(
+            text(
+                f'CREATE TABLE {SCHEMA}.notes_p{remainder:02d} PARTITION OF {SCHEMA}.notes '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            )
+        )
+    conn.execute(text(f'CREATE INDEX ON {SCHEMA}.notes (id)'))
+    conn.execute(text(f'CREATE INDEX ON {SCHEMA}.notes (user_id, date_updated)'))
+
+
+def load_rows(conn, rows: int, users: int) -> None:
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {SCHEMA}.notes (id, title, content, user_id, date_created, date_updated)
+            SELECT md5(i::text), 'title ' || i, repeat('body ', 40), 'user-' || (i % :users), now(), now()
+            FROM generate_series(1, :rows) AS i
+            """
+        ),
+        {'rows': rows, 'users': users},
+    )
+    conn.execute(text(f'ANALYZE {SCHEMA}.notes'))
+
+
+def mean_ms(conn, sql: str, params: list[dict]) -> float:
+    timings = []
+    statement = text(sql)
+    for p in params:
+        start = time.perf_counter()
+        conn.execute(statement, p).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(timings)
+
+
+def vacuum_ms(conn, user_id: str, partitioned: bool) -> float:
+    conn.execute(
+        text(f"UPDATE {SCHEMA}.notes SET title = title || '*' WHERE user_id = :user_id"),
+        {'user_id': user_id},
+    )
+    if partitioned:
+        partition = conn.execute(
+            text(f'SELECT tableoid::regclass::text FROM {SCHEMA}.notes WHERE user_id = :user_id LIMIT 1'),
+            {'user_id': user_id},
+        ).scalar()
+        target = partition
+    else:
+        target = f'{SCHEMA}.notes'
+    start = time.perf_counter()
+    conn.execute(text(f'VACUUM {target}'))
+    return (time.perf_counter() - start) * 1000
+
+
+def run(layout: str, rows: int, args: argparse.Namespace) -> dict[str, float]:
+    partitioned = layout == 'partitioned'
+    users = max(1, rows // args.rows_per_user)
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA {SCHEMA}'))
+        try:
+            if partitioned:
+                create_partitioned(conn, args.partitions)
+            else:
+                create_heap(conn)
+            load_rows(conn, rows, users)
+
+            rng = random.Random(rows)
+            samples = [rng.randrange(1, rows + 1) for _ in range(args.queries)]
+            list_params = [{'user_id': f'user-{i % users}'} for i in samples]
+            get_params = [{'id': f'{i}', 'user_id': f'user-{i % users}'} for i in samples]
+
+            list_ms = mean_ms(conn, f'SELECT * FROM {SCHEMA}.notes WHERE user_id = :user_id', list_params)
+            get_ms = mean_ms(
+                conn,
+                f'SELECT * FROM {SCHEMA}.notes WHERE id = md5(:id) AND user_id = :user_id',
+                get_params,
+            )
+            vac_ms = vacuum_ms(conn, list_params[0]['user_id'], partitioned)
+        finally:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+
+    return {'list_ms': list_ms, 'get_ms': get_ms, 'vacuum_ms': vac_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--rows-per-user', type=int, default=100)
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'layout':<12} {'rows':>10} {'list ms':>10} {'get ms':>10} {'vacuum ms':>10}")
+    for rows in args.sizes:
+        for layout in ('heap', 'partitioned'):
+            result = run(layout, rows, args)
+            print(
+                f"{layout:<12} {rows:>10} {result['list_ms']:>10.3f} "
+                f"{result['get_ms']:>10.3f} {result['vacuum_ms']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
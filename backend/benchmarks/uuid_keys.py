@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Primary Key Benchmark
+
+Compares three key layouts for a notes-like table:
+
+- text_v4: VARCHAR columns holding uuid4 strings (the original schema)
+- uuid_v4: native UUID columns holding random uuid4 values
+- uuid_v7: native UUID columns holding time-ordered values from app.ids.uuid7
+
+For each layout it inserts the same number of rows in batches and reports insert
+throughput plus the size of the table, the primary key index and the user_id
+index. Tables are created in a scratch `bench_uuid_keys` schema of the
+configured database and dropped afterwards.
+
+Usage:
+    python benchmarks/uuid_keys.py [--rows 200000] [--batch-size 100] [--users 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.ids import uuid7
+
+SCHEMA = 'bench_uuid_keys'
+
+LAYOUTS = {
+    'text_v4': ('VARCHAR', lambda: str(uuid.uuid4())),
+    'uuid_v4': ('UUID', lambda: str(uuid.uuid4())),
+    'uuid_v7': ('UUID', lambda: str(uuid7())),
+}
+
+
+def run(layout: str, args: argparse.Namespace) -> dict[str, float]:
+    key_type, new_id = LAYOUTS[layout]
+    table = f'{SCHEMA}.notes_{layout}'
+    user_ids = [new_id() for _ in range(args.users)]
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}'))
+        conn.execute(
+            text(
+                f'CREATE TABLE {table} ('
+                f'  id {key_type} PRIMARY KEY,'
+                f'  user_id {key_type} NOT NULL,'
+                f'  title VARCHAR NOT NULL,'
+                f'  date_created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()'
+                f')'
+            )
+        )
+        conn.execute(text(f'CREATE INDEX ix_{layout}_user_id ON {table} (user_id)'))
+
+        insert = text(f'INSERT INTO {table} (id, user_id, title) VALUES (:id, :user_id, :title)')
+        start = time.perf_counter()
+        for offset in range(0, args.rows, args.batch_size):
+            count = min(args.batch_size, args.rows - offset)
+            rows = [
+                {'id': new_id(), 'user_id': user_ids[(offset + i) % args.users], 'title': 'note'}
+                for i in range(count)
+            ]
+            conn.execute(insert, rows)
+        elapsed = time.perf_counter() - start
+
+        sizes = conn.execute(
+            text(
+                f"SELECT pg_relation_size('{table}'), "
+                f"pg_relation_size('{SCHEMA}.notes_{layout}_pkey'), "
+                f"pg_relation_size('{SCHEMA}.ix_{layout}_user_id')"
+            )
+        ).one()
+
+    return {
+        'rows_per_sec': args.rows / elapsed,
+        'table_mb': sizes[0] / 1024 / 1024,
+        'pkey_mb': sizes[1] / 1024 / 1024,
+        'user_id_mb': sizes[2] / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'layout':<10} {'rows/s':>10} {'table MB':>10} {'pkey MB':>10} {'user_id MB':>11}")
+    try:
+        for layout in LAYOUTS:
+            result = run(layout, args)
+            print(
+                f"{layout:<10} {result['rows_per_sec']:>10.0f} {result['table_mb']:>10.1f} "
+                f"{result['pkey_mb']:>10.1f} {result['user_id_mb']:>11.1f}"
+            )
+    finally:
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Note Archival Script
+
+Moves notes that have not been updated for a number of days from the notes
+table into the compressed archived_notes table. Archived notes no longer
+appear in listings but can still be opened, and are restored when edited.
+Safe to run while the app is serving traffic and to interrupt: notes are
+moved in batches, one transaction each, and a new run picks up the rest.
+
+Usage:
+    python archive-notes.py [days] [batch_size]
+
+Example:
+    python archive-notes.py 365 200
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import shard_map
+from app.note_archive import ARCHIVE_BATCH_SIZE, NOTE_ARCHIVE_AFTER_DAYS, archive
+
+
+def print_progress(archived: int):
+    print(f"   Archived {archived} notes")
+
+
+def main():
+    if len(sys.argv) > 3:
+        print("Usage: python archive-notes.py [days] [batch_size]")
+        sys.exit(1)
+
+    days = int(sys.argv[1]) if len(sys.argv) >= 2 else NOTE_ARCHIVE_AFTER_DAYS
+    batch_size = int(sys.argv[2]) if len(sys.argv) == 3 else ARCHIVE_BATCH_SIZE
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+
+    print(f"🧊 Archiving notes not updated since {cutoff:%Y-%m-%d %H:%M} UTC ({days} days), {batch_size} per batch")
+    print()
+
+    archived = 0
+    try:
+        for shard, shard_engine in enumerate(shard_map.engines):
+            if len(shard_map) > 1:
+                print(f"   Shard {shard}:")
+            with shard_engine.connect() as conn:
+                archived += archive(conn, cutoff, batch_size, on_progress=print_progress)
+    except Exception as e:
+        print(f"❌ Error archiving notes: {e}")
+        sys.exit(1)
+
+    print()
+    print(f"✅ Archival complete: {archived} notes archived")
+
+
+if __name__ == "__main__":
+    main()
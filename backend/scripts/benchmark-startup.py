@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark Script
+
+Measures how long a new worker takes to become useful: the time a fresh
+interpreter spends importing app.main, broken down by module and by
+top-level package, and the time from launching uvicorn until the first
+request answers 200 (imports plus the lifespan warm-up). Each is the
+median of several runs.
+
+With --check the totals are compared with the startup entries of
+tests/benchmark_baseline.json, and the script exits with status 1 when one
+is more than BENCHMARK_TOLERANCE (default 1.0, i.e. twice the baseline)
+slower. `make test-bench-update` records new baselines.
+
+Usage:
+    python benchmark-startup.py [--runs 3] [--top 15] [--path /ready] [--check]
+
+Example:
+    python benchmark-startup.py --top 25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+from collections import defaultdict
+
+# Add the parent directory to the path so we can import from app
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.startup import import_times, time_to_first_request
+
+BASELINE_PATH = os.path.join(BACKEND_DIR, 'tests', 'benchmark_baseline.json')
+BENCHMARK_TOLERANCE = float(os.getenv('BENCHMARK_TOLERANCE', '1.0'))
+
+
+def median_import_times(runs: int) -> dict[str, tuple[float, float]]:
+    samples = [import_times('app.main') for _ in range(runs)]
+    return {
+        module: (
+            statistics.median(sample[module][0] for sample in samples if module in sample),
+            statistics.median(sample[module][1] for sample in samples if module in sample),
+        )
+        for module in samples[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import time and time to first request of a worker')
+    parser.add_argument('--runs', type=int, default=3, help='Measurements to take the median of')
+    parser.add_argument('--top', type=int, default=15, help='Modules and packages listed')
+    parser.add_argument('--path', default='/ready', help='Request that must answer 200')
+    parser.add_argument('--check', action='store_true', help='Fail when slower than the baseline allows')
+    args = parser.parse_args()
+
+    print(f"⏱️  Measuring startup, median of {args.runs} runs")
+    print()
+
+    times = median_import_times(args.runs)
+    total_import = times['app.main'][1]
+
+    packages: dict[str, float] = defaultdict(float)
+    for module, (self_time, _) in times.items():
+        packages[module.split('.')[0]] += self_time
+
+    print(f"   Slowest modules (self time, of {total_import * 1000:.0f}ms importing app.main):")
+    for module, (self_time, cumulative) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"   {self_time * 1000:>8.1f}ms  {cumulative * 1000:>8.1f}ms cumulative  {module}")
+    print()
+    print("   By top-level package:")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"   {seconds * 1000:>8.1f}ms  {package}")
+    print()
+
+    try:
+        first_request = statistics.median(time_to_first_request(args.path) for _ in range(args.runs))
+    except (RuntimeError, TimeoutError) as e:
+        print(f"❌ Error starting uvicorn: {e}")
+        sys.exit(1)
+    print(f"   First 200 from {args.path} after {first_request * 1000:.0f}ms")
+    print()
+
+    if not args.check:
+        print(f"✅ Startup: {total_import * 1000:.0f}ms imports, {first_request * 1000:.0f}ms to first request")
+        return
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    regressed = False
+    for name, seconds in (('startup_import_app_main', total_import), ('startup_first_request', first_request)):
+        limit = baseline[name] * (1 + BENCHMARK_TOLERANCE)
+        status = '✓' if seconds <= limit else '✗'
+        regressed |= seconds > limit
+        print(f"   {status} {name}: {seconds * 1000:.0f}ms, baseline {baseline[name] * 1000:.0f}ms, limit {limit * 1000:.0f}ms")
+    print()
+    if regressed:
+        print("❌ Startup is over budget")
+        sys.exit(1)
+    print("✅ Startup is within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Bulk User Provisioning Script
+
+Creates users or resets their passwords from a CSV or NDJSON file, for
+onboarding or migrating many accounts at once. Passwords are hashed on all
+CPU cores with the same Argon2 settings as registration, and users are
+written in chunks, one transaction each. Progress is checkpointed to a
+state file after every chunk, so an interrupted run picks up where it
+stopped when started again with the same arguments.
+
+CSV files need a header row with an email column and may have password and
+is_active columns; NDJSON files have one object with the same keys per line.
+
+Usage:
+    python provision-users.py <file> [--mode upsert|reset] [--format csv|ndjson]
+                              [--chunk-size 500] [--workers N] [--state PATH] [--restart]
+
+Example:
+    python provision-users.py new-users.csv
+    python provision-users.py password-resets.ndjson --mode reset
+"""
+
+import argparse
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.user_provisioning import (
+    MODE_RESET,
+    MODE_UPSERT,
+    PROVISION_CHUNK_SIZE,
+    ProvisionResult,
+    provision,
+    read_users,
+)
+
+
+def count_records(path: Path, format: str) -> int:
+    return sum(1 for _ in read_users(path, format))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create users or reset passwords in bulk')
+    parser.add_argument('file', type=Path, help='CSV or NDJSON file of users')
+    parser.add_argument('--mode', choices=(MODE_UPSERT, MODE_RESET), default=MODE_UPSERT,
+                        help='upsert creates missing users, reset only updates existing ones')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='Input format (default: from the file extension)')
+    parser.add_argument('--chunk-size', type=int, default=PROVISION_CHUNK_SIZE, help='Users per transaction')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Hashing processes (default: all cores)')
+    parser.add_argument('--state', type=Path, help='Checkpoint file (default: <file>.progress)')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first user')
+    args = parser.parse_args()
+
+    state_path = args.state or args.file.with_name(args.file.name + '.progress')
+    if args.restart:
+        state_path.unlink(missing_ok=True)
+
+    try:
+        total = count_records(args.file, args.format)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error reading {args.file}: {e}")
+        sys.exit(1)
+
+    print(f"👥 Provisioning {total} users from {args.file} ({args.mode}), "
+          f"{args.chunk_size} per transaction, {args.workers} hashing processes")
+    print()
+
+    def print_progress(result: ProvisionResult, elapsed: float):
+        rate = result.processed / elapsed if elapsed else 0
+        remaining = (total - result.processed) / rate if rate else 0
+        print(f"   {result.processed}/{total} users ({result.processed / total:.0%}), "
+              f"{rate:.1f}/s, {remaining:.0f}s left")
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor, engine.connect() as conn:
+            result = provision(
+                conn,
+                read_users(args.file, args.format),
+                executor,
+                mode=args.mode,
+                chunk_size=args.chunk_size,
+                state_path=state_path,
+                on_progress=print_progress,
+            )
+    except Exception as e:
+        print(f"❌ Error provisioning users: {e}")
+        print(f"   Run again to resume from the last committed chunk ({state_path})")
+        sys.exit(1)
+
+    for error in result.errors:
+        print(f"⚠️  {error}")
+
+    print()
+    print(f"✅ Provisioning complete: {result.created} created, {result.updated} updated, {len(result.errors)} skipped")
+    state_path.unlink(missing_ok=True)
+    sys.exit(1 if result.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Shard Rebalancing Script
+
+Shows how users are spread over the shards (DATABASE_URL and
+SHARD_DATABASE_URLS), and moves a user to another shard while the app keeps
+serving them. During a move the user's writes are refused with 503 for a
+few seconds; reads keep working. See app/sharding.py.
+
+Usage:
+    python rebalance-shards.py status
+    python rebalance-shards.py move <email|user_id> <shard> [--settle SECONDS]
+
+Example:
+    python rebalance-shards.py move user@example.com 2
+"""
+
+import argparse
+import sys
+import os
+from urllib.parse import urlsplit
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, shard_map
+from app.ids import is_uuid
+from app.models.user_directory import UserDirectoryEntry
+from app.sharding import lookup_email, move_user, shard_counts
+
+
+def find_entry(user: str):
+    db = SessionLocal()
+    try:
+        if is_uuid(user):
+            return db.get(UserDirectoryEntry, user)
+        return lookup_email(db, user)
+    finally:
+        db.close()
+
+
+def status():
+    print(f"🗂️  {len(shard_map)} shards")
+    print()
+    for shard, count in shard_counts().items():
+        url = urlsplit(shard_map.url(shard))
+        print(f"   {shard}  {url.hostname}:{url.port or 5432}{url.path:<32} {count:>9} users")
+
+    db = SessionLocal()
+    try:
+        moving = db.query(UserDirectoryEntry).filter(UserDirectoryEntry.moving_to.isnot(None)).all()
+    finally:
+        db.close()
+    for entry in moving:
+        print(f"⚠️  {entry.email} is being moved from shard {entry.shard} to {entry.moving_to}")
+
+
+def move(user: str, target: int, settle: float):
+    entry = find_entry(user)
+    if entry is None:
+        print(f"❌ Error: User '{user}' not found")
+        sys.exit(1)
+
+    print(f"🔄 Moving {entry.email} ({entry.user_id}) from shard {entry.shard} to shard {target}")
+    try:
+        result = move_user(entry.user_id, target, settle_seconds=settle, on_progress=lambda message: print(f"   {message}"))
+    except Exception as e:
+        print(f"❌ Error moving user: {e}")
+        sys.exit(1)
+
+    print()
+    for table, rows in result.rows.items():
+        print(f"   {table:<24} {rows:>9} rows")
+    print(f"✅ {entry.email} is now on shard {result.target}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or change which shard users are on')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='Users per shard')
+    move_parser = commands.add_parser('move', help='Move a user to another shard')
+    move_parser.add_argument('user', help='Email or user ID')
+    move_parser.add_argument('shard', type=int, help='Target shard')
+    move_parser.add_argument('--settle', type=float,
+                             help='Seconds to wait for workers before copying and before deleting '
+                                  '(default: SHARD_DIRECTORY_CACHE_SECONDS + SHARD_MOVE_GRACE_SECONDS)')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        status()
+    else:
+        move(args.user, args.shard, args.settle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Note Stats Reconciliation Script
+
+Recomputes every user's note count and total size from the notes table and
+repairs rows of user_note_stats that have drifted. Safe to run while the app
+is serving traffic: users are processed in batches, one transaction each.
+
+Usage:
+    python reconcile-note-stats.py [batch_size]
+
+Example:
+    python reconcile-note-stats.py 500
+"""
+
+import sys
+import os
+
+# Add the parent directory to the path so we can import from app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import shard_map
+from app.note_stats import RECONCILE_BATCH_SIZE, reconcile
+
+
+def print_progress(scanned: int, repaired: int):
+    print(f"   Scanned {scanned} users, repaired {repaired}")
+
+
+def main():
+    if len(sys.argv) > 2:
+        print("Usage: python reconcile-note-stats.py [batch_size]")
+        sys.exit(1)
+
+    batch_size = int(sys.argv[1]) if len(sys.argv) == 2 else RECONCILE_BATCH_SIZE
+
+    print(f"🔄 Reconciling note stats in batches of {batch_size} users")
+    print()
+
+    repaired = 0
+    try:
+        for shard, shard_engine in enumerate(shard_map.engines):
+            if len(shard_map) > 1:
+                print(f"   Shard {shard}:")
+            with shard_engine.connect() as conn:
+                repaired += reconcile(conn, batch_size, on_progress=print_progress)
+    except Exception as e:
+        print(f"❌ Error reconciling note stats: {e}")
+        sys.exit(1)
+
+    print()
+    print(f"✅ Reconciliation complete: {repaired} users repaired")
+
+
+if __name__ == "__main__":
+    main()
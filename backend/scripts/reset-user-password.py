@@ -20,26 +20,36 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from datetime import datetime, timezone
 
-from app.database import SessionLocal, engine
+from app.auth.security import get_password_hash
+from app.database import SessionLocal, engine, shard_map
 from app.models.user import User
-from pwdlib import PasswordHash
+from app.sharding import lookup_email
 
 def reset_password(email: str, new_password: str):
     """Reset a user's password."""
 
-    # Create password hash
-    password_hash = PasswordHash.recommended()
-    hashed_password = password_hash.hash(new_password)
+    # Create password hash with the app's hasher settings
+    hashed_password = get_password_hash(new_password)
 
-    # Get database session
-    db = SessionLocal()
+    # Find the user's shard in the directory
+    home = SessionLocal()
+    try:
+        entry = lookup_email(home, email)
+    finally:
+        home.close()
+
+    if not entry:
+        print(f"❌ Error: User with email '{email}' not found")
+        return False
+
+    # Get database session on that shard
+    db = shard_map.session(entry.shard)
 
     try:
-        # Find user by email
-        user = db.query(User).filter(User.email == email).first()
+        user = db.get(User, entry.user_id)
 
         if not user:
-            print(f"❌ Error: User with email '{email}' not found")
+            print(f"❌ Error: User with email '{email}' not found on shard {entry.shard}")
             return False
 
         # Update password and timestamp
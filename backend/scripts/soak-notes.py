@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Note API Soak Test Script
+
+Drives the note endpoints of a running server (create, list, get, update,
+delete) from several threads for a while, and reports how the memory of
+each worker process grew, using the /debug/memory endpoints (DIAGNOSTICS_TOKEN
+must be set on the server and given here). With --tracemalloc, allocation
+tracing is started on every worker reached and the top growing file:line
+locations of each are printed at the end.
+
+The notes of the test user are kept below --max-notes, so steady state
+memory should stay flat; growth that keeps going with the request count
+points at a leak.
+
+Usage:
+    python soak-notes.py [--url URL] [--duration 600] [--concurrency 8] [--interval 30]
+                         [--email EMAIL --password PASSWORD] [--tracemalloc] [--max-growth-mb MB]
+
+Example:
+    DIAGNOSTICS_TOKEN=secret python soak-notes.py --duration 3600 --tracemalloc
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+DIAGNOSTICS_HEADER = 'X-Diagnostics-Token'
+MB = 1024 * 1024
+
+
+class Session:
+    """Logged-in API client of one thread, logging in again when the access token expires."""
+
+    def __init__(self, url: str, email: str, password: str):
+        self.client = httpx.Client(base_url=url, timeout=30)
+        self.email = email
+        self.password = password
+        self.login()
+
+    def login(self):
+        response = self.client.post('/api/auth/login', json={'email': self.email, 'password': self.password})
+        response.raise_for_status()
+        self.client.headers['Authorization'] = f"Bearer {response.json()['access_token']}"
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        response = self.client.request(method, path, **kwargs)
+        if response.status_code == 401:
+            self.login()
+            response = self.client.request(method, path, **kwargs)
+        return response
+
+
+class Soak:
+    def __init__(self, url: str, email: str, password: str, max_notes: int):
+        self.url = url
+        self.email = email
+        self.password = password
+        self.max_notes = max_notes
+        self.requests = Counter()
+        self.errors = Counter()
+        self.note_ids: list[str] = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def record(self, operation: str, response: httpx.Response):
+        with self.lock:
+            self.requests[operation] += 1
+            if response.status_code >= 400:
+                self.errors[f'{operation} {response.status_code}'] += 1
+
+    def run_worker(self):
+        session = Session(self.url, self.email, self.password)
+        while not self.stop.is_set():
+            with self.lock:
+                note_id = random.choice(self.note_ids) if self.note_ids else None
+                full = len(self.note_ids) >= self.max_notes
+            roll = random.random()
+            try:
+                if note_id is None or (roll < 0.3 and not full):
+                    content = 'soak ' * random.randint(20, 4000)
+                    response = session.request('POST', '/api/note', json={'title': 'soak', 'content': content})
+                    self.record('create', response)
+                    if response.status_code == 201:
+                        with self.lock:
+                            self.note_ids.append(response.json()['id'])
+                elif roll < 0.6:
+                    self.record('list', session.request('GET', '/api/note'))
+                elif roll < 0.8:
+                    self.record('get', session.request('GET', f'/api/note/{note_id}'))
+                elif roll < 0.9 or not full:
+                    self.record('update', session.request('PATCH', f'/api/note/{note_id}', json={'title': f'soak {roll:.3f}'}))
+                else:
+                    with self.lock:
+                        if note_id not in self.note_ids:
+                            continue
+                        self.note_ids.remove(note_id)
+                    self.record('delete', session.request('DELETE', f'/api/note/{note_id}'))
+            except httpx.HTTPError as e:
+                with self.lock:
+                    self.errors[type(e).__name__] += 1
+
+    def cleanup(self):
+        session = Session(self.url, self.email, self.password)
+        for note_id in self.note_ids:
+            session.request('DELETE', f'/api/note/{note_id}')
+
+
+class Workers:
+    """Memory samples per worker process; which worker answers is up to the server."""
+
+    def __init__(self, url: str, token: str, tracemalloc: bool):
+        # A new connection per request, so that requests are spread over the workers
+        self.client = httpx.Client(
+            base_url=url, timeout=60, headers={DIAGNOSTICS_HEADER: token, 'Connection': 'close'}
+        )
+        self.tracemalloc = tracemalloc
+        self.first: dict[int, dict] = {}
+        self.last: dict[int, dict] = {}
+        self.snapshots: dict[int, int] = {}
+
+    def sample(self, attempts: int):
+        for _ in range(attempts):
+            response = self.client.get('/debug/memory')
+            response.raise_for_status()
+            sample = {**response.json(), 'time': time.monotonic()}
+            pid = sample['pid']
+            if pid not in self.first:
+                self.first[pid] = sample
+                if self.tracemalloc:
+                    self._on_worker(pid, 'POST', '/debug/memory/tracemalloc/start', attempts)
+                    self.snapshots[pid] = self._on_worker(pid, 'POST', '/debug/memory/snapshots', attempts)['id']
+            self.last[pid] = sample
+
+    def _on_worker(self, pid: int, method: str, path: str, attempts: int, **kwargs) -> dict:
+        # Only the worker that answers can be asked; retry until it is the right one
+        for _ in range(attempts * 4):
+            response = self.client.request(method, path, **kwargs)
+            if response.status_code < 400 and response.json()['pid'] == pid:
+                return response.json()
+        raise RuntimeError(f'worker {pid} did not answer')
+
+    def top_growth(self, pid: int, limit: int, attempts: int) -> dict:
+        return self._on_worker(pid, 'GET', f'/debug/memory/snapshots/{self.snapshots[pid]}/diff', attempts,
+                               params={'limit': limit})
+
+    def stop_tracing(self, attempts: int):
+        for pid in self.snapshots:
+            try:
+                self._on_worker(pid, 'POST', '/debug/memory/tracemalloc/stop', attempts)
+            except RuntimeError:
+                print(f"⚠️  Could not stop tracemalloc on worker {pid}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Soak test the note endpoints and report worker memory growth')
+    parser.add_argument('--url', default='http://localhost:8000', help='Server base URL')
+    parser.add_argument('--duration', type=float, default=600, help='Seconds to run')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--interval', type=float, default=30, help='Seconds between memory samples')
+    parser.add_argument('--token', default=os.getenv('DIAGNOSTICS_TOKEN', ''), help='Diagnostics token (default: DIAGNOSTICS_TOKEN)')
+    parser.add_argument('--email', help='Existing user to log in as (default: register a new one)')
+    parser.add_argument('--password', help='Password of --email')
+    parser.add_argument('--max-notes', type=int, default=200, help='Notes the test user keeps at most')
+    parser.add_argument('--tracemalloc', action='store_true', help='Trace allocations and print the top growing lines')
+    parser.add_argument('--top', type=int, default=10, help='Lines printed per worker with --tracemalloc')
+    parser.add_argument('--max-growth-mb', type=float, help='Exit with status 1 if any worker grew more than this')
+    args = parser.parse_args()
+
+    if not args.token:
+        print("❌ Error: a diagnostics token is needed (--token or DIAGNOSTICS_TOKEN)")
+        sys.exit(1)
+
+    email, password = args.email, args.password
+    if not email:
+        email, password = f'soak-{uuid.uuid4().hex[:12]}@example.com', uuid.uuid4().hex
+        response = httpx.post(f'{args.url}/api/auth/register', json={'email': email, 'password': password})
+        if response.status_code != 201:
+            print(f"❌ Error registering a test user: {response.status_code} {response.text}")
+            sys.exit(1)
+        print(f"👤 Registered test user {email}")
+
+    workers = Workers(args.url, args.token, args.tracemalloc)
+    attempts = max(4, args.concurrency)
+    try:
+        workers.sample(attempts)
+    except (httpx.HTTPError, RuntimeError) as e:
+        print(f"❌ Error reading /debug/memory: {e}")
+        sys.exit(1)
+
+    soak = Soak(args.url, email, password, args.max_notes)
+    threads = [threading.Thread(target=soak.run_worker, daemon=True) for _ in range(args.concurrency)]
+    print(f"🔄 Soaking {args.url} for {args.duration:.0f}s with {args.concurrency} threads, "
+          f"{len(workers.first)} workers seen")
+    print()
+
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    try:
+        while time.monotonic() - start < args.duration:
+            time.sleep(min(args.interval, max(0.0, args.duration - (time.monotonic() - start))))
+            workers.sample(attempts)
+            total = sum(soak.requests.values())
+            rss = ', '.join(f"{pid}: {sample['rss_bytes'] / MB:.1f}MB" for pid, sample in sorted(workers.last.items()))
+            print(f"   {time.monotonic() - start:>6.0f}s  {total} requests, {sum(soak.errors.values())} errors  rss {rss}")
+    except KeyboardInterrupt:
+        print("   Interrupted")
+    finally:
+        soak.stop.set()
+        for thread in threads:
+            thread.join()
+
+    elapsed = time.monotonic() - start
+    total = sum(soak.requests.values())
+    print()
+    print(f"📊 {total} requests in {elapsed:.0f}s ({total / elapsed:.0f}/s): "
+          + ', '.join(f'{op} {count}' for op, count in soak.requests.most_common()))
+    for error, count in soak.errors.most_common():
+        print(f"⚠️  {error}: {count}")
+
+    print()
+    worst = 0.0
+    for pid in sorted(workers.first):
+        first, last = workers.first[pid], workers.last[pid]
+        growth = (last['rss_bytes'] - first['rss_bytes']) / MB
+        objects = last['gc']['tracked_objects'] - first['gc']['tracked_objects']
+        worst = max(worst, growth)
+        print(f"   worker {pid}: rss {first['rss_bytes'] / MB:.1f}MB → {last['rss_bytes'] / MB:.1f}MB "
+              f"({growth:+.1f}MB, {growth * 1000 / max(total, 1):+.3f}MB per 1k requests), "
+              f"{objects:+d} tracked objects")
+        if args.tracemalloc and pid in workers.snapshots:
+            try:
+                report = workers.top_growth(pid, args.top, attempts)
+            except RuntimeError as e:
+                print(f"      ⚠️  {e}")
+                continue
+            print(f"      traced {report['size_diff'] / MB:+.2f}MB in {report['count_diff']:+d} blocks")
+            for stat in report['top']:
+                print(f"      {stat['size_diff'] / 1024:>+10.1f}KB {stat['count_diff']:>+8d}  {stat['file']}:{stat.get('line', '')}")
+
+    if args.tracemalloc:
+        workers.stop_tracing(attempts)
+    soak.cleanup()
+
+    print()
+    if args.max_growth_mb is not None and worst > args.max_growth_mb:
+        print(f"❌ A worker grew {worst:.1f}MB, over the {args.max_growth_mb:.1f}MB budget")
+        sys.exit(1)
+    print(f"✅ Soak complete: largest worker growth {worst:+.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
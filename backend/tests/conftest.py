@@ -0,0 +1,184 @@
+"""
+Shared fixtures.
+
+Database tests run against the Postgres configured by the DB_* environment
+variables (migrated with `alembic upgrade head`) and are skipped when it is
+not reachable. Each test runs inside one outer transaction that is rolled back
+afterwards; commits made by application code only release a savepoint. Tests
+therefore never see each other's rows and can run in parallel against the same
+database.
+
+Benchmarks compare the median time per call (or per worker start, for the
+startup benchmarks) against `tests/benchmark_baseline.json` and fail when it
+is more than BENCHMARK_TOLERANCE (default 1.0, i.e. twice the baseline)
+slower. Their baselines only hold on the machine that recorded them, so they
+are deselected by default: run them with `pytest -m benchmark` (`make
+test-bench`) and record new baselines with `--update-benchmarks`.
+"""
+
+import json
+import os
+import statistics
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.auth import create_access_token, get_password_hash
+from app.database import engine, get_db
+from app.ids import uuid7
+from app.main import app
+from app.models.user import User
+
+BENCHMARK_BASELINE_PATH = Path(__file__).parent / "benchmark_baseline.json"
+BENCHMARK_TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", "1.0"))
+BENCHMARK_MIN_ROUNDS = 5
+BENCHMARK_MIN_SECONDS = 0.2
+
+TEST_PASSWORD = "correct horse battery staple"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-benchmarks",
+        action="store_true",
+        default=False,
+        help="Record benchmark results as the new baseline instead of comparing",
+    )
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """The application engine, or skip if Postgres is not reachable."""
+    try:
+        engine.connect().close()
+    except OperationalError as e:
+        pytest.skip(f"Postgres not reachable: {e.orig}")
+    return engine
+
+
+@pytest.fixture
+def db_session(db_engine):
+    """Session whose changes are rolled back when the test ends."""
+    connection = db_engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, autoflush=False, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture
+def client(db_session):
+    """Test client whose requests share the test's rolled-back session."""
+    app.dependency_overrides[get_db] = lambda: db_session
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+
+@pytest.fixture(scope="session")
+def test_password() -> str:
+    """The password of every test user."""
+    return TEST_PASSWORD
+
+
+@pytest.fixture(scope="session")
+def password_hash(test_password) -> str:
+    """Hash of `test_password`, computed once since Argon2 is deliberately slow."""
+    return get_password_hash(test_password)
+
+
+@pytest.fixture
+def user(db_session, password_hash) -> User:
+    """An active user that exists only for the current test."""
+    user = User(
+        id=str(uuid7()),
+        email=f"{uuid.uuid4().hex}@example.com",
+        hashed_password=password_hash,
+        is_active=True,
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(user) -> dict[str, str]:
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.id})}"}
+
+
+def format_seconds(seconds: float) -> str:
+    """A duration in the unit that suits it, from microseconds to seconds."""
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds * 1e6:.1f}us"
+
+
+class BenchmarkRecorder:
+    """Times functions and checks them against the stored baseline."""
+
+    def __init__(self, update: bool):
+        self.update = update
+        self.baseline: dict[str, float] = (
+            json.loads(BENCHMARK_BASELINE_PATH.read_text()) if BENCHMARK_BASELINE_PATH.exists() else {}
+        )
+        self.results: dict[str, float] = {}
+
+    def __call__(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> float:
+        """Return the median seconds per call of fn, failing on regressions."""
+        # Repeat cheap calls within a round so timer resolution does not dominate
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        number = max(1, int(0.001 / max(time.perf_counter() - start, 1e-9)))
+
+        timings: list[float] = []
+        deadline = time.perf_counter() + BENCHMARK_MIN_SECONDS
+        while len(timings) < BENCHMARK_MIN_ROUNDS or time.perf_counter() < deadline:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn(*args, **kwargs)
+            timings.append((time.perf_counter() - start) / number)
+
+        return self.check(name, statistics.median(timings))
+
+    def check(self, name: str, seconds: float) -> float:
+        """Record a measurement taken elsewhere, failing on regressions."""
+        self.results[name] = seconds
+        baseline = self.baseline.get(name)
+        if not self.update and baseline is not None:
+            limit = baseline * (1 + BENCHMARK_TOLERANCE)
+            assert seconds <= limit, (
+                f"{name} regressed: {format_seconds(seconds)}, "
+                f"baseline {format_seconds(baseline)}, limit {format_seconds(limit)}"
+            )
+        return seconds
+
+    def save(self) -> None:
+        baseline = {**self.baseline, **self.results}
+        BENCHMARK_BASELINE_PATH.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + "\n")
+
+
+@pytest.fixture(scope="session")
+def benchmark_recorder(request):
+    recorder = BenchmarkRecorder(request.config.getoption("--update-benchmarks"))
+    yield recorder
+    if recorder.update and recorder.results:
+        recorder.save()
+
+
+@pytest.fixture
+def bench(benchmark_recorder) -> BenchmarkRecorder:
+    """Time a function: `bench(name, fn, *args)`."""
+    return benchmark_recorder
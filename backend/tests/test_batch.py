@@ -0,0 +1,84 @@
+"""Tests for the batch endpoint."""
+
+from app.auth import dependencies
+from app.routers import batch
+
+
+def test_batch_runs_sub_requests_in_order(client, auth_headers):
+    """Test that reads and writes return per-item statuses and bodies in request order."""
+    created = client.post("/api/note", json={"title": "First", "content": "Hello"}, headers=auth_headers)
+    note_id = created.json()["id"]
+
+    response = client.post(
+        "/api/batch",
+        json={"requests": [
+            {"id": "me", "method": "GET", "path": "/api/auth/me"},
+            {"id": "list", "method": "GET", "path": "/api/note"},
+            {"id": "one", "method": "GET", "path": f"/api/note/{note_id}"},
+            {"id": "edit", "method": "PATCH", "path": f"/api/note/{note_id}", "body": {"title": "Edited"}},
+            {"id": "again", "method": "GET", "path": f"/api/note/{note_id}"},
+            {"id": "missing", "method": "GET", "path": "/api/note/00000000-0000-0000-0000-000000000000"},
+        ]},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    items = response.json()["responses"]
+    assert [item["id"] for item in items] == ["me", "list", "one", "edit", "again", "missing"]
+    assert [item["status"] for item in items] == [200, 200, 200, 200, 200, 404]
+    assert items[0]["body"]["id"] == created.json()["user_id"]
+    assert [note["id"] for note in items[1]["body"]] == [note_id]
+    assert items[1]["headers"]["etag"].startswith('W/"')
+    assert items[3]["body"]["title"] == "Edited"
+    assert items[4]["body"]["title"] == "Edited"
+
+
+def test_batch_authenticates_once(client, auth_headers, monkeypatch):
+    """Test that sub-requests reuse the batch's user instead of resolving the token again."""
+    calls = []
+    resolve = dependencies.get_user_from_token
+    monkeypatch.setattr(dependencies, "get_user_from_token", lambda *args: calls.append(1) or resolve(*args))
+
+    response = client.post(
+        "/api/batch",
+        json={"requests": [{"method": "GET", "path": "/api/auth/me"}, {"method": "GET", "path": "/api/note"}]},
+        headers=auth_headers,
+    )
+
+    assert [item["status"] for item in response.json()["responses"]] == [200, 200]
+    assert len(calls) == 1
+
+
+def test_batch_requires_authentication(client):
+    """Test that the batch itself is rejected without a token."""
+    response = client.post("/api/batch", json={"requests": [{"method": "GET", "path": "/api/note"}]})
+    assert response.status_code in (401, 403)
+
+
+def test_batch_rejects_disallowed_paths(client, auth_headers):
+    """Test that nested batches, event streams and unknown routes fail per item."""
+    response = client.post(
+        "/api/batch",
+        json={"requests": [
+            {"method": "POST", "path": "/api/batch", "body": {"requests": []}},
+            {"method": "GET", "path": "/api/events"},
+            {"method": "GET", "path": "/health"},
+            {"method": "GET", "path": "/api/nothing-here"},
+            {"method": "DELETE", "path": "/api/note"},
+        ]},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["responses"]] == [400, 400, 400, 404, 405]
+
+
+def test_batch_size_is_limited(client, auth_headers, monkeypatch):
+    """Test that oversized batches are rejected as a whole."""
+    monkeypatch.setattr(batch, "BATCH_MAX_REQUESTS", 2)
+    response = client.post(
+        "/api/batch",
+        json={"requests": [{"method": "GET", "path": "/api/note"}] * 3},
+        headers=auth_headers,
+    )
+    assert response.status_code == 400
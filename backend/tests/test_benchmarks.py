@@ -0,0 +1,98 @@
+"""Micro-benchmarks for the auth and serialization hot paths, and worker startup benchmarks."""
+
+import statistics
+from datetime import datetime, timezone
+from typing import List
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from pydantic import TypeAdapter
+
+from app.auth import create_access_token, get_current_user, verify_password
+from app.auth.security import decode_access_token
+from app.autogenerated.pydantic_models import Note as NoteResponse
+from app.ids import uuid7
+from app.models.note import Note as NoteModel
+from app.startup import import_times, time_to_first_request
+
+
+pytestmark = pytest.mark.benchmark
+
+notes_adapter = TypeAdapter(List[NoteResponse])
+
+
+def test_create_access_token(bench):
+    """Benchmark signing an access token."""
+    bench("create_access_token", create_access_token, {"sub": str(uuid7())})
+
+
+def test_decode_access_token(bench):
+    """Benchmark verifying and decoding an access token."""
+    token = create_access_token({"sub": str(uuid7())})
+    bench("decode_access_token", decode_access_token, token)
+
+
+def test_verify_password(bench, test_password, password_hash):
+    """Benchmark Argon2 password verification."""
+    bench("verify_password", verify_password, test_password, password_hash)
+
+
+def test_get_current_user(bench, db_session, user, auth_headers):
+    """Benchmark resolving the current user from a bearer token."""
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=auth_headers["Authorization"].removeprefix("Bearer ")
+    )
+
+    def resolve():
+        # Clear the identity map so every call loads the user row
+        db_session.expunge_all()
+        return get_current_user(credentials, db_session)
+
+    bench("get_current_user", resolve)
+
+
+def test_note_list_serialization(bench):
+    """Benchmark serializing a listing of 100 notes as list_notes does."""
+    now = datetime.now(timezone.utc)
+    user_id = str(uuid7())
+    notes = [
+        NoteModel(
+            id=str(uuid7()),
+            title=f"Note {i}",
+            content="Lorem ipsum dolor sit amet. " * 20,
+            user_id=user_id,
+            date_created=now,
+            date_updated=now,
+        )
+        for i in range(100)
+    ]
+
+    def serialize():
+        return notes_adapter.dump_json([
+            NoteResponse(
+                id=note.id,
+                title=note.title,
+                content=note.content,
+                user_id=note.user_id,
+                date_created=note.date_created,
+                date_updated=note.date_updated,
+            )
+            for note in notes
+        ])
+
+    bench("note_list_serialization", serialize)
+
+
+STARTUP_RUNS = 3
+
+
+def test_import_app_main(bench):
+    """Benchmark importing the app in a fresh interpreter."""
+    seconds = statistics.median(import_times("app.main")["app.main"][1] for _ in range(STARTUP_RUNS))
+    bench.check("startup_import_app_main", seconds)
+
+
+def test_time_to_first_request(bench, db_engine):
+    """Benchmark launching a worker until /ready answers, lifespan warm-up included."""
+    seconds = statistics.median(time_to_first_request("/ready") for _ in range(STARTUP_RUNS))
+    bench.check("startup_first_request", seconds)
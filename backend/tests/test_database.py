@@ -0,0 +1,47 @@
+"""Tests for request sessions and early connection release."""
+
+import uuid
+
+from sqlalchemy import text
+
+from app.database import SessionLocal, release_connection
+from app.models.user import User
+
+
+def test_session_checks_out_connection_lazily(db_engine):
+    """Test that a session holds a pooled connection only between its first query and release."""
+    baseline = db_engine.pool.checkedout()
+    db = SessionLocal()
+    try:
+        assert db_engine.pool.checkedout() == baseline
+        db.execute(text("SELECT 1"))
+        assert db_engine.pool.checkedout() == baseline + 1
+        release_connection(db)
+        assert db_engine.pool.checkedout() == baseline
+    finally:
+        db.close()
+
+
+def test_loaded_objects_stay_readable_after_release(db_session, user):
+    """Test that released sessions leave loaded attributes usable and can query again."""
+    user_id, email = user.id, user.email
+    db_session.expunge_all()
+    loaded = db_session.query(User).filter(User.id == user_id).one()
+    release_connection(db_session)
+
+    assert loaded.email == email
+    assert db_session.query(User).filter(User.id == user_id).count() == 1
+
+
+def test_register_and_login_release_before_hashing(client, test_password):
+    """Test that the auth flows still work with the connection released around Argon2."""
+    email = f"{uuid.uuid4().hex}@example.com"
+    created = client.post("/api/auth/register", json={"email": email, "password": test_password})
+    assert created.status_code == 201
+
+    login = client.post("/api/auth/login", json={"email": email, "password": test_password})
+    assert login.status_code == 200
+    assert login.json()["access_token"]
+
+    wrong = client.post("/api/auth/login", json={"email": email, "password": "wrong password"})
+    assert wrong.status_code == 401
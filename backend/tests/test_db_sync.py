@@ -0,0 +1,190 @@
+"""Tests for the database sync tool, between two scratch schemas standing in for two databases."""
+
+import uuid
+from urllib.parse import quote
+
+import psycopg2
+import pytest
+from sqlalchemy import text
+
+from app import db_sync
+from app.database import DATABASE_URL
+from app.db_sync import sync
+
+SCHEMA = """
+CREATE TABLE alembic_version (version_num VARCHAR(32) PRIMARY KEY);
+INSERT INTO alembic_version VALUES ('abc123');
+CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT NOT NULL UNIQUE, date_updated TIMESTAMPTZ NOT NULL);
+CREATE TABLE notes (
+    id INTEGER, user_id INTEGER NOT NULL REFERENCES users(id), body TEXT, date_updated TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, id)
+) PARTITION BY HASH (user_id);
+CREATE TABLE notes_p0 PARTITION OF notes FOR VALUES WITH (MODULUS 2, REMAINDER 0);
+CREATE TABLE notes_p1 PARTITION OF notes FOR VALUES WITH (MODULUS 2, REMAINDER 1);
+CREATE TABLE user_note_stats (user_id INTEGER PRIMARY KEY REFERENCES users(id), note_count INTEGER NOT NULL);
+"""
+
+
+@pytest.fixture
+def databases(db_engine):
+    """URLs of a source and a target schema with the same tables."""
+    schemas = [f"test_sync_{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for schema in schemas:
+            conn.execute(text(f"CREATE SCHEMA {schema}"))
+            conn.execute(text(f"SET search_path TO {schema}"))
+            conn.exec_driver_sql(SCHEMA)
+        conn.execute(text("RESET search_path"))
+        try:
+            yield [f"{DATABASE_URL}?options={quote(f'-csearch_path={schema}')}" for schema in schemas], schemas
+        finally:
+            for schema in schemas:
+                conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+
+
+def execute(db_engine, schema, statement):
+    """Run statements in one of the schemas, returning any rows."""
+    with db_engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL search_path TO {schema}"))
+        result = conn.execute(text(statement))
+        return result.all() if result.returns_rows else None
+
+
+def seed(db_engine, schema):
+    execute(db_engine, schema, """
+        INSERT INTO users SELECT i, 'user' || i || '@example.com', now() - interval '1 day' FROM generate_series(1, 20) i;
+        INSERT INTO notes SELECT i, i % 20 + 1, repeat('x', i), now() - interval '1 day' FROM generate_series(1, 200) i;
+        INSERT INTO user_note_stats SELECT i, 10 FROM generate_series(1, 20) i;
+    """)
+
+
+def test_full_sync_copies_and_verifies_every_table(db_engine, databases):
+    """Test that a full sync replaces the target's rows, partitions included, without firing its triggers."""
+    (source_url, target_url), (source, target) = databases
+    seed(db_engine, source)
+    execute(db_engine, target, "INSERT INTO users VALUES (999, 'stale@example.com', now())")
+    # A target trigger that would reject every copied row
+    execute(db_engine, target, """
+        CREATE FUNCTION reject() RETURNS trigger AS $$ BEGIN RAISE EXCEPTION 'trigger fired'; END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER reject BEFORE INSERT ON notes FOR EACH ROW EXECUTE FUNCTION reject();
+    """)
+
+    results = {result.table: result for result in sync(source_url, target_url, jobs=2)}
+
+    assert set(results) == {"users", "notes_p0", "notes_p1", "user_note_stats"}
+    assert all(result.verified for result in results.values())
+    assert results["notes_p0"].copied + results["notes_p1"].copied == 200
+    assert execute(db_engine, target, "SELECT count(*) FROM users WHERE id = 999")[0][0] == 0
+    assert execute(db_engine, target, "SELECT count(*), sum(length(body)) FROM notes")[0] == (200, sum(range(1, 201)))
+
+
+def test_failed_full_sync_leaves_target_unchanged(db_engine, databases, monkeypatch):
+    """Test that a full sync replaces nothing when a table fails to copy or to verify."""
+    (source_url, target_url), (source, target) = databases
+    seed(db_engine, source)
+    execute(db_engine, target, "INSERT INTO users VALUES (999, 'stale@example.com', now())")
+    copy_full, checksum = db_sync._copy_full, db_sync._checksum
+
+    def failing_copy(source_cur, target_cur, table, schema):
+        if table.name == "notes_p1":
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        return copy_full(source_cur, target_cur, table, schema)
+
+    def mismatched_checksum(cur, table, schema=None):
+        count, value = checksum(cur, table, schema)
+        return count, value + 1 if schema and table.name == "users" else value
+
+    monkeypatch.setattr("app.db_sync._copy_full", failing_copy)
+    with pytest.raises(psycopg2.OperationalError):
+        sync(source_url, target_url, jobs=2)
+    monkeypatch.setattr("app.db_sync._copy_full", copy_full)
+    monkeypatch.setattr("app.db_sync._checksum", mismatched_checksum)
+    with pytest.raises(RuntimeError, match="users"):
+        sync(source_url, target_url, jobs=2)
+
+    assert execute(db_engine, target, "SELECT id FROM users") == [(999,)]
+    assert execute(db_engine, target, "SELECT count(*) FROM notes")[0][0] == 0
+    assert execute(db_engine, target, f"SELECT to_regnamespace('{target}_db_sync')")[0][0] is None
+
+
+def test_incremental_sync_copies_changes_and_deletions(db_engine, databases, monkeypatch):
+    """Test that an incremental sync only copies rows changed since the last sync and removes deleted ones."""
+    (source_url, target_url), (source, target) = databases
+    # Seeded rows all share the watermark, so any overlap would copy them again
+    monkeypatch.setattr("app.db_sync.SYNC_WATERMARK_OVERLAP_SECONDS", 0)
+    seed(db_engine, source)
+    sync(source_url, target_url)
+
+    execute(db_engine, source, """
+        UPDATE notes SET body = 'edited', date_updated = now() WHERE id = 7;
+        INSERT INTO users VALUES (21, 'new@example.com', now());
+        INSERT INTO notes VALUES (201, 21, 'new', now());
+        DELETE FROM notes WHERE id = 8;
+        UPDATE user_note_stats SET note_count = 11 WHERE user_id = 8;
+    """)
+
+    results = {result.table: result for result in sync(source_url, target_url, incremental=True)}
+
+    assert all(result.incremental for name, result in results.items() if name != "user_note_stats")
+    assert sum(results[name].copied for name in ("notes_p0", "notes_p1")) == 2
+    assert sum(results[name].deleted for name in ("notes_p0", "notes_p1")) == 1
+    assert results["users"].copied == 1
+    assert all(result.verified for result in results.values())
+    assert execute(db_engine, target, "SELECT body FROM notes WHERE id = 7")[0][0] == "edited"
+
+
+def test_incremental_sync_copies_rows_missing_from_target(db_engine, databases, monkeypatch):
+    """Test that rows written with an old timestamp, like restored archived notes, still reach the target."""
+    (source_url, target_url), (source, target) = databases
+    monkeypatch.setattr("app.db_sync.SYNC_WATERMARK_OVERLAP_SECONDS", 0)
+    seed(db_engine, source)
+    sync(source_url, target_url)
+
+    execute(db_engine, source, "INSERT INTO notes VALUES (201, 3, 'restored', now() - interval '1 year')")
+
+    results = sync(source_url, target_url, incremental=True)
+
+    assert all(result.verified for result in results)
+    assert execute(db_engine, target, "SELECT body FROM notes WHERE id = 201")[0][0] == "restored"
+
+
+def test_incremental_without_earlier_sync_copies_everything(db_engine, databases):
+    """Test that an incremental sync into a target never synced from this source falls back to a full copy."""
+    (source_url, target_url), (source, target) = databases
+    seed(db_engine, source)
+
+    results = sync(source_url, target_url, incremental=True)
+
+    assert not any(result.incremental for result in results)
+    assert all(result.verified for result in results)
+
+
+def test_schema_mismatch_is_rejected(db_engine, databases):
+    """Test that nothing is copied between databases at different revisions."""
+    (source_url, target_url), (source, target) = databases
+    seed(db_engine, source)
+    execute(db_engine, target, "UPDATE alembic_version SET version_num = 'def456'")
+
+    with pytest.raises(ValueError, match="revision"):
+        sync(source_url, target_url)
+    assert execute(db_engine, target, "SELECT count(*) FROM notes")[0][0] == 0
+
+
+def test_unverified_table_gets_no_watermark(db_engine, databases, monkeypatch):
+    """Test that a table failing verification is not built on by the next incremental sync."""
+    (source_url, target_url), (source, target) = databases
+    monkeypatch.setattr("app.db_sync.SYNC_WATERMARK_OVERLAP_SECONDS", 0)
+    seed(db_engine, source)
+    sync(source_url, target_url)
+    # A change on the target that no incremental sync would copy over
+    execute(db_engine, target, "UPDATE notes SET body = 'drifted' WHERE id = 5")
+
+    results = sync(source_url, target_url, incremental=True)
+    unverified = {result.table for result in results if result.verified is False}
+
+    assert len(unverified) == 1
+    stored = {row[0] for row in execute(db_engine, target, "SELECT table_name FROM db_sync_state")}
+    assert not stored & unverified
+    results = sync(source_url, target_url, incremental=True)
+    assert not any(result.incremental for result in results)
+    assert all(result.verified for result in results)
@@ -0,0 +1,57 @@
+"""Tests for the note change event broker."""
+
+import asyncio
+
+from app.events import RESYNC_EVENT, NoteEventBroker, Subscription
+
+
+class OfflineBroker(NoteEventBroker):
+    """Broker that never opens a LISTEN connection."""
+
+    def _ensure_listening(self) -> None:
+        pass
+
+
+def test_publish_reaches_only_the_users_subscribers():
+    """Test that events fan out to every subscriber of the affected user."""
+    async def scenario():
+        broker = OfflineBroker()
+        first = broker.subscribe("u1")
+        second = broker.subscribe("u1")
+        other = broker.subscribe("u2")
+
+        broker.publish({"op": "insert", "id": "n1", "user_id": "u1"})
+
+        assert (await first.get())["id"] == "n1"
+        assert (await second.get())["id"] == "n1"
+        assert other.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_unsubscribe_stops_delivery():
+    """Test that unsubscribed clients no longer receive events."""
+    async def scenario():
+        broker = OfflineBroker()
+        subscription = broker.subscribe("u1")
+        broker.unsubscribe(subscription)
+        broker.unsubscribe(subscription)
+
+        broker.publish({"op": "insert", "id": "n1", "user_id": "u1"})
+
+        assert subscription.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_gets_a_single_resync():
+    """Test that a full queue is replaced by one resync event."""
+    async def scenario():
+        subscription = Subscription("u1", queue_size=3)
+        for i in range(10):
+            subscription.push({"op": "update", "id": f"n{i}", "user_id": "u1"})
+
+        assert await subscription.get() == RESYNC_EVENT
+        assert subscription.queue.qsize() <= 3
+
+    asyncio.run(scenario())
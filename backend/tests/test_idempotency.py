@@ -0,0 +1,128 @@
+"""Tests for Idempotency-Key handling."""
+
+import asyncio
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app import idempotency
+from app.autogenerated.pydantic_models import CreateNoteRequest
+from app.idempotency import MAX_KEY_LENGTH, REPLAYED_HEADER, claim, key_hash, record, request_hash
+from app.models.idempotency_key import IdempotencyKey
+
+
+def test_key_hash_is_fixed_size_and_scoped():
+    """Test that keys hash to 32 bytes and differ between scopes."""
+    assert len(key_hash("register", "k" * MAX_KEY_LENGTH)) == 32
+    assert key_hash("note:u1", "k") != key_hash("note:u2", "k")
+
+
+def test_request_hash_depends_on_body():
+    """Test that a different body under the same key can be detected."""
+    first = CreateNoteRequest(title="t", content="a")
+    assert request_hash(first) == request_hash(CreateNoteRequest(title="t", content="a"))
+    assert request_hash(first) != request_hash(CreateNoteRequest(title="t", content="b"))
+
+
+def test_invalid_key_is_rejected_before_touching_the_database():
+    """Test that empty or oversized keys are a 400."""
+    body = CreateNoteRequest(title="t", content="a")
+    for key in ("", "k" * (MAX_KEY_LENGTH + 1)):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(claim(None, "register", key, body))
+        assert exc_info.value.status_code == 400
+
+
+@pytest.fixture
+def sessions(db_engine):
+    """Two sessions on separate connections, as two concurrent requests would have."""
+    first, second = Session(db_engine), Session(db_engine)
+    scope = f"test:{uuid.uuid4()}"
+    yield first, second, scope
+    first.rollback()
+    second.rollback()
+    with Session(db_engine) as cleanup:
+        cleanup.execute(delete(IdempotencyKey).where(IdempotencyKey.key_hash == key_hash(scope, "k")))
+        cleanup.commit()
+    first.close()
+    second.close()
+
+
+def claim_in_thread(session, scope, body) -> dict:
+    """Start claiming in a thread; the result or exception lands in the returned dict."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["response"] = asyncio.run(claim(session, scope, "k", body))
+        except HTTPException as e:
+            outcome["error"] = e
+
+    outcome["thread"] = threading.Thread(target=run)
+    outcome["thread"].start()
+    return outcome
+
+
+def test_in_progress_duplicate_gets_409_after_waiting(sessions, monkeypatch):
+    """Test that a duplicate gives up with 409 when the original holds the key too long."""
+    first, second, scope = sessions
+    monkeypatch.setattr(idempotency, "WAIT_TIMEOUT_MS", 100)
+    body = CreateNoteRequest(title="t", content="a")
+
+    assert asyncio.run(claim(first, scope, "k", body)) is None
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(claim(second, scope, "k", body))
+    assert exc_info.value.status_code == 409
+
+
+def test_duplicate_replays_once_the_original_commits(sessions):
+    """Test that a duplicate waiting on the key replays the response the original commits."""
+    first, second, scope = sessions
+    body = CreateNoteRequest(title="t", content="a")
+
+    assert asyncio.run(claim(first, scope, "k", body)) is None
+    outcome = claim_in_thread(second, scope, body)
+    time.sleep(0.2)
+    assert outcome["thread"].is_alive()
+
+    record(first, scope, "k", 201, body)
+    first.commit()
+    outcome["thread"].join()
+
+    response = outcome["response"]
+    assert response.status_code == 201
+    assert response.headers[REPLAYED_HEADER] == "true"
+    assert response.body == body.model_dump_json().encode()
+
+
+def test_duplicate_runs_itself_when_the_original_rolls_back(sessions):
+    """Test that a failed original releases the key to the waiting duplicate."""
+    first, second, scope = sessions
+    body = CreateNoteRequest(title="t", content="a")
+
+    assert asyncio.run(claim(first, scope, "k", body)) is None
+    outcome = claim_in_thread(second, scope, body)
+    time.sleep(0.2)
+    first.rollback()
+    outcome["thread"].join()
+
+    assert "error" not in outcome and outcome["response"] is None
+
+
+def test_idempotent_create_replays_response(client, auth_headers):
+    """Test that retrying with the same Idempotency-Key does not create a second note."""
+    headers = {**auth_headers, "Idempotency-Key": "retry-1"}
+    first = client.post("/api/note", json={"title": "t", "content": "c"}, headers=headers)
+    retry = client.post("/api/note", json={"title": "t", "content": "c"}, headers=headers)
+    assert retry.status_code == 201
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+    assert len(client.get("/api/note", headers=auth_headers).json()) == 1
+
+    mismatch = client.post("/api/note", json={"title": "t", "content": "other"}, headers=headers)
+    assert mismatch.status_code == 422
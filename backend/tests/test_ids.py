@@ -0,0 +1,33 @@
+"""Tests for time-ordered identifiers."""
+
+import uuid
+
+from app.ids import is_uuid, uuid7
+
+
+def test_uuid7_layout():
+    """Test that uuid7 sets the version and RFC 9562 variant bits."""
+    value = uuid7()
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+
+
+def test_uuid7_is_monotonic():
+    """Test that IDs generated in sequence sort in generation order."""
+    ids = [uuid7() for _ in range(10000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+
+
+def test_is_uuid():
+    """Test that only well-formed UUID strings are accepted."""
+    assert is_uuid(str(uuid7()))
+    assert is_uuid(str(uuid.uuid4()))
+    assert is_uuid(str(uuid.uuid4()).upper())
+    assert not is_uuid("not-a-uuid")
+    assert not is_uuid("")
+    # Parsed by Python but rejected by Postgres
+    value = uuid.uuid4()
+    assert not is_uuid(value.urn)
+    assert not is_uuid(value.hex)
+    assert not is_uuid(f"{{{value}}}")
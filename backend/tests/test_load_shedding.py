@@ -0,0 +1,118 @@
+"""Tests for adaptive concurrency limiting."""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from app.load_shedding import (
+    PRIORITY_AUTH,
+    PRIORITY_CRITICAL,
+    PRIORITY_DEFAULT,
+    AIMDLimiter,
+    ConcurrencyLimitMiddleware,
+    TimedQueuePool,
+    pool_status,
+    priority,
+    readiness,
+)
+
+
+def test_limit_grows_only_when_near_it():
+    """Test additive increase when requests complete close to the limit."""
+    limiter = AIMDLimiter(initial=10, minimum=2, maximum=100)
+    limiter.release(limiter.try_acquire(), congested=False)
+    assert limiter.limit == 10
+
+    limiter.in_flight = 8
+    limiter.release(limiter.try_acquire(), congested=False)
+    assert limiter.limit == 10.1
+
+
+def test_limit_backs_off_once_per_cooldown():
+    """Test multiplicative decrease on pool congestion, bounded by the minimum."""
+    limiter = AIMDLimiter(initial=10, minimum=2, maximum=100, backoff=0.5, cooldown=60)
+    limiter.release(limiter.try_acquire(), congested=True)
+    limiter.release(limiter.try_acquire(), congested=True)
+    assert limiter.limit == 5
+
+    limiter = AIMDLimiter(initial=3, minimum=2, maximum=100, backoff=0.5, cooldown=0)
+    limiter.release(limiter.try_acquire(), congested=True)
+    assert limiter.limit == 2
+
+
+def test_priority_classes():
+    """Test that probes and streams are exempt and auth has its own class."""
+    assert priority("/health") == PRIORITY_CRITICAL
+    assert priority("/ready") == PRIORITY_CRITICAL
+    assert priority("/api/events/notes") == PRIORITY_CRITICAL
+    assert priority("/api/auth/login") == PRIORITY_AUTH
+    assert priority("/api/note") == PRIORITY_DEFAULT
+
+
+def test_excess_requests_are_shed_by_priority():
+    """Test that a full worker sheds default traffic but still serves auth and health."""
+    app = FastAPI()
+
+    @app.get("/{path:path}")
+    async def anything(path: str):
+        return {"path": path}
+
+    limiter = AIMDLimiter(initial=4, minimum=2, maximum=100)
+    app.add_middleware(ConcurrencyLimitMiddleware, limiter=limiter)
+    client = TestClient(app)
+
+    limiter.in_flight = 4
+    response = client.get("/api/note")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/api/auth/login").status_code == 200
+    assert client.get("/health").status_code == 200
+    assert limiter.in_flight == 4
+
+
+def test_ready_reports_pool_and_database(db_engine):
+    """Test that /ready probes the database and reports pool usage."""
+    from app.main import app
+
+    response = TestClient(app).get("/ready")
+    assert response.status_code == 200
+    report = response.json()
+    assert report["database"] == "ok"
+    assert report["pool"]["checked_out"] < report["pool"]["capacity"]
+
+
+def test_ready_probes_every_shard(db_engine, monkeypatch):
+    """Test that /ready is 503 when any shard's database cannot be reached."""
+    from app.database import shard_map
+    from app.main import app
+
+    unreachable = create_engine(db_engine.url.set(port=1), connect_args={"connect_timeout": 1})
+    monkeypatch.setattr(shard_map, "engines", [db_engine, unreachable])
+    try:
+        response = TestClient(app).get("/ready")
+    finally:
+        unreachable.dispose()
+
+    assert response.status_code == 503
+    report = response.json()
+    assert report["database"] == "unreachable"
+    assert [shard["database"] for shard in report["shards"]] == ["ok", "unreachable"]
+
+
+def test_pool_status_of_unbounded_and_unqueued_pools(db_engine):
+    """Test that unbounded overflow has no capacity and pools without a queue are skipped."""
+    unbounded = create_engine(db_engine.url, poolclass=TimedQueuePool, pool_size=2, max_overflow=-1)
+    unqueued = create_engine(db_engine.url, poolclass=NullPool)
+    try:
+        status = pool_status(unbounded)
+        assert status is not None
+        assert status["size"] == 2 and status["capacity"] is None and status["saturation"] is None
+        assert pool_status(unqueued) is None
+
+        ready, report = readiness([unbounded, unqueued])
+        assert ready
+        assert [shard["database"] for shard in report["shards"]] == ["ok", "ok"]
+    finally:
+        unbounded.dispose()
+        unqueued.dispose()
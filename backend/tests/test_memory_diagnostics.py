@@ -0,0 +1,102 @@
+"""Tests for the per-worker memory diagnostics."""
+
+import os
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import memory_diagnostics
+from app.main import app
+
+
+class Leaky:
+    pass
+
+
+@pytest.fixture
+def tracing():
+    """tracemalloc running for the test only, unless something else already runs it."""
+    already = tracemalloc.is_tracing()
+    memory_diagnostics.start()
+    yield
+    if not already:
+        memory_diagnostics.stop()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(memory_diagnostics, "DIAGNOSTICS_TOKEN", "secret")
+    return TestClient(app, headers={"X-Diagnostics-Token": "secret"})
+
+
+def test_diff_points_at_the_growing_line(tracing):
+    """Test that allocations made between two snapshots are attributed to their file and line."""
+    base = memory_diagnostics.take_snapshot()["id"]
+    kept = [bytearray(1000) for _ in range(2000)]  # noqa: F841
+
+    result = memory_diagnostics.diff(base, limit=5)
+
+    top = result["top"][0]
+    assert top["file"] == __file__
+    assert top["size_diff"] >= 2000 * 1000
+    assert top["count_diff"] >= 2000
+
+    by_file = memory_diagnostics.diff(base, group_by="filename", limit=1)["top"][0]
+    assert by_file["file"] == __file__ and "line" not in by_file
+
+
+def test_snapshots_are_bounded(tracing, monkeypatch):
+    """Test that only the newest MEMORY_SNAPSHOT_LIMIT snapshots are kept."""
+    monkeypatch.setattr(memory_diagnostics, "MEMORY_SNAPSHOT_LIMIT", 2)
+    ids = [memory_diagnostics.take_snapshot()["id"] for _ in range(3)]
+
+    kept = [snapshot["id"] for snapshot in memory_diagnostics.tracemalloc_status()["snapshots"]]
+    assert ids[1:] == kept[-2:] and ids[0] not in kept
+    with pytest.raises(ValueError):
+        memory_diagnostics.diff(ids[0])
+
+
+def test_object_counts_by_type():
+    """Test that objects tracked by the garbage collector are counted by their qualified type name."""
+    kept = [Leaky() for _ in range(500)]  # noqa: F841
+
+    counts = {entry["type"]: entry["count"] for entry in memory_diagnostics.object_counts(limit=1000)["types"]}
+
+    assert counts[f"{__name__}.Leaky"] >= 500
+
+
+def test_endpoints_are_hidden_without_token(monkeypatch):
+    """Test that the diagnostics do not exist unless DIAGNOSTICS_TOKEN is set, and then require it."""
+    monkeypatch.setattr(memory_diagnostics, "DIAGNOSTICS_TOKEN", "")
+    assert TestClient(app).get("/debug/memory").status_code == 404
+
+    monkeypatch.setattr(memory_diagnostics, "DIAGNOSTICS_TOKEN", "secret")
+    assert TestClient(app).get("/debug/memory").status_code == 403
+    assert TestClient(app).get("/debug/memory", headers={"X-Diagnostics-Token": "wrong"}).status_code == 403
+
+
+def test_snapshot_and_diff_endpoints(client):
+    """Test the tracemalloc workflow over HTTP, with every answer naming its worker."""
+    already = tracemalloc.is_tracing()
+    try:
+        assert client.post("/debug/memory/snapshots").status_code == (201 if already else 409)
+
+        started = client.post("/debug/memory/tracemalloc/start", params={"frames": 3}).json()
+        assert started["tracing"] and started["frames"] == 3
+        snapshot = client.post("/debug/memory/snapshots").json()
+        diff = client.get(f"/debug/memory/snapshots/{snapshot['id']}/diff", params={"group_by": "traceback"})
+        assert diff.status_code == 200
+        assert diff.json()["pid"] == os.getpid()
+        assert client.get("/debug/memory/snapshots/999999/diff").status_code == 404
+        tracemalloc.stop()
+        assert client.get(f"/debug/memory/snapshots/{snapshot['id']}/diff").status_code == 409
+        tracemalloc.start(3)
+
+        overview = client.get("/debug/memory").json()
+        assert len(overview["gc"]["counts"]) == 3
+        assert overview["tracemalloc"]["snapshots"][-1]["id"] == snapshot["id"]
+        assert client.get("/debug/memory/objects", params={"collect": True}).json()["collected"] >= 0
+    finally:
+        if not already:
+            client.post("/debug/memory/tracemalloc/stop")
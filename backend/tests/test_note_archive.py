@@ -0,0 +1,186 @@
+"""Tests for the cold-note archive."""
+
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.autogenerated.pydantic_models import UpdateNoteRequest
+from app.ids import uuid7
+from app.models.note import NOTE_BODY_EXTERNAL_THRESHOLD, Note
+from app.models.user import User
+from app.note_archive import archive_batch, restore
+from app.routers.note import delete_note, update_note
+
+# Older than any real note, so only the test's notes are archived
+LONG_AGO = datetime(1990, 1, 1, tzinfo=timezone.utc)
+CUTOFF = datetime(1991, 1, 1, tzinfo=timezone.utc)
+
+
+def create_old_note(client, db_session, auth_headers, content="Cold"):
+    note = client.post("/api/note", json={"title": "Old", "content": content}, headers=auth_headers).json()
+    db_session.execute(
+        text("UPDATE notes SET date_updated = :ts WHERE id = :id"), {"ts": LONG_AGO, "id": note["id"]}
+    )
+    return note
+
+
+def archive_old_notes(db_session) -> int:
+    archived = archive_batch(db_session.connection(), CUTOFF)
+    db_session.commit()
+    return archived
+
+
+def test_archived_notes_leave_listings_but_stay_readable(client, db_session, auth_headers):
+    """Test that archived notes are excluded from listings and stats but served by ID."""
+    old = create_old_note(client, db_session, auth_headers)
+    recent = client.post("/api/note", json={"title": "New", "content": "Hot"}, headers=auth_headers).json()
+
+    assert archive_old_notes(db_session) == 1
+    assert archive_old_notes(db_session) == 0
+
+    listing = client.get("/api/note", headers=auth_headers).json()
+    assert [note["id"] for note in listing] == [recent["id"]]
+    assert client.get("/api/note/stats", headers=auth_headers).json()["note_count"] == 1
+
+    fetched = client.get(f"/api/note/{old['id']}", headers=auth_headers)
+    assert fetched.status_code == 200
+    assert fetched.json()["content"] == "Cold"
+    assert fetched.json()["date_updated"].startswith("1990-01-01")
+
+
+def test_update_restores_archived_note(client, db_session, auth_headers):
+    """Test that editing an archived note moves it back into the listing."""
+    old = create_old_note(client, db_session, auth_headers)
+    archive_old_notes(db_session)
+
+    updated = client.patch(f"/api/note/{old['id']}", json={"title": "Warm again"}, headers=auth_headers)
+
+    assert updated.status_code == 200
+    assert updated.json()["title"] == "Warm again"
+    assert updated.json()["content"] == "Cold"
+    listing = client.get("/api/note", headers=auth_headers).json()
+    assert [note["id"] for note in listing] == [old["id"]]
+    assert db_session.execute(
+        text("SELECT count(*) FROM archived_notes WHERE id = :id"), {"id": old["id"]}
+    ).scalar() == 0
+
+
+def test_large_bodies_round_trip(client, db_session, auth_headers):
+    """Test that externally stored bodies survive archival and restoration."""
+    content = "x" * (NOTE_BODY_EXTERNAL_THRESHOLD * 2)
+    old = create_old_note(client, db_session, auth_headers, content=content)
+    archive_old_notes(db_session)
+
+    assert client.get(f"/api/note/{old['id']}", headers=auth_headers).json()["content"] == content
+    client.patch(f"/api/note/{old['id']}", json={"title": "Big"}, headers=auth_headers)
+    assert client.get(f"/api/note/{old['id']}", headers=auth_headers).json()["content"] == content
+
+
+def test_delete_archived_note(client, db_session, auth_headers):
+    """Test that archived notes can be deleted like active ones."""
+    old = create_old_note(client, db_session, auth_headers)
+    archive_old_notes(db_session)
+
+    assert client.delete(f"/api/note/{old['id']}", headers=auth_headers).status_code == 204
+    assert client.get(f"/api/note/{old['id']}", headers=auth_headers).status_code == 404
+
+
+@pytest.fixture
+def committed_old_note(db_engine, password_hash):
+    """A user and one note old enough to archive, committed so that two sessions can race on it."""
+    user = User(id=str(uuid7()), email=f"{uuid.uuid4().hex}@example.com", hashed_password=password_hash)
+    note = Note(id=str(uuid7()), title="Old", content="Cold", user_id=user.id, date_updated=LONG_AGO)
+    with Session(db_engine) as session:
+        session.add(user)
+        session.flush()
+        session.add(note)
+        session.commit()
+        ids = user.id, note.id
+    yield ids
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM notes WHERE user_id = :id"), {"id": ids[0]})
+        conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": ids[0]})
+
+
+@pytest.fixture
+def committed_archived_note(db_engine, committed_old_note):
+    """Like committed_old_note, but already archived."""
+    with db_engine.begin() as conn:
+        archive_batch(conn, CUTOFF)
+    return committed_old_note
+
+
+def race_with_archiver(db_engine, user_id, call):
+    """Run `call(user, session)` in a second session while a first one is archiving."""
+    first, second = Session(db_engine), Session(db_engine)
+    try:
+        archive_batch(first.connection(), CUTOFF)
+        outcome = {}
+
+        def run():
+            try:
+                outcome["result"] = call(second.get(User, user_id), second)
+            except Exception as error:
+                outcome["error"] = error
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        time.sleep(0.2)
+        first.commit()
+        thread.join()
+        assert "error" not in outcome, outcome.get("error")
+        return outcome["result"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_update_racing_the_archiver(db_engine, committed_old_note):
+    """Test that an update of a note being archived waits and restores it instead of failing."""
+    user_id, note_id = committed_old_note
+    note = race_with_archiver(
+        db_engine, user_id,
+        lambda user, db: asyncio.run(update_note(note_id, UpdateNoteRequest(title="New"), user, db)),
+    )
+    assert note.title == "New"
+    assert note.content == "Cold"
+
+
+def test_delete_racing_the_archiver(db_engine, committed_old_note):
+    """Test that a delete of a note being archived waits and deletes the archived copy."""
+    user_id, note_id = committed_old_note
+    race_with_archiver(db_engine, user_id, lambda user, db: asyncio.run(delete_note(note_id, user, db)))
+    with db_engine.connect() as conn:
+        for table in ("notes", "archived_notes"):
+            assert conn.execute(text(f"SELECT count(*) FROM {table} WHERE id = :id"), {"id": note_id}).scalar() == 0
+
+
+def test_concurrent_updates_of_archived_note(db_engine, committed_archived_note):
+    """Test that an update waiting on another's restore finds the restored note instead of a 404."""
+    user_id, note_id = committed_archived_note
+    first, second = Session(db_engine), Session(db_engine)
+    try:
+        assert restore(first, note_id, user_id)
+        outcome = {}
+
+        def update():
+            user = second.get(User, user_id)
+            outcome["note"] = asyncio.run(update_note(note_id, UpdateNoteRequest(title="Second"), user, second))
+
+        thread = threading.Thread(target=update)
+        thread.start()
+        time.sleep(0.2)
+        first.commit()
+        thread.join()
+
+        assert outcome["note"].title == "Second"
+        assert outcome["note"].content == "Cold"
+    finally:
+        first.close()
+        second.close()
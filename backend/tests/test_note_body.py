@@ -0,0 +1,41 @@
+"""Tests for external storage of large note bodies."""
+
+from app.compression import CODEC_ZLIB, DEFAULT_CODEC, compress, decompress
+from app.models.note import NOTE_BODY_EXTERNAL_THRESHOLD, Note
+
+
+def test_compression_round_trip():
+    """Test that every codec restores the original bytes."""
+    data = b"note body " * 500
+    for codec in {DEFAULT_CODEC, CODEC_ZLIB}:
+        compressed = compress(data, codec)
+        assert len(compressed) < len(data)
+        assert decompress(compressed, codec) == data
+
+
+def test_small_content_stays_inline():
+    """Test that bodies under the threshold are stored in the notes row."""
+    note = Note(id="n1", title="t", content="hello", user_id="u1")
+    assert not note.has_external_body
+    assert note.body is None
+    assert note.content == "hello"
+
+
+def test_large_content_is_stored_externally():
+    """Test that bodies over the threshold are compressed into a NoteBody."""
+    content = "x" * (NOTE_BODY_EXTERNAL_THRESHOLD + 1)
+    note = Note(id="n1", title="t", content=content, user_id="u1")
+    assert note.has_external_body
+    assert note.inline_content == ""
+    assert note.body is not None
+    assert note.body.raw_size == len(content)
+    assert note.content == content
+
+
+def test_shrinking_content_moves_it_back_inline():
+    """Test that replacing a large body with a small one drops the NoteBody."""
+    note = Note(id="n1", title="t", content="x" * (NOTE_BODY_EXTERNAL_THRESHOLD + 1), user_id="u1")
+    note.content = "short"
+    assert not note.has_external_body
+    assert note.body is None
+    assert note.content == "short"
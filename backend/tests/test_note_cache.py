@@ -0,0 +1,36 @@
+"""Tests for the server-side note listing cache."""
+
+import time
+
+from app.note_cache import MemoryLRUBackend, NoteListCache, SQLiteBackend
+
+
+def test_memory_backend_evicts_least_recently_used_by_size():
+    """Test that the LRU stays under its byte budget, evicting the coldest entry."""
+    backend = MemoryLRUBackend(max_bytes=10)
+    backend.set("a", b"aaaa")
+    backend.set("b", b"bbbb")
+    assert backend.get("a") == b"aaaa"
+    backend.set("c", b"cccc")
+    assert backend.get("b") is None
+    assert backend.get("a") == b"aaaa"
+    assert backend.usage() == (2, 8)
+
+
+def test_sqlite_backend_is_shared_and_expires(tmp_path):
+    """Test that entries are visible to other instances on the same file until they expire."""
+    path = str(tmp_path / "cache.sqlite3")
+    writer = SQLiteBackend(path, max_bytes=1024, ttl_seconds=0.2)
+    reader = SQLiteBackend(path, max_bytes=1024, ttl_seconds=0.2)
+    writer.set("k", b"value")
+    assert reader.get("k") == b"value"
+    assert reader.usage() == (1, 5)
+    time.sleep(0.25)
+    assert reader.get("k") is None
+
+
+def test_key_depends_on_version_and_normalized_query():
+    """Test that a new version changes the key and parameter order does not."""
+    assert NoteListCache.key("u1", 1, "a=1&b=2") == NoteListCache.key("u1", 1, "b=2&a=1")
+    assert NoteListCache.key("u1", 1) != NoteListCache.key("u1", 2)
+    assert NoteListCache.key("u1", 1) != NoteListCache.key("u2", 1)
@@ -0,0 +1,142 @@
+"""Tests for per-user note statistics."""
+
+import uuid
+
+import pytest
+from sqlalchemy import delete, text
+from sqlalchemy.orm import Session
+
+from app.ids import uuid7
+from app.models.note import Note
+from app.models.user import User
+from app.models.user_note_stats import UserNoteStats
+from app.note_stats import get_note_stats, list_etag, reconcile
+
+
+class EmptySession:
+    """Session stand-in that finds no rows."""
+
+    def get(self, model, key):
+        return None
+
+
+def test_content_size_counts_utf8_bytes():
+    """Test that the content setter records the encoded size of the body."""
+    note = Note(id="n1", title="t", content="héllo", user_id="u1")
+    assert note.content_size == 6
+    note.content = ""
+    assert note.content_size == 0
+
+
+def test_missing_stats_are_zeroed():
+    """Test that users without a stats row get empty aggregates."""
+    stats = get_note_stats(EmptySession(), "u1")
+    assert stats.note_count == 0
+    assert stats.total_bytes == 0
+    assert stats.last_modified is None
+    assert stats.version == 0
+
+
+def test_list_etag_changes_with_version():
+    """Test that the listing validator is weak and tied to the collection version."""
+    etag = list_etag("u1", 3)
+    assert etag.startswith('W/"')
+    assert etag != list_etag("u1", 4)
+    assert etag != list_etag("u2", 3)
+
+
+def add_user(session, password_hash) -> User:
+    user = User(id=str(uuid7()), email=f"{uuid.uuid4().hex}@example.com", hashed_password=password_hash)
+    session.add(user)
+    return user
+
+
+def add_note(session, user_id, content) -> Note:
+    note = Note(id=str(uuid7()), title="t", content=content, user_id=user_id)
+    session.add(note)
+    session.flush()
+    return note
+
+
+def stats_of(session, user_id) -> tuple[int, int, int]:
+    session.expire_all()
+    stats = get_note_stats(session, user_id)
+    return stats.note_count, stats.total_bytes, stats.version
+
+
+def test_trigger_counts_inserts_and_deletes(db_session, user):
+    """Test that the trigger adds and removes each note's count and size, bumping the version."""
+    first = add_note(db_session, user.id, "héllo")
+    add_note(db_session, user.id, "abc")
+    assert stats_of(db_session, user.id) == (2, 9, 2)
+
+    db_session.delete(first)
+    db_session.flush()
+    assert stats_of(db_session, user.id) == (1, 3, 3)
+
+
+def test_trigger_moves_counts_with_the_note(db_session, user, password_hash):
+    """Test that reassigning a note to another user moves its count and size between them."""
+    other = add_user(db_session, password_hash)
+    note = add_note(db_session, user.id, "hello")
+    add_note(db_session, user.id, "x")
+
+    note.user_id = other.id
+    db_session.flush()
+
+    assert stats_of(db_session, user.id)[:2] == (1, 1)
+    assert stats_of(db_session, other.id)[:2] == (1, 5)
+
+
+def test_stats_follow_writes(client, auth_headers):
+    """Test that stats are maintained by the database on create, update and delete."""
+    note = client.post("/api/note", json={"title": "t", "content": "héllo"}, headers=auth_headers).json()
+    stats = client.get("/api/note/stats", headers=auth_headers).json()
+    assert (stats["note_count"], stats["total_bytes"]) == (1, 6)
+
+    client.patch(f"/api/note/{note['id']}", json={"content": "hi"}, headers=auth_headers)
+    stats = client.get("/api/note/stats", headers=auth_headers).json()
+    assert (stats["note_count"], stats["total_bytes"]) == (1, 2)
+
+    client.delete(f"/api/note/{note['id']}", headers=auth_headers)
+    stats = client.get("/api/note/stats", headers=auth_headers).json()
+    assert (stats["note_count"], stats["total_bytes"]) == (0, 0)
+
+
+@pytest.fixture
+def committed_user(db_engine, password_hash):
+    """A user with two notes, committed because reconcile runs its own transactions."""
+    with Session(db_engine) as session:
+        user = add_user(session, password_hash)
+        session.flush()
+        add_note(session, user.id, "hello")
+        add_note(session, user.id, "wörld")
+        session.commit()
+        user_id = user.id
+    yield user_id
+    with Session(db_engine) as session:
+        session.execute(delete(Note).where(Note.user_id == user_id))
+        session.execute(delete(User).where(User.id == user_id))
+        session.commit()
+
+
+def test_reconcile_repairs_drifted_stats(db_engine, committed_user):
+    """Test that reconcile recomputes drifted aggregates and leaves correct ones alone."""
+    with db_engine.begin() as conn:
+        conn.execute(
+            text("UPDATE user_note_stats SET note_count = 7, total_bytes = 0 WHERE user_id = :user_id"),
+            {"user_id": committed_user},
+        )
+
+    with db_engine.connect() as conn:
+        assert reconcile(conn, batch_size=2) >= 1
+
+    with Session(db_engine) as session:
+        stats = session.get(UserNoteStats, committed_user)
+        assert (stats.note_count, stats.total_bytes) == (2, 11)
+        version = stats.version
+
+    with db_engine.connect() as conn:
+        reconcile(conn)
+    with Session(db_engine) as session:
+        assert session.get(UserNoteStats, committed_user).version == version
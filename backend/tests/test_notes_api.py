@@ -0,0 +1,70 @@
+"""Tests for the note endpoints against the database."""
+
+import uuid
+
+from app.ids import uuid7
+from app.models.note import Note
+from app.models.user import User
+
+
+def test_create_and_list_notes(client, auth_headers):
+    """Test that a created note is listed for its owner."""
+    response = client.post("/api/note", json={"title": "t", "content": "hello"}, headers=auth_headers)
+    assert response.status_code == 201
+    note = response.json()
+
+    response = client.get("/api/note", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == [note]
+
+
+def test_list_not_modified_until_write(client, auth_headers):
+    """Test that the listing ETag answers 304 until the notes change."""
+    etag = client.get("/api/note", headers=auth_headers).headers["etag"]
+    response = client.get("/api/note", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/api/note", json={"title": "t", "content": "hello"}, headers=auth_headers)
+    response = client.get("/api/note", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_other_users_note_is_not_found(client, db_session, auth_headers, password_hash):
+    """Test that notes can only be read, updated and deleted by their owner."""
+    other = User(id=str(uuid7()), email=f"{uuid.uuid4().hex}@example.com", hashed_password=password_hash)
+    db_session.add(other)
+    db_session.flush()
+    note = Note(id=str(uuid7()), title="Theirs", content="private", user_id=other.id)
+    db_session.add(note)
+    db_session.commit()
+
+    path = f"/api/note/{note.id}"
+    assert client.get(path, headers=auth_headers).status_code == 404
+    assert client.patch(path, json={"title": "Mine"}, headers=auth_headers).status_code == 404
+    assert client.delete(path, headers=auth_headers).status_code == 404
+
+    db_session.refresh(note)
+    assert note.title == "Theirs"
+
+
+def test_unknown_or_malformed_note_id_is_not_found(client, auth_headers):
+    """Test that unknown IDs, and IDs the UUID key column would reject, are answered with 404."""
+    for id in ("01a15143-a205-713d-b8dd-ebc21f3e0b2c", "not-a-uuid", "urn:uuid:12345678-1234-5678-1234-567812345678"):
+        response = client.get(f"/api/note/{id}", headers=auth_headers)
+        assert response.status_code == 404
+
+
+def test_listing_is_cached_until_write(client, auth_headers):
+    """Test that repeated listings hit the cache and a write invalidates it."""
+    from app.note_cache import hits_counter
+
+    first = client.get("/api/note", headers=auth_headers)
+    hits = hits_counter.value
+    again = client.get("/api/note", headers=auth_headers)
+    assert hits_counter.value == hits + 1
+    assert again.content == first.content
+
+    client.post("/api/note", json={"title": "t", "content": "c"}, headers=auth_headers)
+    response = client.get("/api/note", headers=auth_headers)
+    assert hits_counter.value == hits + 1
+    assert len(response.json()) == 1
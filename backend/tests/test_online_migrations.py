@@ -0,0 +1,212 @@
+"""Tests for the online migration helpers, in a scratch schema, and for dry runs in scratch databases."""
+
+import os
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database import DB_NAME
+from app.online_migrations import (
+    backfill,
+    create_index_concurrently,
+    drop_index_concurrently,
+    estimate_rows,
+    table_estimate,
+)
+
+
+@pytest.fixture
+def conn(db_engine):
+    """AUTOCOMMIT connection whose search_path is a throwaway schema."""
+    schema = f"test_online_{uuid.uuid4().hex[:8]}"
+    with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"CREATE SCHEMA {schema}"))
+        connection.execute(text(f"SET search_path TO {schema}"))
+        try:
+            yield connection
+        finally:
+            connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+            connection.execute(text("RESET search_path"))
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+# Before the note body, partitioning, UUID and note stats revisions
+PRE_EXTERNAL_BODIES = "eb05631fb603"
+
+
+def alembic(database: str, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-m", "alembic", *args],
+        cwd=BACKEND_DIR, env={**os.environ, "DB_NAME": database}, capture_output=True, text=True,
+    )
+
+
+@pytest.fixture
+def scratch_db(db_engine):
+    """Name of an empty scratch database, dropped again afterwards."""
+    name = f"{DB_NAME}-migrations-{uuid.uuid4().hex[:8]}"
+    admin = db_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        admin.execute(text(f'CREATE DATABASE "{name}"'))
+    except SQLAlchemyError as e:
+        admin.close()
+        pytest.skip(f"Could not create a scratch database: {e}")
+    try:
+        yield name
+    finally:
+        admin.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        admin.close()
+
+
+def scalar(db_engine, database: str, sql: str):
+    scratch = create_engine(db_engine.url.set(database=database))
+    try:
+        with scratch.connect() as connection:
+            return connection.execute(text(sql)).scalar()
+    finally:
+        scratch.dispose()
+
+
+def current_revision(db_engine, database: str) -> str:
+    return scalar(db_engine, database, "SELECT version_num FROM alembic_version")
+
+
+@pytest.fixture
+def items(conn):
+    conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER, doubled INTEGER)"))
+    conn.execute(text("INSERT INTO items (id, value) SELECT i, i FROM generate_series(1, 250) i"))
+    conn.execute(text("ANALYZE items"))
+    return "items"
+
+
+@pytest.fixture
+def partitioned(conn):
+    conn.execute(text("CREATE TABLE parts (id INTEGER, user_id INTEGER) PARTITION BY HASH (id)"))
+    for i in range(3):
+        conn.execute(text(f"CREATE TABLE parts_p{i} PARTITION OF parts FOR VALUES WITH (MODULUS 3, REMAINDER {i})"))
+    conn.execute(text("INSERT INTO parts SELECT i, i % 7 FROM generate_series(1, 100) i"))
+    return "parts"
+
+
+def test_backfill_updates_all_rows_in_batches(conn, items):
+    """Test that a backfill covers every matching row and reports progress per batch."""
+    progress = []
+    updated = backfill(
+        "double_values", items, "doubled = value * 2", where="doubled IS NULL",
+        batch_size=100, pause_seconds=0, conn=conn, on_progress=lambda done, total: progress.append(done),
+    )
+
+    assert updated == 250
+    assert progress == [100, 200, 250]
+    assert conn.execute(text("SELECT count(*) FROM items WHERE doubled = value * 2")).scalar() == 250
+    assert conn.execute(
+        text("SELECT finished, rows_done FROM migration_progress WHERE name = 'double_values'")
+    ).one() == (True, 250)
+
+
+def test_finished_backfill_is_not_rerun(conn, items):
+    """Test that running a finished backfill again does nothing."""
+    backfill("double_values", items, "doubled = value * 2", where="doubled IS NULL", pause_seconds=0, conn=conn)
+    conn.execute(text("UPDATE items SET doubled = NULL WHERE id = 1"))
+
+    assert backfill("double_values", items, "doubled = value * 2", where="doubled IS NULL", pause_seconds=0, conn=conn) == 0
+    assert conn.execute(text("SELECT doubled FROM items WHERE id = 1")).scalar() is None
+
+
+def test_interrupted_backfill_resumes(conn, items):
+    """Test that a backfill stopped mid-way continues after the last committed batch."""
+
+    def interrupt(done, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        backfill(
+            "double_values", items, "doubled = value * 2", where="doubled IS NULL",
+            batch_size=100, pause_seconds=0, conn=conn, on_progress=interrupt,
+        )
+    assert conn.execute(text("SELECT count(*) FROM items WHERE doubled IS NOT NULL")).scalar() == 100
+
+    updated = backfill(
+        "double_values", items, "doubled = value * 2", where="doubled IS NULL",
+        batch_size=100, pause_seconds=0, conn=conn,
+    )
+    assert updated == 150
+    assert conn.execute(text("SELECT rows_done FROM migration_progress WHERE name = 'double_values'")).scalar() == 250
+
+
+def test_concurrent_index_on_partitioned_table(conn, partitioned):
+    """Test that the parent index ends up valid with one attached index per partition."""
+    create_index_concurrently("ix_parts_user_id", partitioned, ["user_id"], conn=conn)
+    # Re-running, e.g. after an interrupted migration, is a no-op
+    create_index_concurrently("ix_parts_user_id", partitioned, ["user_id"], conn=conn)
+
+    valid = conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('ix_parts_user_id')")
+    ).scalar()
+    children = conn.execute(
+        text("SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass('ix_parts_user_id')")
+    ).scalar()
+    assert valid is True
+    assert children == 3
+
+    drop_index_concurrently("ix_parts_user_id", conn=conn)
+    assert conn.execute(text("SELECT to_regclass('ix_parts_user_id')")).scalar() is None
+
+
+def test_invalid_index_is_rebuilt(conn, items):
+    """Test that an index left invalid by a failed build is replaced."""
+    conn.execute(text("CREATE INDEX ix_items_value ON items (value)"))
+    conn.execute(
+        text("UPDATE pg_index SET indisvalid = false WHERE indexrelid = to_regclass('ix_items_value')")
+    )
+
+    create_index_concurrently("ix_items_value", items, ["value"], conn=conn)
+
+    assert conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('ix_items_value')")
+    ).scalar() is True
+
+
+def test_estimates_use_table_statistics(conn, items):
+    """Test that dry-run estimates come from pg_class and the planner."""
+    rows, size = table_estimate(conn, items)
+    assert rows == 250
+    assert size > 0
+    assert 0 < estimate_rows(conn, items, "value > 200") < 250
+
+
+def test_identifiers_are_validated(conn):
+    """Test that table and index names cannot smuggle in SQL."""
+    with pytest.raises(ValueError):
+        create_index_concurrently("ix; DROP TABLE users", "items", ["value"], conn=conn)
+
+
+def test_dry_run_refuses_revisions_outside_the_helpers(db_engine, scratch_db):
+    """Test that a dry run from before the table rebuilds refuses instead of copying data."""
+    assert alembic(scratch_db, "upgrade", PRE_EXTERNAL_BODIES).returncode == 0
+
+    result = alembic(scratch_db, "-x", "dry_run=true", "upgrade", "head")
+
+    assert result.returncode != 0
+    assert "3f9a1c2d7b4e" in result.stderr and "cannot be dry-run" in result.stderr
+    assert current_revision(db_engine, scratch_db) == PRE_EXTERNAL_BODIES
+    assert scalar(db_engine, scratch_db, "SELECT to_regclass('note_bodies')") is None
+
+
+def test_dry_run_stops_before_unsafe_revision_when_asked(db_engine, scratch_db):
+    """Test that safe revisions can be dry-run up to the one the refusal names, leaving no trace."""
+    assert alembic(scratch_db, "upgrade", "d83b6a1e4f05").returncode == 0
+
+    refused = alembic(scratch_db, "-x", "dry_run=true", "upgrade", "head")
+    assert refused.returncode != 0
+    assert "upgrade 9e4b7d2c6f31" in refused.stderr
+
+    result = alembic(scratch_db, "-x", "dry_run=true", "upgrade", "9e4b7d2c6f31")
+    assert result.returncode == 0, result.stderr
+    assert current_revision(db_engine, scratch_db) == "d83b6a1e4f05"
+    assert scalar(db_engine, scratch_db, "SELECT to_regclass('archived_notes')") is None
@@ -0,0 +1,74 @@
+"""Tests for on-demand request profiling."""
+
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.profiling import ProfilingMiddleware, RateLimiter, StackSampler
+
+
+def busy_wait(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def make_client(tmp_path, rate_per_minute: float = 60) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        busy_wait(0.05)
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware, token="secret", output_dir=tmp_path, rate_per_minute=rate_per_minute)
+    return TestClient(app)
+
+
+def test_rate_limiter_spaces_out_events():
+    """Test that only one event is allowed per interval."""
+    limiter = RateLimiter(per_minute=60)
+    assert limiter.acquire()
+    assert not limiter.acquire()
+
+
+def test_sampler_collects_collapsed_stacks():
+    """Test that samples of a busy thread are collapsed into counted stacks."""
+    sampler = StackSampler(interval=0.001, max_seconds=5)
+    sampler.start()
+    busy_wait(0.05)
+    sampler.stop()
+    output = sampler.collapsed()
+    assert "busy_wait" in output
+    for line in output.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack.count(";") >= 1
+        assert int(count) > 0
+
+
+def test_request_with_token_is_profiled(tmp_path):
+    """Test that a request with the profile token writes a collapsed-stack file."""
+    client = make_client(tmp_path)
+    response = client.get("/slow", headers={"X-Profile-Token": "secret"})
+    assert response.status_code == 200
+    profile = tmp_path / response.headers["x-profile"]
+    assert "busy_wait" in profile.read_text()
+
+
+def test_requests_without_valid_token_are_not_profiled(tmp_path):
+    """Test that profiling needs the exact token."""
+    client = make_client(tmp_path)
+    assert "x-profile" not in client.get("/slow").headers
+    assert "x-profile" not in client.get("/slow", headers={"X-Profile-Token": "wrong"}).headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiles_are_rate_limited(tmp_path):
+    """Test that requests over the rate limit are served but not profiled."""
+    client = make_client(tmp_path, rate_per_minute=1)
+    assert client.get("/slow?profile_token=secret").headers["x-profile"].endswith(".folded")
+    response = client.get("/slow?profile_token=secret")
+    assert response.status_code == 200
+    assert response.headers["x-profile"] == "skipped"
+    assert len(list(tmp_path.iterdir())) == 1
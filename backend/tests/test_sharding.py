@@ -0,0 +1,197 @@
+"""
+Tests for user sharding, against two scratch databases created next to the
+test database and migrated with Alembic. Requests go through the real
+`get_db`, so users are committed and deleted again afterwards.
+"""
+
+import os
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database import DB_NAME, engine, shard_map
+from app.main import app
+from app.sharding import move_user, shard_counts
+from app.user_provisioning import MODE_RESET, UserRecord, apply_chunk
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+
+@pytest.fixture(scope="session")
+def shard_engines(db_engine):
+    """Engines of the home shard and two migrated scratch databases."""
+    names = [f"{DB_NAME}-shard-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    admin = db_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    extra = []
+    try:
+        for name in names:
+            admin.execute(text(f'CREATE DATABASE "{name}"'))
+            subprocess.run(
+                [sys.executable, "-m", "alembic", "upgrade", "head"],
+                cwd=BACKEND_DIR, env={**os.environ, "DB_NAME": name}, check=True, capture_output=True,
+            )
+            extra.append(create_engine(db_engine.url.set(database=name)))
+    except (SQLAlchemyError, subprocess.CalledProcessError) as e:
+        pytest.skip(f"Could not create shard databases: {e}")
+
+    try:
+        yield [engine] + extra
+    finally:
+        for shard_engine in extra:
+            shard_engine.dispose()
+        for name in names:
+            admin.execute(text(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+        admin.close()
+
+
+@pytest.fixture
+def sharded(shard_engines):
+    """Route requests over three shards with an uncached directory."""
+    original = shard_map.engines, shard_map.cache_seconds
+    shard_map.configure(shard_engines, cache_seconds=0)
+    created = []
+    try:
+        yield created
+    finally:
+        for user_id in created:
+            for shard_engine in shard_engines:
+                with shard_engine.begin() as conn:
+                    conn.execute(text("DELETE FROM notes WHERE user_id = :id"), {"id": user_id})
+                    conn.execute(text("DELETE FROM users WHERE id = :id"), {"id": user_id})
+                    conn.execute(text("DELETE FROM user_directory WHERE user_id = :id"), {"id": user_id})
+        shard_map.configure(*original)
+
+
+def register(client, created, monkeypatch, shard, password):
+    """Register a user placed on `shard` and return its ID and auth headers."""
+    monkeypatch.setattr(shard_map, "placement", lambda user_id: shard)
+    email = f"{uuid.uuid4().hex}@example.com"
+    response = client.post("/api/auth/register", json={"email": email, "password": password})
+    assert response.status_code == 201
+    created.append(response.json()["id"])
+
+    login = client.post("/api/auth/login", json={"email": email, "password": password})
+    assert login.status_code == 200
+    return response.json()["id"], {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+
+def count(shard_engine, table, user_id):
+    with shard_engine.connect() as conn:
+        column = "id" if table == "users" else "user_id"
+        return conn.execute(text(f"SELECT count(*) FROM {table} WHERE {column} = :id"), {"id": user_id}).scalar()
+
+
+def test_user_rows_live_on_their_shard(sharded, shard_engines, monkeypatch, test_password):
+    """Test that a user registered on shard 2 logs in through the directory and writes notes there."""
+    client = TestClient(app)
+    user_id, headers = register(client, sharded, monkeypatch, shard=2, password=test_password)
+
+    assert client.post("/api/note", json={"title": "t", "content": "on shard 2"}, headers=headers).status_code == 201
+    assert client.get("/api/auth/me", headers=headers).json()["id"] == user_id
+
+    assert [count(e, "users", user_id) for e in shard_engines] == [0, 0, 1]
+    assert [count(e, "notes", user_id) for e in shard_engines] == [0, 0, 1]
+    with engine.connect() as conn:
+        assert conn.execute(
+            text("SELECT shard FROM user_directory WHERE user_id = :id"), {"id": user_id}
+        ).scalar() == 2
+    assert shard_counts()[2] >= 1
+
+
+def test_move_user_copies_rows_and_switches_shard(sharded, shard_engines, monkeypatch, test_password):
+    """Test that a moved user keeps their notes and idempotency keys, now served from the new shard only."""
+    client = TestClient(app)
+    user_id, headers = register(client, sharded, monkeypatch, shard=1, password=test_password)
+    for i in range(3):
+        client.post(
+            "/api/note", json={"title": f"note {i}", "content": "x" * 5000 * i},
+            headers={**headers, "Idempotency-Key": f"create-{i}"},
+        )
+    etag = client.get("/api/note", headers=headers).headers["etag"]
+    progress = []
+
+    result = move_user(user_id, 2, settle_seconds=0, on_progress=progress.append)
+
+    assert result.source == 1
+    assert result.rows["notes"] == 3 and result.rows["users"] == 1
+    assert len(progress) == 3
+    assert [count(e, "notes", user_id) for e in shard_engines] == [0, 0, 3]
+    assert [count(e, "users", user_id) for e in shard_engines] == [0, 0, 1]
+    assert [count(e, "idempotency_keys", user_id) for e in shard_engines] == [0, 0, 3]
+
+    # A create whose response was lost before the move is retried after it
+    retry = client.post(
+        "/api/note", json={"title": "note 0", "content": ""}, headers={**headers, "Idempotency-Key": "create-0"}
+    )
+    assert retry.headers.get("idempotent-replayed") == "true"
+
+    listing = client.get("/api/note", headers=headers)
+    assert listing.status_code == 200
+    assert sorted(note["title"] for note in listing.json()) == ["note 0", "note 1", "note 2"]
+    # A listing cached against the old shard's version must not be revalidated
+    assert listing.headers["etag"] != etag
+    assert client.post("/api/note", json={"title": "t", "content": "after"}, headers=headers).status_code == 201
+
+
+def test_writes_are_refused_while_moving(sharded, monkeypatch, test_password):
+    """Test that a user marked as moving can read but gets 503 on writes."""
+    client = TestClient(app)
+    user_id, headers = register(client, sharded, monkeypatch, shard=1, password=test_password)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE user_directory SET moving_to = 2 WHERE user_id = :id"), {"id": user_id})
+
+    write = client.post("/api/note", json={"title": "t", "content": "c"}, headers=headers)
+    assert write.status_code == 503
+    assert "retry-after" in write.headers
+    assert client.get("/api/note", headers=headers).status_code == 200
+
+    with pytest.raises(ValueError, match="already being moved"):
+        move_user(user_id, 2, settle_seconds=0)
+
+
+def test_move_to_current_shard_is_rejected(sharded, monkeypatch, test_password):
+    """Test that nothing happens when the user is already on the target shard."""
+    client = TestClient(app)
+    user_id, _ = register(client, sharded, monkeypatch, shard=1, password=test_password)
+
+    with pytest.raises(ValueError, match="already on shard 1"):
+        move_user(user_id, 1, settle_seconds=0)
+    with engine.connect() as conn:
+        assert conn.execute(
+            text("SELECT moving_to FROM user_directory WHERE user_id = :id"), {"id": user_id}
+        ).scalar() is None
+
+
+def test_provisioning_writes_users_on_their_shards(sharded, shard_engines, monkeypatch, test_password):
+    """Test that bulk provisioning creates users on their placement and resets users on other shards."""
+    client = TestClient(app)
+    user_id, _ = register(client, sharded, monkeypatch, shard=1, password=test_password)
+    monkeypatch.setattr(shard_map, "placement", lambda user_id: 2)
+    new_email = f"{uuid.uuid4().hex}@example.com"
+    with engine.connect() as conn:
+        email = conn.execute(text("SELECT email FROM user_directory WHERE user_id = :id"), {"id": user_id}).scalar()
+
+    with engine.begin() as conn:
+        created = apply_chunk(conn, [UserRecord(line=1, email=new_email, password="new")], ["hash-new"])
+    with engine.begin() as conn:
+        reset = apply_chunk(conn, [UserRecord(line=1, email=email, password="changed")], ["hash-reset"], MODE_RESET)
+
+    with engine.connect() as conn:
+        new_id, shard = conn.execute(
+            text("SELECT user_id, shard FROM user_directory WHERE email = :email"), {"email": new_email}
+        ).one()
+    sharded.append(str(new_id))
+    assert (created.created, reset.updated, reset.errors) == (1, 1, [])
+    assert shard == 2
+    assert [count(e, "users", new_id) for e in shard_engines] == [0, 0, 1]
+    with shard_engines[1].connect() as conn:
+        assert conn.execute(
+            text("SELECT hashed_password FROM users WHERE id = :id"), {"id": user_id}
+        ).scalar() == "hash-reset"
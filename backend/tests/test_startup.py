@@ -0,0 +1,67 @@
+"""Tests for the worker warm-up run by the lifespan hook."""
+
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app import startup
+from app.main import app
+
+
+def test_lifespan_warms_pool_and_serves_cached_openapi(db_engine):
+    """Test that startup leaves idle pool connections and /openapi.json serves the prebuilt schema."""
+    db_engine.pool.dispose()
+
+    with TestClient(app) as client:
+        assert db_engine.pool.checkedin() >= min(startup.STARTUP_POOL_CONNECTIONS, db_engine.pool.size())
+        assert startup.warmup_gauge.value > 0
+
+        response = client.get("/openapi.json")
+        assert response.status_code == 200
+        assert response.content == startup.openapi_json(app)
+        assert json.loads(response.content) == app.openapi()
+        assert client.get("/docs").status_code == 200
+
+
+def test_failing_step_does_not_stop_startup(monkeypatch, caplog):
+    """Test that a warm-up step that fails, e.g. with the database down, is logged and skipped."""
+    def unreachable():
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(startup, "open_pool_connections", unreachable)
+
+    durations = asyncio.run(startup.warm_up(app))
+
+    assert set(durations) == {"pool_connections", "auth", "openapi"}
+    assert "pool_connections failed" in caplog.text
+
+
+def test_slow_step_does_not_stop_startup(monkeypatch, caplog):
+    """Test that a warm-up step that hangs, e.g. on an unreachable database, is given up on."""
+    monkeypatch.setattr(startup, "open_pool_connections", lambda: time.sleep(1))
+
+    durations = asyncio.run(startup.warm_up(app, timeout=0.1))
+
+    assert durations["pool_connections"] < 1
+    assert "pool_connections timed out" in caplog.text
+
+
+def test_warm_up_connections_have_a_connect_timeout(db_engine, monkeypatch):
+    """Test that only the connections opened by warm-up are given a connect timeout."""
+    params = []
+    original = db_engine.dialect.connect
+
+    def connect(*cargs, **cparams):
+        params.append(cparams)
+        return original(*cargs, **cparams)
+
+    monkeypatch.setattr(db_engine.dialect, "connect", connect)
+    db_engine.pool.dispose()
+    startup.open_pool_connections(1)
+    db_engine.pool.dispose()
+    db_engine.connect().close()
+
+    assert params[0]["connect_timeout"] >= 2
+    assert "connect_timeout" not in params[-1]
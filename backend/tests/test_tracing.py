@@ -0,0 +1,96 @@
+"""Tests for request tracing."""
+
+import json
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.tracing import Trace, TracedRoute, TracingMiddleware, export, exporter, span
+
+TRACEPARENT = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+
+
+def make_client(tmp_path, sample_rate: float = 0.0, traceparent_sampled_per_second: float = 100.0) -> TestClient:
+    router = APIRouter(prefix="/api", route_class=TracedRoute)
+
+    @router.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        with span("load item", timing="db"):
+            pass
+        return {"id": item_id}
+
+    outer = APIRouter()
+    outer.include_router(router)
+    app = FastAPI()
+    app.include_router(outer)
+    app.add_middleware(
+        TracingMiddleware,
+        sample_rate=sample_rate,
+        path=tmp_path / "traces.jsonl",
+        traceparent_sampled_per_second=traceparent_sampled_per_second,
+    )
+    return TestClient(app)
+
+
+def read_lines(tmp_path) -> list[str]:
+    exporter.flush()
+    path = tmp_path / "traces.jsonl"
+    return path.read_text().splitlines() if path.exists() else []
+
+
+def read_spans(tmp_path) -> list[dict]:
+    lines = read_lines(tmp_path)
+    assert len(lines) == 1
+    return json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+
+
+def test_server_timing_header(tmp_path):
+    """Test that span durations are summed into Server-Timing."""
+    response = make_client(tmp_path).get("/api/items/1")
+    assert response.status_code == 200
+    metrics = {part.split(";")[0] for part in response.headers["server-timing"].split(", ")}
+    assert {"deps", "app", "db", "serialize", "total"} <= metrics
+
+
+def test_unsampled_traces_are_not_written(tmp_path):
+    """Test that only sampled traces are exported."""
+    make_client(tmp_path, sample_rate=0.0).get("/api/items/1")
+    assert read_lines(tmp_path) == []
+
+
+def test_traceparent_sampled_trace_is_exported(tmp_path):
+    """Test that a sampled traceparent is continued and written as OTLP JSON."""
+    make_client(tmp_path).get("/api/items/1", headers={"traceparent": TRACEPARENT})
+    spans = {span["name"]: span for span in read_spans(tmp_path)}
+
+    root = spans["GET /api/items/{item_id}"]
+    assert root["traceId"] == "a" * 32
+    assert root["parentSpanId"] == "b" * 16
+    assert all(span["traceId"] == "a" * 32 for span in spans.values())
+    # The endpoint is wrapped once even though its router was included twice
+    assert sum(1 for span in read_spans(tmp_path) if span["name"] == "endpoint") == 1
+    assert spans["load item"]["parentSpanId"] == spans["endpoint"]["spanId"]
+    assert spans["serialize response"]["parentSpanId"] == root["spanId"]
+
+
+def test_client_sampling_is_rate_limited(tmp_path):
+    """Test that the sampled flag of client traceparents is honored only up to the rate limit."""
+    client = make_client(tmp_path, traceparent_sampled_per_second=1.0)
+    for _ in range(5):
+        client.get("/api/items/1", headers={"traceparent": TRACEPARENT})
+    assert len(read_lines(tmp_path)) == 1
+
+    make_client(tmp_path / "off", traceparent_sampled_per_second=0.0).get(
+        "/api/items/1", headers={"traceparent": TRACEPARENT}
+    )
+    assert read_lines(tmp_path / "off") == []
+
+
+def test_trace_file_is_rotated(tmp_path):
+    """Test that the file moves to <name>.1 once it reaches its size limit."""
+    path = tmp_path / "traces.jsonl"
+    for _ in range(3):
+        export(Trace(), path, max_bytes=1)
+
+    assert not path.exists()
+    assert len((tmp_path / "traces.jsonl.1").read_text().splitlines()) == 1
@@ -0,0 +1,135 @@
+"""Tests for bulk user provisioning."""
+
+import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from sqlalchemy import text
+
+from app.auth import verify_password
+from app.user_provisioning import MODE_RESET, UserRecord, apply_chunk, provision, read_users
+
+
+@pytest.fixture
+def emails(db_engine):
+    """Unique emails whose users are deleted after the test, since provision commits."""
+    prefix = uuid.uuid4().hex
+    yield [f"{prefix}-{i}@example.com" for i in range(3)]
+    with db_engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE email LIKE :pattern"), {"pattern": f"{prefix}-%"})
+
+
+def test_read_users_from_csv_and_ndjson(tmp_path):
+    """Test that both formats yield the same records with their line numbers."""
+    csv_path = tmp_path / "users.csv"
+    csv_path.write_text("email,password,is_active\n a@example.com ,secret,\nb@example.com,hunter2,false\n")
+    ndjson_path = tmp_path / "users.ndjson"
+    ndjson_path.write_text(
+        '{"email": " a@example.com ", "password": "secret"}\n\n'
+        '{"email": "b@example.com", "password": "hunter2", "is_active": false}\n'
+    )
+
+    assert list(read_users(csv_path)) == [
+        UserRecord(line=2, email="a@example.com", password="secret", is_active=None),
+        UserRecord(line=3, email="b@example.com", password="hunter2", is_active=False),
+    ]
+    assert [(r.line, r.email, r.is_active) for r in read_users(ndjson_path)] == [
+        (1, "a@example.com", None),
+        (3, "b@example.com", False),
+    ]
+
+
+def test_csv_without_email_column_is_rejected(tmp_path):
+    """Test that a CSV file without an email header fails before anything is written."""
+    path = tmp_path / "users.csv"
+    path.write_text("name,password\nada,secret\n")
+
+    with pytest.raises(ValueError):
+        list(read_users(path))
+
+
+def test_unreadable_records_are_reported_not_raised(tmp_path):
+    """Test that malformed lines and bad is_active values become errors and reading carries on."""
+    csv_path = tmp_path / "users.csv"
+    csv_path.write_text("email,password,is_active\na@example.com,secret,maybe\nb@example.com,hunter2,\n")
+    ndjson_path = tmp_path / "users.ndjson"
+    ndjson_path.write_text('{"email": "a@example.com", "password": \n[1]\n{"email": "b@example.com", "password": "x"}\n')
+
+    assert [(r.email, r.error) for r in read_users(csv_path)] == [
+        ("a@example.com", "line 2: is_active must be true or false, got 'maybe'"),
+        ("b@example.com", None),
+    ]
+    assert [(r.line, r.error) for r in read_users(ndjson_path)] == [
+        (1, "line 1: invalid JSON: Expecting value"),
+        (2, "line 2: expected an object"),
+        (3, None),
+    ]
+
+
+def test_apply_chunk_creates_and_updates(db_session, user):
+    """Test that an upsert creates new users and resets existing ones, last duplicate winning."""
+    new_email = f"{uuid.uuid4().hex}@example.com"
+    records = [
+        UserRecord(line=1, email=user.email, password="ignored", is_active=False),
+        UserRecord(line=2, email=new_email, password="new"),
+        UserRecord(line=3, email=user.email, password="changed"),
+    ]
+
+    result = apply_chunk(db_session.connection(), records, ["hash-1", "hash-2", "hash-3"])
+
+    assert (result.processed, result.created, result.updated) == (3, 1, 1)
+    rows = dict(db_session.execute(
+        text("SELECT email, hashed_password FROM users WHERE email IN (:a, :b)"),
+        {"a": user.email, "b": new_email},
+    ).all())
+    assert rows == {user.email: "hash-3", new_email: "hash-2"}
+    # The last record for the email had no is_active, so the user stays active
+    db_session.refresh(user)
+    assert user.is_active is True
+
+
+def test_reset_mode_reports_unknown_emails(db_session, user):
+    """Test that reset mode never creates users."""
+    missing = f"{uuid.uuid4().hex}@example.com"
+    records = [
+        UserRecord(line=1, email=user.email, password="changed", is_active=False),
+        UserRecord(line=2, email=missing, password="new"),
+    ]
+
+    result = apply_chunk(db_session.connection(), records, ["hash-1", "hash-2"], MODE_RESET)
+
+    assert (result.created, result.updated) == (0, 1)
+    assert result.errors == [f"line 2: no user with email {missing}"]
+    db_session.refresh(user)
+    assert (user.hashed_password, user.is_active) == ("hash-1", False)
+    assert db_session.execute(text("SELECT count(*) FROM users WHERE email = :e"), {"e": missing}).scalar() == 0
+
+
+def test_provision_resumes_from_checkpoint(db_engine, emails, tmp_path):
+    """Test that a run skips the chunks committed by an earlier run and hashes with the app's hasher."""
+    records = [UserRecord(line=i + 1, email=email, password=f"password-{i}") for i, email in enumerate(emails)]
+    records.append(UserRecord(line=4, email="", password="orphan"))
+    records.append(UserRecord(line=5, email="", password=None, error="line 5: invalid JSON: Expecting value"))
+    state_path = tmp_path / "users.progress"
+    state_path.write_text(json.dumps({"processed": 1}))
+    progress = []
+
+    with ProcessPoolExecutor(max_workers=1) as executor, db_engine.connect() as conn:
+        result = provision(
+            conn, records, executor, chunk_size=2, state_path=state_path,
+            on_progress=lambda total, elapsed: progress.append(total.processed),
+        )
+
+    assert progress == [3, 5]
+    assert (result.processed, result.created, result.updated) == (5, 2, 0)
+    assert result.errors == ["line 4: email and password are required", "line 5: invalid JSON: Expecting value"]
+    assert json.loads(state_path.read_text()) == {"processed": 5}
+
+    with db_engine.connect() as conn:
+        hashes = dict(conn.execute(
+            text("SELECT email, hashed_password FROM users WHERE email = ANY(:emails)"), {"emails": emails}
+        ).all())
+    assert emails[0] not in hashes
+    assert verify_password("password-1", hashes[emails[1]])
+    assert verify_password("password-2", hashes[emails[2]])